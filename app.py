@@ -1,15 +1,34 @@
-from code.diarization import DiarizationPipeline
+import os
+import time
+from code.buffer_store import buffer_store
+from code.devices import device_scheduler
 from code.gradio_utils import (
     add_prompt_to_text,
     cut_audio,
     extract_audio_from_video,
-    get_device,
-    get_device_name,
+    format_job_status,
+    format_partial_transcript,
+    format_speaker_transcript,
+    format_timings,
+    get_startup_status,
     list_prompts,
     read_prompt,
 )
-from code.output_utils import TranscriptSaver
-from code.transcribe import WhisperTranscriber
+from code.instrumentation import METRICS_PORT, JobMetrics, serve_metrics, stage_or_null
+from code.jobs import JobCancelled, job_manager
+from code.model_registry import get_diarizer, get_tiered_transcriber, get_transcriber
+from code.pipeline import PipelineRunner
+from code.recut import (
+    TranscriptCoverage,
+    shift_annotation,
+    shift_segments,
+    transcribe_interval,
+)
+from code.result_cache import result_cache
+from code.scratch import scratch_store
+from code.startup import prewarmer
+from code.transcript_model import Transcript
+from typing import Any, Dict, Iterable, Iterator
 
 import gradio as gr
 
@@ -19,11 +38,14 @@ LANGUAGES = [
 ]
 
 PROMPT_FILES = list_prompts()
+# Seconds an admitted job waits for a free device before it fails
+DEVICE_WAIT_SECONDS = float(os.environ.get("DEVICE_WAIT_SECONDS", "600"))
 
 
 def build_load_cut_tab():
     with gr.Tab("Load & Cut"):
-        device_info = gr.Markdown(f"**Device:** {get_device_name()}")
+        # Filled in by the startup timer while the device probe and model prewarm run in the background
+        device_info = gr.Markdown("**Device:** probing...")
         video_file = gr.File(label="Upload video file", type="filepath", elem_classes=["compact-upload"])
         extract_btn = gr.Button("Extract Audio", elem_classes=["compact-btn"])
         extract_status = gr.Markdown("")
@@ -32,7 +54,14 @@ def build_load_cut_tab():
             end_time = gr.Number(label="Cut End (s)", value=60, precision=2, scale=1)
         cut_btn = gr.Button("Cut Audio by Interval", elem_classes=["compact-btn"])
         cut_status = gr.Markdown("")
+        # Audio shown in the player (preview of the full audio or the current cut)
         audio_path_state = gr.State()
+        # Preview of the full audio, id of its decoded PCM in the buffer store, the current cut within it
+        # and the transcript already computed for it
+        preview_state = gr.State()
+        source_state = gr.State()
+        interval_state = gr.State()
+        coverage_state = gr.State()
         return dict(
             device_info=device_info,
             video_file=video_file,
@@ -43,6 +72,10 @@ def build_load_cut_tab():
             cut_btn=cut_btn,
             cut_status=cut_status,
             audio_path_state=audio_path_state,
+            preview_state=preview_state,
+            source_state=source_state,
+            interval_state=interval_state,
+            coverage_state=coverage_state,
         )
 
 
@@ -55,6 +88,12 @@ def build_extraction_settings_tab():
                 value="base",
                 scale=1,
             )
+            refine_model = gr.Dropdown(
+                ["None", "medium", "large-v3", "large-v3-turbo"],
+                label="Refine uncertain spans with",
+                value="None",
+                scale=1,
+            )
             language = gr.Dropdown(
                 choices=[(code, name) for code, name in LANGUAGES], value="ru", label="Language", scale=1
             )
@@ -63,7 +102,13 @@ def build_extraction_settings_tab():
             value="Text with speaker roles",
             label="Transcription mode",
         )
-        num_speakers = gr.Number(label="Speakers", value=2, precision=0, scale=1, visible=True)
+        with gr.Row():
+            num_speakers = gr.Number(label="Speakers (0 = estimate)", value=2, precision=0, scale=1, visible=True)
+            min_speakers = gr.Number(label="Min speakers", value=0, precision=0, scale=1, visible=True)
+            max_speakers = gr.Number(label="Max speakers", value=0, precision=0, scale=1, visible=True)
+        long_form = gr.Checkbox(
+            label="Long recording: transcribe in parallel and diarize in windows with bounded memory", value=False
+        )
         hf_token = gr.Textbox(
             label="HuggingFace token for Pyannote",
             type="password",
@@ -72,14 +117,20 @@ def build_extraction_settings_tab():
         )
         with gr.Row():
             transcribe_btn = gr.Button("Transcribe", elem_classes=["compact-btn"])
+            cancel_btn = gr.Button("Cancel", elem_classes=["compact-btn"])
         transcribe_status = gr.Markdown("")
         return dict(
             num_speakers=num_speakers,
+            min_speakers=min_speakers,
+            max_speakers=max_speakers,
             whisper_model=whisper_model,
+            refine_model=refine_model,
             language=language,
             transcribe_mode=transcribe_mode,
+            long_form=long_form,
             hf_token=hf_token,
             transcribe_btn=transcribe_btn,
+            cancel_btn=cancel_btn,
             transcribe_status=transcribe_status,
         )
 
@@ -111,7 +162,6 @@ def build_output_column():
 # --- Gradio UI Construction ---
 with gr.Blocks(title="Interview Parser") as demo:
     gr.Markdown("# Interview Parser")
-    device_status = gr.State(get_device_name())
     with gr.Row():
         with gr.Column(scale=1):
             # Interface section
@@ -120,84 +170,274 @@ with gr.Blocks(title="Interview Parser") as demo:
             add_prompts = build_add_prompts_tab()
         output = build_output_column()
 
-    def on_extract(video: str) -> tuple:
-        # Extract audio from video and return audio path and status
-        audio_path, status = extract_audio_from_video(video)
-        return audio_path, audio_path, status
+    startup_timer = gr.Timer(1.0)
+
+    def on_startup_tick() -> tuple:
+        # Show device/model readiness, then keep refreshing device utilization at a slower rate
+        return get_startup_status(), gr.Timer(1.0 if not prewarmer.is_ready() else 5.0)
+
+    demo.load(on_startup_tick, outputs=[load_cut["device_info"], startup_timer])
+    startup_timer.tick(on_startup_tick, outputs=[load_cut["device_info"], startup_timer])
+
+    def on_extract(video: str, old_audio: str, old_preview: str, old_source: str, request: gr.Request) -> tuple:
+        # Decode the audio once into memory and a browser preview; return preview path, buffer id and status
+        preview_path, source, status = extract_audio_from_video(video, owner=request.session_hash)
+        # Keep the shown audio and the full preview pinned in the scratch store
+        scratch_store.swap(old_audio, preview_path)
+        scratch_store.swap(old_preview, preview_path)
+        buffer_store.discard(old_source)
+        return preview_path, preview_path, status, preview_path, source, None, None
 
     load_cut["extract_btn"].click(
         on_extract,
-        inputs=[load_cut["video_file"]],
-        outputs=[load_cut["audio_path_state"], output["audio_player"], load_cut["extract_status"]],
+        inputs=[
+            load_cut["video_file"],
+            load_cut["audio_path_state"],
+            load_cut["preview_state"],
+            load_cut["source_state"],
+        ],
+        outputs=[
+            load_cut["audio_path_state"],
+            output["audio_player"],
+            load_cut["extract_status"],
+            load_cut["preview_state"],
+            load_cut["source_state"],
+            load_cut["interval_state"],
+            load_cut["coverage_state"],
+        ],
     )
 
-    def on_cut(audio_path: str, start: float, end: float) -> tuple:
-        # Cut audio by interval and return cut audio path and status
-        cut_path, status = cut_audio(audio_path, start, end)
-        return cut_path, cut_path, status
+    def on_cut(source: str, preview: str, start: float, end: float, old_audio: str, request: gr.Request) -> tuple:
+        # Cut the extracted audio by interval and return cut audio path, status and the interval
+        cut_path, status = cut_audio(source, start, end, owner=request.session_hash)
+        interval = (float(start), float(end)) if cut_path else None
+        # Without a cut the full audio is shown and transcribed
+        shown = cut_path or preview
+        scratch_store.swap(old_audio, shown)
+        return shown, shown, status, interval
 
     load_cut["cut_btn"].click(
         on_cut,
-        inputs=[load_cut["audio_path_state"], load_cut["start_time"], load_cut["end_time"]],
-        outputs=[load_cut["audio_path_state"], output["audio_player"], load_cut["cut_status"]],
+        inputs=[
+            load_cut["source_state"],
+            load_cut["preview_state"],
+            load_cut["start_time"],
+            load_cut["end_time"],
+            load_cut["audio_path_state"],
+        ],
+        outputs=[
+            load_cut["audio_path_state"],
+            output["audio_player"],
+            load_cut["cut_status"],
+            load_cut["interval_state"],
+        ],
     )
 
+    def on_unload(request: gr.Request) -> None:
+        # The session is gone: stop its jobs and delete its decoded audio, preview and cuts
+        job_manager.cancel_owner(request.session_hash)
+        scratch_store.release_owner(request.session_hash)
+        buffer_store.release_owner(request.session_hash)
+
+    demo.unload(on_unload)
+
     def on_mode_change(mode: str) -> tuple:
-        # Show or hide HuggingFace token and Speakers field depending on transcription mode
+        # Show or hide HuggingFace token and Speakers fields depending on transcription mode
         visible = mode == "Text with speaker roles"
-        return gr.update(visible=visible), gr.update(visible=visible)
+        return tuple(gr.update(visible=visible) for _ in range(4))
 
     extraction["transcribe_mode"].change(
         on_mode_change,
         inputs=[extraction["transcribe_mode"]],
-        outputs=[extraction["hf_token"], extraction["num_speakers"]],
+        outputs=[
+            extraction["hf_token"],
+            extraction["num_speakers"],
+            extraction["min_speakers"],
+            extraction["max_speakers"],
+        ],
     )
 
     def on_transcribe(
-        audio_path: str,
         speakers: int,
+        min_speakers: int,
+        max_speakers: int,
         model: str,
+        refine: str,
         lang: str,
         mode: str,
         token: str,
-    ) -> tuple:
-        # Transcribe audio and (optionally) diarize speakers, yielding progress/status
+        long_form: bool,
+        source: str,
+        interval: tuple,
+        coverage: TranscriptCoverage,
+        request: gr.Request,
+    ) -> Iterator[tuple]:
+        # Transcribe audio and (optionally) diarize speakers, yielding progress/status and the coverage
+        lease = None
+        job = None
+        state = "failed"
+        transcript_text = ""
         try:
-            if not audio_path:
-                yield "No audio file for transcription.", ""
+            source_audio = buffer_store.get(source)
+            if source_audio is None:
+                yield "No audio for transcription, extract the audio first.", "", coverage
                 return
-            yield "Loading model...", ""
-            device = get_device()
-            transcriber = WhisperTranscriber(model_name=model, device=device)
-            yield "Transcribing audio...", ""
-            result = transcriber.transcribe(audio_path, language=lang)
-            if mode == "Text only":
-                yield result["text"], ""
+            span = interval or (0.0, source_audio.duration)
+            diarize = mode != "Text only"
+            # Tiered mode: the draft model decodes everything, the refine model only low-confidence spans
+            refine_model = None if refine == "None" else refine
+            models = f"{model}+{refine_model}" if refine_model else model
+            # Wait for a slot of the model; the job (and its devices) end with the generator, which is
+            # closed when the client goes away, and the session's jobs are cancelled on unload
+            job = job_manager.submit(models, span[1] - span[0], owner=request.session_hash)
+            while not job_manager.wait(job, timeout=1.0):
+                yield "", format_job_status(job), coverage
+            # Wait for devices in short steps to notice cancellation and give up after DEVICE_WAIT_SECONDS
+            lease = device_scheduler.try_acquire(models, diarize=diarize)
+            wait_start = time.perf_counter()
+            while lease is None:
+                job.check()
+                waited = time.perf_counter() - wait_start
+                if waited >= DEVICE_WAIT_SECONDS:
+                    raise TimeoutError(f"no free device after {waited:.0f}s, try again later")
+                yield "", f"⏳ Queued: waiting for a free device ({waited:.0f}s)", coverage
+                lease = device_scheduler.try_acquire(models, diarize=diarize, timeout=1.0)
+            yield "Loading model...", "", coverage
+            metrics = JobMetrics()
+            if refine_model:
+                transcriber = get_tiered_transcriber(model, refine_model, device=lease.whisper_device)
+            else:
+                transcriber = get_transcriber(model_name=model, device=lease.whisper_device)
+            diarizer = get_diarizer(token, device=lease.pyannote_device) if diarize else None
+            # Speaker count 0 means estimate it within the min/max bounds (0 = unbounded)
+            bounds = {
+                "num_speakers": int(speakers),
+                "min_speakers": int(min_speakers),
+                "max_speakers": int(max_speakers),
+            }
+            params = {
+                "model": models,
+                "language": lang,
+                "speakers": bounds,
+                "diarize": diarizer is not None,
+                "long_form": long_form,
+            }
+            if coverage is not None and coverage.matches(source, params) and coverage.edges(*span) is not None:
+                # Re-cut of audio transcribed before: slice it and run the models only on new edges
+                yield "Reusing the previous transcript...", "", coverage
+                metrics.audio_seconds = span[1] - span[0]
+                with metrics.stage("recut"):
+                    result = transcribe_interval(
+                        coverage,
+                        span[0],
+                        span[1],
+                        transcriber,
+                        diarizer,
+                        language=lang,
+                        source_audio=source_audio,
+                        cancel=job.cancel_event,
+                        long_form=long_form,
+                        **bounds,
+                    )
+                metrics.finish()
+                segments = result["transcription"]["segments"]
+                if result["diarization"] is not None:
+                    transcript_text = format_speaker_transcript(
+                        Transcript.from_segments(segments).with_speakers(result["diarization"]).iter_merged()
+                    )
+                else:
+                    transcript_text = result["transcription"]["text"]
+                found = len(result["diarization"].labels()) if result["diarization"] is not None else None
+                state = "done"
+                yield transcript_text, format_timings(result["timings"], span[1] - span[0], found), coverage
                 return
-            yield "Diarizing speakers...", ""
-            diarizer = DiarizationPipeline(token, device=device)
-            diarized = diarizer.diarize(audio_path, int(speakers))
-            saver = TranscriptSaver("out")
-            merged = saver.merge_segments(diarized, result["segments"])
-            transcript_text = "\n".join([f"Speaker {seg['speaker']}: {seg['text']}" for seg in merged])
-            yield transcript_text, ""
+            # Decoded at extraction; a cut is a view into the same samples
+            audio = source_audio.slice(*span)
+            metrics.audio_seconds = audio.duration
+            runner = PipelineRunner(
+                transcriber, diarizer, long_form=long_form, cache=result_cache, metrics=metrics, cancel=job.cancel_event
+            )
+            if long_form:
+                yield "", format_job_status(job, "Transcribing audio..."), coverage
+                result = runner.run(audio, language=lang, **bounds)
+                updates: Iterable[Dict[str, Any]] = [
+                    dict(result, segments=result["transcription"]["segments"], done=True)
+                ]
+            else:
+                # Segments are shown as soon as each chunk is decoded; speakers appear once diarization is done
+                updates = runner.stream(audio, language=lang, **bounds)
+            for update in updates:
+                if update["diarization"] is not None:
+                    # Only the final merge is recorded; intermediate ones are previews
+                    with stage_or_null(metrics if update["done"] else None, "merge"):
+                        transcript = Transcript.from_segments(update["segments"])
+                        transcript_text = format_speaker_transcript(
+                            transcript.with_speakers(update["diarization"]).iter_merged()
+                        )
+                elif update["done"] and diarizer is None:
+                    transcript_text = update["transcription"]["text"]
+                else:
+                    transcript_text = format_partial_transcript(update["segments"])
+                if update["done"]:
+                    metrics.finish()
+                    diarization = update["diarization"]
+                    coverage = TranscriptCoverage(
+                        source,
+                        span[0],
+                        span[1],
+                        params,
+                        shift_segments(update["segments"], span[0]),
+                        shift_annotation(diarization, span[0]) if diarization is not None else None,
+                    )
+                    found = len(diarization.labels()) if diarization is not None else None
+                    state = "done"
+                    yield transcript_text, format_timings(update["timings"], audio.duration, found), coverage
+                elif diarizer is not None and update["diarization"] is None:
+                    message = "Transcribing audio... (diarizing speakers in background)"
+                    yield transcript_text, format_job_status(job, message), coverage
+                else:
+                    yield transcript_text, format_job_status(job, "Transcribing audio..."), coverage
+        except JobCancelled:
+            state = "cancelled"
+            yield transcript_text, "⏹ Cancelled", coverage
         except Exception as e:
-            yield "", f"❌ Error: {e}"
+            yield "", f"❌ Error: {e}", coverage
+        finally:
+            if job is not None:
+                # Stops the background diarization too when the generator is closed mid-run
+                job.cancel()
+                job_manager.finish(job, state)
+            if lease is not None:
+                lease.release()
 
     extraction["transcribe_btn"].click(
         on_transcribe,
         inputs=[
-            load_cut["audio_path_state"],
             extraction["num_speakers"],
+            extraction["min_speakers"],
+            extraction["max_speakers"],
             extraction["whisper_model"],
+            extraction["refine_model"],
             extraction["language"],
             extraction["transcribe_mode"],
             extraction["hf_token"],
+            extraction["long_form"],
+            load_cut["source_state"],
+            load_cut["interval_state"],
+            load_cut["coverage_state"],
         ],
-        outputs=[output["transcribe_output"], extraction["transcribe_status"]],
+        outputs=[output["transcribe_output"], extraction["transcribe_status"], load_cut["coverage_state"]],
         queue=True,
+        # Admission is up to the job manager (per-model limits); Gradio would run one job at a time
+        concurrency_limit=None,
     )
 
+    def on_cancel(request: gr.Request) -> str:
+        # Cancel the session's jobs; a running job stops at its next chunk or inference batch
+        return "Cancelling..." if job_manager.cancel_owner(request.session_hash) else ""
+
+    extraction["cancel_btn"].click(on_cancel, outputs=[extraction["transcribe_status"]], queue=False)
+
     def on_add_prompt(prompt_file: str, transcript: str) -> tuple:
         # Add selected prompt to the beginning of the transcript
         if not prompt_file:
@@ -231,4 +471,10 @@ with gr.Blocks(title="Interview Parser") as demo:
     )
 
 if __name__ == "__main__":
-    demo.launch()
+    # Removes scratch files left by earlier runs of the app
+    scratch_store.prepare()
+    prewarmer.start()
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+    # Small cuts live under /dev/shm, outside the directories Gradio serves by default
+    demo.launch(allowed_paths=scratch_store.roots)
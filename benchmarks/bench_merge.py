@@ -0,0 +1,121 @@
+"""
+Benchmark of TranscriptSaver.merge_segments and merge_words on synthetic diarization annotations.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_merge --sizes 1000 10000 100000 300000
+
+The "monologue" scenario is the worst case for overlap lookups: one turn spans the whole recording
+and every segment also overlaps short backchannel turns of the other speakers.
+"""
+
+import random
+import time
+from code.output_utils import TranscriptSaver
+from typing import Any, Callable, Dict, List, Tuple
+
+import click
+from pyannote.core import Annotation, Segment
+
+
+def make_synthetic(num_segments: int, num_speakers: int = 4, seed: int = 0) -> Tuple[Annotation, List[Dict[str, Any]]]:
+    """
+    Build a synthetic diarization with short alternating turns (with some overlapped speech)
+    and Whisper-like segments that often span turn boundaries.
+    Args:
+        num_segments (int): Number of transcription segments.
+        num_speakers (int): Number of speakers.
+        seed (int): Random seed.
+    Returns:
+        Tuple[Annotation, List[Dict[str, Any]]]: Annotation and transcription segments.
+    """
+    rng = random.Random(seed)
+    annotation = Annotation()
+    t = 0.0
+    # About one speaker turn per two segments
+    for _ in range(num_segments // 2 + 1):
+        duration = rng.uniform(1.0, 12.0)
+        speaker = f"SPEAKER_{rng.randrange(num_speakers):02d}"
+        # Slight overlap with the previous turn, like crosstalk in a real interview
+        annotation[Segment(max(0.0, t - rng.uniform(0.0, 0.5)), t + duration)] = speaker
+        t += duration + rng.uniform(0.0, 1.0)
+    segments = []
+    step = t / num_segments
+    for i in range(num_segments):
+        start = i * step
+        end = start + step * rng.uniform(0.6, 1.0)
+        # Three words per segment, evenly spread
+        bounds = [start + (end - start) * k / 3 for k in range(4)]
+        words: List[Dict[str, Any]] = [
+            {"word": f" w{i}_{k}", "start": bounds[k], "end": bounds[k + 1]} for k in range(3)
+        ]
+        segments.append({"start": start, "end": end, "text": "".join(w["word"] for w in words), "words": words})
+    return annotation, segments
+
+
+def make_monologue(num_segments: int, num_speakers: int = 4, seed: int = 0) -> Tuple[Annotation, List[Dict[str, Any]]]:
+    """
+    Build a synthetic diarization with one speaker's turn spanning the whole recording and short
+    backchannels of the other speakers overlapping it, with the segments of make_synthetic.
+    Args:
+        num_segments (int): Number of transcription segments.
+        num_speakers (int): Number of speakers.
+        seed (int): Random seed.
+    Returns:
+        Tuple[Annotation, List[Dict[str, Any]]]: Annotation and transcription segments.
+    """
+    rng = random.Random(seed)
+    _, segments = make_synthetic(num_segments, num_speakers, seed)
+    total = segments[-1]["end"]
+    annotation = Annotation()
+    annotation[Segment(0.0, total)] = "SPEAKER_00"
+    # About one backchannel ("yes", "mhm") per segment
+    for i in range(num_segments):
+        start = rng.uniform(0.0, total)
+        speaker = f"SPEAKER_{rng.randrange(1, num_speakers):02d}"
+        annotation[Segment(start, start + rng.uniform(0.2, 1.0)), i] = speaker
+    return annotation, segments
+
+
+SCENARIOS = {"interview": make_synthetic, "monologue": make_monologue}
+
+
+@click.command()
+@click.option("--sizes", multiple=True, type=int, default=[1000, 10000, 100000, 300000], help="Segment counts")
+@click.option("--repeat", type=int, default=3, help="Runs per size (best time is reported)")
+@click.option(
+    "--scenarios",
+    multiple=True,
+    type=click.Choice(list(SCENARIOS)),
+    default=list(SCENARIOS),
+    show_default=True,
+    help="Synthetic diarizations to merge",
+)
+def main(sizes: List[int], repeat: int, scenarios: List[str]) -> None:
+    """Time merge_segments and merge_words for growing numbers of segments and speaker turns."""
+    saver = TranscriptSaver("out")
+    click.echo(
+        f"{'scenario':>10} {'segments':>10} {'turns':>10} {'segments, s':>12} {'us/segment':>12} "
+        f"{'words, s':>10} {'us/word':>9}"
+    )
+    for scenario in scenarios:
+        for size in sizes:
+            annotation, segments = SCENARIOS[scenario](size)
+            by_segment = _best_time(saver.merge_segments, annotation, segments, repeat)
+            by_word = _best_time(saver.merge_words, annotation, segments, repeat)
+            click.echo(
+                f"{scenario:>10} {size:>10} {len(annotation):>10} {by_segment:>12.3f} {by_segment / size * 1e6:>12.2f} "
+                f"{by_word:>10.3f} {by_word / (size * 3) * 1e6:>9.2f}"
+            )
+
+
+def _best_time(merge: Callable[..., Any], annotation: Annotation, segments: List[Dict[str, Any]], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        merge(annotation, segments)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Benchmark suite for the parser pipeline on synthetic multi-speaker recordings.
+
+Runs offline: the recording is rendered by ffmpeg and, unless --whisper-model is given, transcription and
+diarization are replaced by stub engines, so the suite measures the pipeline itself (decoding, VAD, caching,
+threading, merging) rather than model inference. Stages:
+    audio  - AudioProcessor.get_audio (full file and an interval), get_buffer and the fused ingest
+    merge  - TranscriptSaver.merge_segments / merge_words with many segments
+    e2e    - decode + PipelineRunner.run + merge + save
+
+Every stage reports latency percentiles, the real-time factor (audio seconds per processing second) and
+peak RSS. Results are compared with a baseline JSON when one exists; a stage whose median latency grew by
+more than --tolerance fails the run with exit code 1. Usage (from the repository root):
+    python -m benchmarks.bench_pipeline --duration 600 --repeat 5
+    python -m benchmarks.bench_pipeline --update-baseline
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from code.audio_export import AudioBuffer, AudioProcessor
+from code.instrumentation import JobMetrics
+from code.output_utils import TranscriptSaver
+from code.pipeline import PipelineRunner
+from code.scratch import scratch_store
+from code.vad import speech_regions
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import click
+import numpy as np
+
+from benchmarks.bench_merge import make_synthetic
+from benchmarks.synthetic import speaker_turns, synthesize, turns_annotation
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class StubTranscriber:
+    """Stand-in for WhisperTranscriber: one segment per detected speech region, a word every 0.4 s."""
+
+    model_name = "stub"
+    device = "cpu"
+    compute_type = "float32"
+
+    def transcribe(self, audio: AudioBuffer, language: str = "ru", **kwargs: Any) -> Dict[str, Any]:
+        segments = list(self.stream(audio, language))
+        return {"text": "".join(seg["text"] for seg in segments), "segments": segments}
+
+    def transcribe_long(self, audio: AudioBuffer, language: str = "ru", **kwargs: Any) -> Dict[str, Any]:
+        return self.transcribe(audio, language)
+
+    def stream(self, audio: AudioBuffer, language: str = "ru", **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        for i, (start, end) in enumerate(speech_regions(audio.samples, audio.sample_rate)):
+            bounds = np.append(np.arange(start, end, 0.4), end)
+            words: List[Dict[str, Any]] = [
+                {"word": f" w{i}_{k}", "start": float(bounds[k]), "end": float(bounds[k + 1])}
+                for k in range(len(bounds) - 1)
+            ]
+            yield {"id": i, "start": start, "end": end, "text": "".join(w["word"] for w in words), "words": words}
+
+
+class StubDiarizer:
+    """Stand-in for DiarizationPipeline returning the ground-truth turns of the synthetic recording."""
+
+    model_name = "stub"
+    device = "cpu"
+
+    def __init__(self, turns: List[Tuple[float, float, str]]) -> None:
+        self.turns = turns
+
+    def diarize(self, audio: AudioBuffer, num_speakers: Optional[int] = None, **kwargs: Any) -> Any:
+        return turns_annotation([turn for turn in self.turns if turn[0] < audio.duration])
+
+
+def measure(fn: Callable[[], Any], repeat: int, audio_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run a function several times after one warm-up run.
+    Args:
+        fn (Callable[[], Any]): Function to time.
+        repeat (int): Timed runs.
+        audio_seconds (Optional[float]): Audio duration handled per run (for the real-time factor).
+    Returns:
+        Dict[str, Any]: Latency percentiles and mean in seconds, real-time factor and peak RSS.
+    """
+    fn()
+    metrics = JobMetrics(audio_seconds=audio_seconds, profile=None)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with metrics.stage("run"):
+            fn()
+        times.append(time.perf_counter() - start)
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    result = {
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "mean": float(np.mean(times)),
+        "peak_rss_mb": max(stage["peak_rss_bytes"] for stage in metrics.stages) / 2**20,
+    }
+    if audio_seconds:
+        result["rtf"] = audio_seconds / float(p50)
+    return result
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float, min_delta: float
+) -> List[str]:
+    """
+    Find benchmarks whose median latency regressed against the baseline.
+    Args:
+        results (Dict[str, Dict[str, Any]]): Current results by benchmark name.
+        baseline (Dict[str, Dict[str, Any]]): Baseline results by benchmark name.
+        tolerance (float): Allowed relative slowdown (0.25 means 25%).
+        min_delta (float): Slowdowns below this many seconds are treated as noise.
+    Returns:
+        List[str]: Descriptions of the regressions.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p50"], result["p50"]
+        if after > before * (1 + tolerance) and after - before > min_delta:
+            regressions.append(f"{name}: p50 {before:.4f}s -> {after:.4f}s (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _remove(path: Optional[str]) -> None:
+    if path:
+        scratch_store.discard(path)
+
+
+def bench_audio(video: str, duration: float, repeat: int) -> Dict[str, Dict[str, Any]]:
+    interval = (duration / 3, duration / 3 + min(60.0, duration / 3))
+    results = {
+        "get_audio[full]": measure(lambda: _remove(AudioProcessor(video).get_audio()), repeat, duration),
+        "get_audio[interval]": measure(
+            lambda: _remove(AudioProcessor(video).get_audio(interval)), repeat, interval[1] - interval[0]
+        ),
+        "get_buffer[full]": measure(lambda: AudioProcessor(video).get_buffer(), repeat, duration),
+        "ingest[full]": measure(lambda: _remove(AudioProcessor(video).ingest()[1]), repeat, duration),
+    }
+    return results
+
+
+def bench_merge(sizes: List[int], repeat: int) -> Dict[str, Dict[str, Any]]:
+    saver = TranscriptSaver("out")
+    results = {}
+    for size in sizes:
+        annotation, segments = make_synthetic(size)
+        results[f"merge_segments[{size}]"] = measure(lambda: saver.merge_segments(annotation, segments), repeat)
+        results[f"merge_words[{size}]"] = measure(lambda: saver.merge_words(annotation, segments), repeat)
+    return results
+
+
+def bench_e2e(
+    video: str, duration: float, turns: List[Tuple[float, float, str]], repeat: int, whisper_model: Optional[str]
+) -> Dict[str, Dict[str, Any]]:
+    if whisper_model:
+        from code.model_registry import get_transcriber
+
+        transcriber: Any = get_transcriber(whisper_model)
+    else:
+        transcriber = StubTranscriber()
+    out_dir = tempfile.mkdtemp(prefix="bench_")
+
+    def run() -> None:
+        audio = AudioProcessor(video).get_buffer()
+        runner = PipelineRunner(transcriber, StubDiarizer(turns))
+        result = runner.run(audio, num_speakers=len({speaker for _, _, speaker in turns}))
+        TranscriptSaver(out_dir).save_transcript(result["diarization"], result["transcription"]["segments"])
+
+    try:
+        return {f"e2e[{transcriber.model_name}]": measure(run, repeat, duration)}
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+@click.command()
+@click.option("--duration", default=300.0, show_default=True, help="Length of the synthetic recording in seconds")
+@click.option("--speakers", default=3, show_default=True, help="Speakers in the synthetic recording")
+@click.option("--repeat", default=5, show_default=True, help="Timed runs per benchmark")
+@click.option(
+    "--stages",
+    multiple=True,
+    type=click.Choice(["audio", "merge", "e2e"]),
+    default=["audio", "merge", "e2e"],
+    show_default=True,
+    help="Benchmarks to run",
+)
+@click.option("--merge-sizes", multiple=True, type=int, default=[10000, 100000], show_default=True)
+@click.option("--whisper-model", help="Use a real (already downloaded) Whisper model end-to-end instead of the stub")
+@click.option("--work-dir", default=os.path.join("out", "bench"), show_default=True, help="Synthetic media directory")
+@click.option("--baseline", default=BASELINE_PATH, show_default=True, help="Baseline JSON to compare against")
+@click.option("--update-baseline", is_flag=True, help="Write the results as the new baseline")
+@click.option("--tolerance", default=0.25, show_default=True, help="Allowed relative slowdown of the median")
+@click.option("--min-delta", default=0.005, show_default=True, help="Ignore slowdowns below this many seconds")
+@click.option("--output", help="Also write the results to this JSON file")
+def main(
+    duration: float,
+    speakers: int,
+    repeat: int,
+    stages: List[str],
+    merge_sizes: List[int],
+    whisper_model: Optional[str],
+    work_dir: str,
+    baseline: str,
+    update_baseline: bool,
+    tolerance: float,
+    min_delta: float,
+    output: Optional[str],
+) -> None:
+    """Run the benchmarks, print a report and fail on regressions against the baseline."""
+    turns = speaker_turns(duration, speakers)
+    video = ""  # synthesized only for the stages that decode media
+    if "audio" in stages or "e2e" in stages:
+        if shutil.which("ffmpeg") is None:
+            raise click.ClickException("ffmpeg is required for the audio and e2e benchmarks (or use --stages merge)")
+        video = synthesize(os.path.join(work_dir, f"interview_{speakers}spk_{duration:g}s.mp4"), duration, speakers)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    if "audio" in stages:
+        results.update(bench_audio(video, duration, repeat))
+    if "merge" in stages:
+        results.update(bench_merge(list(merge_sizes), repeat))
+    if "e2e" in stages:
+        results.update(bench_e2e(video, duration, turns, repeat, whisper_model))
+
+    click.echo(f"{'benchmark':<28} {'p50, s':>9} {'p90, s':>9} {'p99, s':>9} {'x real time':>12} {'peak RSS, MB':>13}")
+    for name, result in results.items():
+        rtf = f"{result['rtf']:.1f}" if "rtf" in result else "-"
+        click.echo(
+            f"{name:<28} {result['p50']:>9.4f} {result['p90']:>9.4f} {result['p99']:>9.4f} {rtf:>12} "
+            f"{result['peak_rss_mb']:>13.0f}"
+        )
+    report = {"duration": duration, "speakers": speakers, "repeat": repeat, "results": results}
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if update_baseline:
+        with open(baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        click.echo(f"Baseline written to {baseline}")
+        return
+    if not os.path.exists(baseline):
+        click.echo(f"No baseline at {baseline}; run with --update-baseline to record one")
+        return
+    with open(baseline, "r", encoding="utf-8") as f:
+        stored = json.load(f)
+    if (stored["duration"], stored["speakers"]) != (duration, speakers):
+        click.echo("Baseline was recorded with a different --duration/--speakers; comparison skipped")
+        return
+    regressions = compare(results, stored["results"], tolerance, min_delta)
+    if regressions:
+        click.echo("REGRESSIONS against the baseline:", err=True)
+        for line in regressions:
+            click.echo(f"  {line}", err=True)
+        sys.exit(1)
+    click.echo(f"No regressions against the baseline (tolerance {tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
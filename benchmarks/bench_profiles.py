@@ -0,0 +1,147 @@
+"""
+Accuracy vs speed of the CPU inference profiles (code.inference_profiles.PROFILES).
+
+Every profile transcribes the same audio on CPU; the report shows the real-time factor, peak RSS, load time
+and the word error rate against the transcript of the reference profile (fp32 eager by default), so the
+speed gained by quantization or compilation can be weighed against the accuracy lost. With a HuggingFace
+token the diarization pipeline is timed as well. Synthetic tones contain no words, so pass a real speech
+recording with --audio for meaningful WER. Usage (from the repository root):
+    python -m benchmarks.bench_profiles --model small --audio interview.wav
+"""
+
+import os
+import re
+import time
+from code.audio_export import AudioBuffer, AudioProcessor
+from code.inference_profiles import PROFILES, configure_threads
+from code.instrumentation import JobMetrics
+from typing import Any, Dict, List, Optional
+
+import click
+import numpy as np
+
+from benchmarks.synthetic import synthesize
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """
+    Word error rate (substitutions + deletions + insertions over reference words), ignoring case and punctuation.
+    Args:
+        reference (str): Reference transcript.
+        hypothesis (str): Transcript to score.
+    Returns:
+        float: Word error rate.
+    """
+    ref, hyp = _words(reference), _words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    distance = np.arange(len(hyp) + 1)
+    for i, word in enumerate(ref, start=1):
+        previous, distance = distance, np.empty_like(distance)
+        distance[0] = i
+        for j, other in enumerate(hyp, start=1):
+            distance[j] = min(previous[j] + 1, distance[j - 1] + 1, previous[j - 1] + (word != other))
+    return float(distance[-1]) / len(ref)
+
+
+def _words(text: str) -> List[str]:
+    return re.sub(r"[^\w\s]", " ", text.lower()).split()
+
+
+def run_profile(
+    name: str, model: str, audio: AudioBuffer, language: str, repeat: int, token: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Load the models of one profile and time them on the audio.
+    Args:
+        name (str): Profile name.
+        model (str): Whisper model name.
+        audio (AudioBuffer): Benchmark audio.
+        language (str): Audio language.
+        repeat (int): Timed runs (median is reported).
+        token (Optional[str]): HuggingFace token (diarization is skipped without it).
+    Returns:
+        Dict[str, Any]: Transcript, load time, median seconds, real-time factor and peak RSS per engine.
+    """
+    from code.transcribe import WhisperTranscriber
+
+    settings = PROFILES[name]
+    compute_type = settings["compute_type"] or "float32"
+    start = time.perf_counter()
+    transcriber = WhisperTranscriber(model, device="cpu", compute_type=compute_type, compile=settings["compile"])
+    result: Dict[str, Any] = {"load_seconds": time.perf_counter() - start}
+    # The first call includes compilation for compiled profiles
+    text = transcriber.transcribe(audio, language)["text"]
+    metrics = JobMetrics(audio_seconds=audio.duration, profile=None)
+    for _ in range(repeat):
+        with metrics.stage("transcribe"):
+            text = transcriber.transcribe(audio, language)["text"]
+    if token:
+        from code.diarization import DiarizationPipeline
+
+        diarizer = DiarizationPipeline(token, compile=settings["compile"])
+        diarizer.diarize(audio, 2)
+        for _ in range(repeat):
+            with metrics.stage("diarize"):
+                diarizer.diarize(audio, 2)
+    for stage in ("transcribe", "diarize"):
+        records = [record for record in metrics.stages if record["stage"] == stage]
+        if records:
+            seconds = float(np.median([record["wall_seconds"] for record in records]))
+            result[stage] = {
+                "seconds": seconds,
+                "rtf": audio.duration / seconds,
+                "peak_rss_mb": max(record["peak_rss_bytes"] for record in records) / 2**20,
+            }
+    result["text"] = text
+    return result
+
+
+@click.command()
+@click.option("--model", default="base", show_default=True, help="Whisper model name")
+@click.option("--audio", "audio_path", help="Speech recording (default: synthetic audio, WER is then meaningless)")
+@click.option("--duration", default=60.0, show_default=True, help="Seconds of audio to use")
+@click.option("--language", default="ru", show_default=True, help="Audio language")
+@click.option("--profiles", multiple=True, type=click.Choice(list(PROFILES)), default=list(PROFILES), show_default=True)
+@click.option("--reference", type=click.Choice(list(PROFILES)), default="default", show_default=True)
+@click.option("--repeat", default=3, show_default=True, help="Timed runs per profile")
+@click.option("--jobs", default=1, show_default=True, help="Concurrent jobs the threads are sized for")
+@click.option("--work-dir", default=os.path.join("out", "bench"), show_default=True, help="Synthetic media directory")
+def main(
+    model: str,
+    audio_path: Optional[str],
+    duration: float,
+    language: str,
+    profiles: List[str],
+    reference: str,
+    repeat: int,
+    jobs: int,
+    work_dir: str,
+) -> None:
+    """Compare speed and accuracy of the inference profiles on CPU."""
+    configure_threads(jobs=jobs)
+    if not audio_path:
+        audio_path = synthesize(os.path.join(work_dir, f"speech_{duration:g}s.wav"), duration, video=False)
+    audio = AudioProcessor(audio_path).get_buffer((0.0, duration))
+    token = os.environ.get("HUGGINGFACE_TOKEN")
+
+    names = [reference] + [name for name in profiles if name != reference]
+    results = {name: run_profile(name, model, audio, language, repeat, token) for name in names}
+    click.echo(f"Whisper '{model}' on {audio.duration:.0f}s of audio, reference profile '{reference}'")
+    click.echo(
+        f"{'profile':<20} {'load, s':>8} {'transcribe, s':>14} {'x real time':>12} {'RSS, MB':>8} {'WER':>7}"
+        + (f" {'diarize, s':>11}" if token else "")
+    )
+    for name, result in results.items():
+        wer = word_error_rate(results[reference]["text"], result["text"])
+        line = (
+            f"{name:<20} {result['load_seconds']:>8.1f} {result['transcribe']['seconds']:>14.2f} "
+            f"{result['transcribe']['rtf']:>12.1f} {result['transcribe']['peak_rss_mb']:>8.0f} {wer:>7.1%}"
+        )
+        if "diarize" in result:
+            line += f" {result['diarize']['seconds']:>11.2f}"
+        click.echo(line)
+
+
+if __name__ == "__main__":
+    main()
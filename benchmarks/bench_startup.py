@@ -0,0 +1,67 @@
+"""
+Startup benchmark: import time of the app and of the heavy packages it may pull in.
+
+Runs the import in a fresh interpreter with `python -X importtime` and reports cumulative import time
+per module. Usage (from the repository root):
+    python -m benchmarks.bench_startup --repeat 5
+"""
+
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import click
+
+# Modules whose import cost is tracked separately
+TRACKED = ["app", "gradio", "torch", "whisper", "pyannote.audio", "numpy", "ffmpeg"]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(module: str) -> Dict[str, float]:
+    """
+    Import a module in a fresh interpreter and collect cumulative import times.
+    Args:
+        module (str): Module to import.
+    Returns:
+        Dict[str, float]: Cumulative seconds per imported module, plus "<wall>" for the whole process.
+    """
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+    times: Dict[str, float] = {"<wall>": time.perf_counter() - start}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2)) / 1e6
+    return times
+
+
+@click.command()
+@click.option("--module", default="app", show_default=True, help="Module to import")
+@click.option("--repeat", default=3, type=int, show_default=True, help="Fresh interpreter runs (median is reported)")
+@click.option("--top", default=15, type=int, show_default=True, help="Number of slowest code.* modules to list")
+def main(module: str, repeat: int, top: int) -> None:
+    """Report the import time of MODULE and of the heavy stacks it loads at import."""
+    runs: List[Dict[str, float]] = [measure_import(module) for _ in range(repeat)]
+
+    def median(name: str) -> float:
+        values = [run[name] for run in runs if name in run]
+        return statistics.median(values) if values else 0.0
+
+    click.echo(f"Process wall time for 'import {module}': {median('<wall>'):.3f}s (median of {repeat})")
+    click.echo(f"{'module':<30} {'cumulative, s':>14}")
+    for name in TRACKED:
+        loaded = any(name in run for run in runs)
+        click.echo(f"{name:<30} {median(name):>14.3f}" if loaded else f"{name:<30} {'not imported':>14}")
+    project = sorted({name for run in runs for name in run if name.startswith("code.")}, key=median, reverse=True)
+    for name in project[:top]:
+        click.echo(f"{name:<30} {median(name):>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
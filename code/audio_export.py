@@ -1,7 +1,237 @@
-import tempfile
-from typing import Optional, Tuple
+import warnings
+import wave
+from code.result_cache import ResultCache, file_digest
+from code.scratch import ScratchStore, scratch_store
+from code.vad import FRAME_SECONDS, frame_energy
+from typing import Any, Callable, List, Optional, Tuple
 
 import ffmpeg
+import numpy as np
+from loguru import logger
+
+SAMPLE_RATE = 16000
+
+# Compressed preview formats for the browser: encoder, file suffix and bitrate
+PREVIEW_FORMATS = {
+    "mp3": ("libmp3lame", ".mp3", "64k"),
+    "opus": ("libopus", ".ogg", "32k"),
+}
+
+
+class AudioBuffer:
+    """
+    Decoded mono audio kept in memory as a float32 NumPy array.
+    Shared between Whisper (NumPy array) and pyannote (torch tensor view) without re-decoding.
+
+    Attributes:
+        samples (np.ndarray): Mono float32 samples in [-1, 1].
+        sample_rate (int): Sample rate in Hz.
+        envelope (Optional[np.ndarray]): Frame energy in dB (code.vad.frame_energy with FRAME_SECONDS frames),
+            when it was computed at ingest.
+    """
+
+    def __init__(
+        self, samples: np.ndarray, sample_rate: int = SAMPLE_RATE, envelope: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Args:
+            samples (np.ndarray): Mono samples (float32, or int16 PCM which is converted).
+            sample_rate (int): Sample rate in Hz.
+            envelope (Optional[np.ndarray]): Precomputed frame energy of the samples.
+        """
+        if samples.dtype == np.int16:
+            samples = samples.astype(np.float32) / 32768.0
+        self.samples: np.ndarray = samples
+        self.sample_rate: int = sample_rate
+        self.envelope: Optional[np.ndarray] = envelope
+
+    @classmethod
+    def from_file(cls, path: str, start: Optional[float] = None, end: Optional[float] = None) -> "AudioBuffer":
+        """
+        Decode any audio/video file with a single ffmpeg process piping float32 PCM to stdout.
+        start/end are applied as input options, so ffmpeg seeks in the container and decodes only the span.
+
+        Args:
+            path (str): Path to the media file.
+            start (Optional[float]): Start time in seconds.
+            end (Optional[float]): End time in seconds.
+        Returns:
+            AudioBuffer: Decoded 16 kHz mono audio.
+        """
+        out, _ = (
+            ffmpeg.input(path, **_seek_args(start, end))
+            .output("pipe:", format="f32le", acodec="pcm_f32le", ac=1, ar=str(SAMPLE_RATE))
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        return cls(np.frombuffer(out, dtype=np.float32), SAMPLE_RATE)
+
+    @classmethod
+    def from_wav(cls, path: str, start: Optional[float] = None, end: Optional[float] = None) -> "AudioBuffer":
+        """
+        Memory-map a mono PCM WAV file (16-bit integer or 32-bit float) without an ffmpeg process.
+        Float WAVs are used zero-copy; for 16-bit WAVs only the requested span is converted to float32.
+
+        Args:
+            path (str): Path to the WAV file.
+            start (Optional[float]): Start time in seconds.
+            end (Optional[float]): End time in seconds.
+        Returns:
+            AudioBuffer: Audio backed by the file contents.
+        """
+        samples, sample_rate = _map_wav(path)
+        return cls(samples[_sample_range(len(samples), sample_rate, start, end)], sample_rate)
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds."""
+        return len(self.samples) / self.sample_rate
+
+    def slice(self, start: Optional[float] = None, end: Optional[float] = None) -> "AudioBuffer":
+        """
+        Return a sample-accurate view of a time span (no copy).
+
+        Args:
+            start (Optional[float]): Start time in seconds.
+            end (Optional[float]): End time in seconds.
+        Returns:
+            AudioBuffer: Audio sharing memory with this buffer.
+        """
+        span = _sample_range(len(self.samples), self.sample_rate, start, end)
+        envelope = None
+        frame = max(1, int(self.sample_rate * FRAME_SECONDS))
+        if self.envelope is not None and span.start % frame == 0:
+            # The envelope stays valid for slices starting on a frame boundary
+            first = span.start // frame
+            envelope = self.envelope[first : first + (span.stop - span.start) // frame]
+        return AudioBuffer(self.samples[span], self.sample_rate, envelope)
+
+    def as_tensor(self) -> Any:
+        """
+        Return a (1, num_samples) torch tensor sharing memory with the samples.
+
+        Returns:
+            torch.Tensor: Waveform view for pyannote.
+        """
+        import torch
+
+        with warnings.catch_warnings():
+            # Samples decoded from a pipe or memory-mapped are read-only; the tensor is never written to
+            warnings.simplefilter("ignore", UserWarning)
+            return torch.from_numpy(self.samples).unsqueeze(0)
+
+    def write_wav(self, path: str) -> str:
+        """
+        Write the samples to a 16-bit PCM WAV file (e.g. for playback).
+
+        Args:
+            path (str): Output path.
+        Returns:
+            str: Output path.
+        """
+        return _write_pcm16(path, (np.clip(self.samples, -1.0, 1.0) * 32767).astype("<i2"), self.sample_rate)
+
+
+def _seek_args(start: Optional[float], end: Optional[float]) -> dict:
+    """Build ffmpeg input options seeking to start and decoding until end."""
+    args = {}
+    if start is not None:
+        args["ss"] = start
+    if end is not None:
+        args["t"] = end - (start or 0.0)
+    return args
+
+
+def _sample_range(count: int, sample_rate: int, start: Optional[float], end: Optional[float]) -> slice:
+    """Convert a time span to a slice of sample indices clipped to [0, count]."""
+    first = 0 if start is None else min(count, max(0, round(start * sample_rate)))
+    last = count if end is None else min(count, max(first, round(end * sample_rate)))
+    return slice(first, last)
+
+
+def wav_duration(path: str) -> float:
+    """
+    Get the duration of a mono PCM WAV file from its header, without reading the samples.
+
+    Args:
+        path (str): Path to the WAV file.
+    Returns:
+        float: Duration in seconds.
+    """
+    samples, sample_rate = _map_wav(path)
+    return len(samples) / sample_rate
+
+
+def _map_wav(path: str) -> Tuple[np.ndarray, int]:
+    """
+    Memory-map the samples of a mono 16-bit or float WAV file.
+
+    Args:
+        path (str): Path to the WAV file.
+    Returns:
+        Tuple[np.ndarray, int]: Raw samples (int16 or float32) and sample rate.
+    """
+    offset, size, fmt, channels, sample_rate, bits = _read_wav_header(path)
+    if channels != 1:
+        raise ValueError(f"Expected mono WAV, got {channels} channels: {path}")
+    if fmt == 3 and bits == 32:
+        dtype: Any = np.float32
+    elif fmt == 1 and bits == 16:
+        dtype = np.int16
+    else:
+        raise ValueError(f"Unsupported WAV format {fmt} ({bits} bit): {path}")
+    count = size // np.dtype(dtype).itemsize
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,)), sample_rate
+
+
+def _write_pcm16(path: str, pcm: np.ndarray, sample_rate: int) -> str:
+    """Write mono 16-bit samples to a WAV file."""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.ascontiguousarray(pcm, dtype="<i2").data.cast("B"))
+    return path
+
+
+def _read_wav_header(path: str) -> Tuple[int, int, int, int, int, int]:
+    """
+    Parse the RIFF header of a WAV file.
+
+    Args:
+        path (str): Path to the WAV file.
+    Returns:
+        Tuple[int, int, int, int, int, int]: Data offset, data size, format tag, channels, sample rate, bits per sample.
+    """
+    fmt = channels = sample_rate = bits = 0
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"Not a WAV file: {path}")
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"WAV file has no data chunk: {path}")
+            chunk_id, chunk_size = chunk[:4], int.from_bytes(chunk[4:], "little")
+            if chunk_id == b"fmt ":
+                data = f.read(chunk_size)
+                fmt = int.from_bytes(data[0:2], "little")
+                channels = int.from_bytes(data[2:4], "little")
+                sample_rate = int.from_bytes(data[4:8], "little")
+                bits = int.from_bytes(data[14:16], "little")
+                if fmt == 0xFFFE and chunk_size >= 26:
+                    # WAVE_FORMAT_EXTENSIBLE: the real format tag is the start of the sub-format GUID
+                    fmt = int.from_bytes(data[24:26], "little")
+                if chunk_size % 2:
+                    f.seek(1, 1)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                if chunk_size in (0, 0xFFFFFFFF):
+                    # Streamed WAVs (e.g. ffmpeg writing to a pipe) leave the size unset
+                    f.seek(0, 2)
+                    chunk_size = f.tell() - offset
+                return offset, chunk_size, fmt, channels, sample_rate, bits
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
 
 
 class AudioProcessor:
@@ -11,40 +241,66 @@ class AudioProcessor:
     Attributes:
         video_path (str): Path to the input video file.
         audio_path (Optional[str]): Path to the extracted or processed audio file.
+        cache (Optional[ResultCache]): Cache for decoded audio, keyed by the video content.
+        scratch (ScratchStore): Store for the extracted and cut WAV files.
+        owner (str): Session or job owning the files in the scratch store.
     """
 
-    def __init__(self, video_path: str) -> None:
+    def __init__(
+        self,
+        video_path: str,
+        cache: Optional[ResultCache] = None,
+        scratch: Optional[ScratchStore] = None,
+        owner: str = "default",
+    ) -> None:
         """
         Initialize AudioProcessor with the path to a video file.
 
         Args:
             video_path (str): Path to the video file.
+            cache (Optional[ResultCache]): Cache for decoded audio.
+            scratch (Optional[ScratchStore]): Store for intermediate WAV files (default: the shared store).
+            owner (str): Session or job owning the intermediate files.
         """
         self.video_path: str = video_path
         self.audio_path: Optional[str] = None
+        self.cache: Optional[ResultCache] = cache
+        self.scratch: ScratchStore = scratch or scratch_store
+        self.owner: str = owner
 
-    def extract_audio(self) -> str:
+    def extract_audio(self, start: Optional[float] = None, end: Optional[float] = None) -> str:
         """
-        Extract audio from the video file and save it as a temporary WAV file.
+        Extract audio from the video file and save it as a WAV file in the scratch store.
+        With start/end, ffmpeg seeks in the source and decodes only that span.
+
+        Args:
+            start (Optional[float]): Start time in seconds.
+            end (Optional[float]): End time in seconds.
 
         Returns:
             str: Path to the extracted audio file.
         """
-        tmp: tempfile._TemporaryFileWrapper = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        audio_path: str = tmp.name
-        tmp.close()
-        (
-            ffmpeg.input(self.video_path)
+        if self.cache is not None:
+            # Decode once per video content; later extractions are served from the cached PCM
+            buffer = self._decode(start, end)
+            audio_path = self.scratch.new_path(self.owner, size_hint=len(buffer.samples) * 2)
+            self.audio_path = self._write(audio_path, lambda: buffer.write_wav(audio_path))
+            return audio_path
+        size_hint = round((end - (start or 0.0)) * SAMPLE_RATE * 2) if end is not None else None
+        audio_path = self.scratch.new_path(self.owner, size_hint=size_hint)
+        stream = (
+            ffmpeg.input(self.video_path, **_seek_args(start, end))
             .output(audio_path, acodec="pcm_s16le", ac=1, ar="16000")
             .overwrite_output()
-            .run(quiet=True)
         )
-        self.audio_path = audio_path
+        self.audio_path = self._write(audio_path, lambda: stream.run(quiet=True))
         return audio_path
 
     def cut_audio(self, start: float, end: float) -> str:
         """
         Cut a segment from the extracted audio between start and end times.
+        A 16-bit WAV is sliced through a memory map without running ffmpeg; without an extracted
+        file only the requested span is decoded from the video.
 
         Args:
             start (float): Start time in seconds.
@@ -54,22 +310,53 @@ class AudioProcessor:
             str: Path to the cut audio file.
         """
         if self.audio_path is None:
-            self.extract_audio()
-        tmp: tempfile._TemporaryFileWrapper = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        cut_path: str = tmp.name
-        tmp.close()
-        (
-            ffmpeg.input(self.audio_path, ss=start, to=end)
-            .output(cut_path, acodec="pcm_s16le", ac=1, ar="16000")
-            .overwrite_output()
-            .run(quiet=True)
-        )
-        self.audio_path = cut_path
+            return self.extract_audio(start, end)
+        samples, sample_rate = _map_wav(self.audio_path)
+        pcm = samples[_sample_range(len(samples), sample_rate, start, end)]
+        cut_path = self.scratch.new_path(self.owner, size_hint=len(pcm) * 2)
+        if pcm.dtype == np.int16:
+            self.audio_path = self._write(cut_path, lambda: _write_pcm16(cut_path, pcm, sample_rate))
+        else:
+            self.audio_path = self._write(cut_path, lambda: AudioBuffer(pcm, sample_rate).write_wav(cut_path))
         return cut_path
 
+    def get_buffer(self, interval: Optional[Tuple[float, float]] = None) -> AudioBuffer:
+        """
+        Decode the audio track (optionally limited to an interval) into memory with a single ffmpeg pass.
+        If audio was already extracted, the interval is a memory-mapped slice of it instead.
+
+        Args:
+            interval (Optional[Tuple[float, float]]): Tuple with start and end times in seconds.
+
+        Returns:
+            AudioBuffer: Decoded 16 kHz mono audio.
+        """
+        start, end = interval if interval else (None, None)
+        if self.audio_path is not None:
+            return AudioBuffer.from_wav(self.audio_path, start, end)
+        return self._decode(start, end)
+
+    def get_buffers(self, intervals: List[Tuple[float, float]]) -> List[AudioBuffer]:
+        """
+        Get several intervals from one decode: ffmpeg seeks to the earliest start, decodes up to the
+        latest end, and every interval is returned as a view into that buffer.
+
+        Args:
+            intervals (List[Tuple[float, float]]): (start, end) times in seconds.
+
+        Returns:
+            List[AudioBuffer]: Audio per interval.
+        """
+        if not intervals:
+            return []
+        first = min(start for start, _ in intervals)
+        span = self.get_buffer((first, max(end for _, end in intervals)))
+        return [span.slice(start - first, end - first) for start, end in intervals]
+
     def get_audio(self, interval: Optional[Tuple[float, float]] = None) -> Optional[str]:
         """
         Get the path to the audio file, optionally cutting it to a specific interval.
+        Only the requested interval is decoded from the video.
 
         Args:
             interval (Optional[Tuple[float, float]]): Tuple with start and end times in seconds.
@@ -77,7 +364,84 @@ class AudioProcessor:
         Returns:
             Optional[str]: Path to the audio file, or None if extraction failed.
         """
-        self.extract_audio()
         if interval:
-            self.cut_audio(interval[0], interval[1])
-        return self.audio_path
+            return self.extract_audio(interval[0], interval[1])
+        return self.extract_audio()
+
+    def ingest(
+        self, preview_format: str = "mp3", interval: Optional[Tuple[float, float]] = None
+    ) -> Tuple[AudioBuffer, str]:
+        """
+        Decode the audio track once for everything the app needs: ffmpeg demuxes and decodes the
+        input a single time and writes 16 kHz mono float PCM to a pipe and a compressed preview for
+        the browser to the scratch store. The energy envelope used for silence detection is computed
+        from the PCM. With a cache, decoded audio seen before is only re-encoded as a preview.
+
+        Args:
+            preview_format (str): Preview format (key of PREVIEW_FORMATS).
+            interval (Optional[Tuple[float, float]]): Tuple with start and end times in seconds.
+
+        Returns:
+            Tuple[AudioBuffer, str]: Decoded audio with its envelope and the path to the preview file.
+        """
+        start, end = interval if interval else (None, None)
+        codec, suffix, bitrate = PREVIEW_FORMATS[preview_format]
+        preview_path = self.scratch.new_path(self.owner, suffix=suffix)
+        cached = self._cached(self.cache, start, end) if self.cache is not None else None
+        try:
+            if cached is not None:
+                samples = cached
+                (
+                    ffmpeg.input("pipe:", format="f32le", ac=1, ar=str(SAMPLE_RATE))
+                    .output(preview_path, acodec=codec, audio_bitrate=bitrate)
+                    .overwrite_output()
+                    .run(input=np.ascontiguousarray(samples).tobytes(), quiet=True)
+                )
+            else:
+                source = ffmpeg.input(self.video_path, **_seek_args(start, end)).audio
+                pcm = source.output("pipe:", format="f32le", acodec="pcm_f32le", ac=1, ar=str(SAMPLE_RATE))
+                preview = source.output(preview_path, acodec=codec, audio_bitrate=bitrate, ac=1)
+                out, _ = (
+                    ffmpeg.merge_outputs(pcm, preview).overwrite_output().run(capture_stdout=True, capture_stderr=True)
+                )
+                samples = np.frombuffer(out, dtype=np.float32)
+        except BaseException:
+            self.scratch.discard(preview_path)
+            raise
+        self.scratch.commit(preview_path)
+        if cached is None and self.cache is not None:
+            self.cache.store("audio", self._cache_key(self.cache, start, end), samples)
+        return AudioBuffer(samples, SAMPLE_RATE, frame_energy(samples, SAMPLE_RATE)), preview_path
+
+    def _write(self, path: str, write: Callable[[], Any]) -> str:
+        # Files that failed half-way are removed from the scratch store right away
+        try:
+            write()
+        except BaseException:
+            self.scratch.discard(path)
+            raise
+        return self.scratch.commit(path)
+
+    def _decode(self, start: Optional[float] = None, end: Optional[float] = None) -> AudioBuffer:
+        if self.cache is None:
+            return AudioBuffer.from_file(self.video_path, start=start, end=end)
+        samples = self._cached(self.cache, start, end)
+        if samples is None:
+            samples = AudioBuffer.from_file(self.video_path, start=start, end=end).samples
+            self.cache.store("audio", self._cache_key(self.cache, start, end), samples)
+        return AudioBuffer(samples, SAMPLE_RATE)
+
+    def _cache_key(self, cache: ResultCache, start: Optional[float], end: Optional[float]) -> str:
+        params = {"ar": SAMPLE_RATE, "ac": 1, "format": "f32le", "ss": start, "to": end}
+        return cache.key("audio", file_digest(self.video_path), params)
+
+    def _cached(self, cache: ResultCache, start: Optional[float], end: Optional[float]) -> Optional[np.ndarray]:
+        samples = cache.load("audio", self._cache_key(cache, start, end))
+        if samples is None and (start is not None or end is not None):
+            # A cached full decode serves any interval as a slice
+            full = cache.load("audio", self._cache_key(cache, None, None))
+            if full is not None:
+                samples = AudioBuffer(full, SAMPLE_RATE).slice(start, end).samples
+        if samples is not None:
+            logger.info("Cache hit for audio")
+        return samples
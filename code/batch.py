@@ -0,0 +1,411 @@
+import glob
+import json
+import multiprocessing
+import os
+import threading
+import time
+from code.audio_export import AudioBuffer, AudioProcessor
+from code.devices import visible_gpus
+from code.inference_profiles import PROFILES, configure_threads
+from code.instrumentation import JobMetrics
+from code.model_registry import get_diarizer, get_tiered_transcriber, get_transcriber
+from code.output_utils import TranscriptSaver
+from code.pipeline import PipelineRunner
+from code.result_cache import ResultCache, result_cache
+from code.writers import WRITERS
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import click
+from loguru import logger
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".avi", ".webm", ".m4a", ".mp3", ".wav", ".flac", ".ogg")
+
+# Device and options owned by a batch worker process
+_worker_device: str = "cpu"
+_worker_options: Dict[str, Any] = {}
+
+
+def collect_jobs(
+    inputs: List[str],
+    speakers: int,
+    language: str,
+    min_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Build the job list from directories, glob patterns, files and JSONL manifests.
+    Manifest lines are objects with a "video" key and optional "id", "speakers", "min_speakers",
+    "max_speakers", "language" and "interval".
+    Args:
+        inputs (List[str]): Input paths or patterns.
+        speakers (int): Default number of speakers (0 to estimate it).
+        language (str): Default language.
+        min_speakers (Optional[int]): Default lower bound of the estimated number of speakers.
+        max_speakers (Optional[int]): Default upper bound of the estimated number of speakers.
+    Returns:
+        List[Dict[str, Any]]: Jobs with unique ids.
+    """
+    jobs: List[Dict[str, Any]] = []
+    for item in inputs:
+        if item.endswith(".jsonl") and os.path.isfile(item):
+            with open(item, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        jobs.append(json.loads(line))
+            continue
+        if os.path.isdir(item):
+            paths = [os.path.join(item, name) for name in sorted(os.listdir(item))]
+            paths = [path for path in paths if path.lower().endswith(VIDEO_EXTENSIONS)]
+        else:
+            paths = sorted(glob.glob(item)) or [item]
+        jobs.extend({"video": path} for path in paths)
+
+    used_ids: set = set()
+    for job in jobs:
+        job.setdefault("speakers", speakers)
+        job.setdefault("min_speakers", min_speakers)
+        job.setdefault("max_speakers", max_speakers)
+        job.setdefault("language", language)
+        job.setdefault("interval", None)
+        base = job.get("id") or os.path.splitext(os.path.basename(job["video"]))[0]
+        job_id, n = base, 1
+        while job_id in used_ids:
+            n += 1
+            job_id = f"{base}_{n}"
+        used_ids.add(job_id)
+        job["id"] = job_id
+    return jobs
+
+
+def read_done(summary_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read finished jobs from the summary log of a previous run.
+    Args:
+        summary_path (str): Path to summary.jsonl.
+    Returns:
+        Dict[str, Dict[str, Any]]: Records of successfully finished jobs whose output files all exist, by job id.
+    """
+    done: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(summary_path):
+        return done
+    with open(summary_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run that was killed mid-write
+                continue
+            outputs = record.get("outputs") or []
+            if record.get("status") == "done" and outputs and all(os.path.exists(path) for path in outputs):
+                done[record["id"]] = record
+    return done
+
+
+def worker_devices(workers: Optional[int], gpu_slots: int) -> List[str]:
+    """
+    Assign a device to every worker: gpu_slots workers per visible GPU, or CPU workers without GPUs.
+    Args:
+        workers (Optional[int]): Number of workers (default: one per GPU slot, or 1 on CPU).
+        gpu_slots (int): Concurrent jobs per GPU.
+    Returns:
+        List[str]: Device per worker.
+    """
+    gpus = visible_gpus()
+    if not gpus:
+        return ["cpu"] * (workers or 1)
+    slots = [gpu for _ in range(gpu_slots) for gpu in gpus]
+    return [slots[i % len(slots)] for i in range(workers or len(slots))]
+
+
+def _init_worker(devices: Any, options: Dict[str, Any]) -> None:
+    global _worker_device, _worker_options
+    _worker_device = devices.get()
+    _worker_options = options
+    if _worker_device == "cpu":
+        # Whisper and pyannote of a job run concurrently on the worker's share of the cores
+        configure_threads(jobs=2, cores=options["threads"])
+    # Load the models once per worker; the registry keeps them for all following jobs
+    _worker_transcriber(options)
+    get_diarizer(options["token"], device=_worker_device, profile=options["cpu_profile"])
+
+
+def _worker_transcriber(options: Dict[str, Any]) -> Any:
+    if options["refine_model"]:
+        return get_tiered_transcriber(
+            options["model"], options["refine_model"], device=_worker_device, profile=options["cpu_profile"]
+        )
+    return get_transcriber(options["model"], device=_worker_device, profile=options["cpu_profile"])
+
+
+def _process_job(job: Dict[str, Any], audio: Optional[AudioBuffer] = None) -> Dict[str, Any]:
+    # audio is the prefetched buffer when there is no cache to hand it over through
+    options = _worker_options
+    cache = ResultCache(options["cache_dir"], options["cache_max_bytes"]) if options["cache_dir"] else None
+    metrics = JobMetrics(job_id=job["id"])
+    start = time.perf_counter()
+    if audio is None:
+        with metrics.stage("decode"):
+            audio = AudioProcessor(job["video"], cache=cache).get_buffer(job["interval"])
+    decode_seconds = time.perf_counter() - start
+    metrics.audio_seconds = audio.duration
+    runner = PipelineRunner(
+        _worker_transcriber(options),
+        get_diarizer(options["token"], device=_worker_device, profile=options["cpu_profile"]),
+        long_form=options["long_form"],
+        cache=cache,
+        metrics=metrics,
+    )
+    with metrics.trace():
+        result = runner.run(
+            audio,
+            language=job["language"],
+            num_speakers=int(job["speakers"]),
+            min_speakers=job["min_speakers"],
+            max_speakers=job["max_speakers"],
+        )
+    saver = TranscriptSaver(options["out_dir"], filename=f"{job['id']}.txt", formats=options["formats"])
+    with metrics.stage("save"):
+        outputs = saver.save_transcript(result["diarization"], result["transcription"]["segments"])
+    stages = metrics.finish(os.path.join(options["out_dir"], "metrics"))["stages"]
+    timings = dict(result["timings"], decode=decode_seconds)
+    return {
+        "outputs": outputs,
+        "device": _worker_device,
+        "audio_seconds": audio.duration,
+        "timings": timings,
+        "stages": stages,
+    }
+
+
+class BatchRunner:
+    """
+    Processes many videos with a pool of worker processes.
+
+    Every worker loads the models once and keeps them for all its jobs. Audio of the next files is
+    decoded by a prefetch thread pool while workers run inference (into the result cache, or passed
+    to the worker with the job when there is no cache), and every
+    finished job is appended to summary.jsonl so an interrupted batch resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        token: str,
+        model: str = "base",
+        refine_model: Optional[str] = None,
+        workers: Optional[int] = None,
+        gpu_slots: int = 1,
+        prefetch: int = 2,
+        long_form: bool = False,
+        cache: Optional[ResultCache] = result_cache,
+        formats: Sequence[str] = ("txt",),
+        cpu_profile: Optional[str] = None,
+    ) -> None:
+        """
+        Args:
+            out_dir (str): Output directory for transcripts and the summary.
+            token (str): HuggingFace access token.
+            model (str): Whisper model name.
+            refine_model (Optional[str]): Whisper model re-decoding low-confidence spans of the draft from model.
+            workers (Optional[int]): Number of worker processes.
+            gpu_slots (int): Concurrent jobs per GPU.
+            prefetch (int): Number of files decoded ahead of inference (at least 1).
+            long_form (bool): Use chunked parallel transcription and windowed diarization.
+            cache (Optional[ResultCache]): Result cache.
+            formats (Sequence[str]): Transcript formats per job (see code.writers.WRITERS).
+            cpu_profile (Optional[str]): Inference profile of the workers' models (default: CPU_PROFILE
+                environment variable).
+        """
+        if prefetch < 1:
+            raise ValueError(f"prefetch must be at least 1, got {prefetch}")
+        self.out_dir = out_dir
+        self.devices = worker_devices(workers, gpu_slots)
+        self.prefetch = prefetch
+        self.cache = cache
+        self.summary_path = os.path.join(out_dir, "summary.jsonl")
+        self.options = {
+            "token": token,
+            "model": model,
+            "refine_model": refine_model,
+            "long_form": long_form,
+            "out_dir": out_dir,
+            "formats": list(formats),
+            "cpu_profile": cpu_profile,
+            "threads": max(1, (os.cpu_count() or 1) // len(self.devices)),
+            "cache_dir": cache.root if cache is not None else None,
+            "cache_max_bytes": cache.max_bytes if cache is not None else 0,
+        }
+        self._summary_lock = threading.Lock()
+        os.makedirs(out_dir, exist_ok=True)
+
+    def run(self, jobs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Process all jobs that are not finished yet and write summary.json.
+        Args:
+            jobs (List[Dict[str, Any]]): Jobs from collect_jobs.
+        Returns:
+            Dict[str, Any]: Summary with per-file records.
+        """
+        done = read_done(self.summary_path)
+        pending = [job for job in jobs if job["id"] not in done]
+        logger.info(f"{len(jobs)} files, {len(done)} already done, {len(pending)} to process on {self.devices}")
+        records: Dict[str, Dict[str, Any]] = {job_id: record for job_id, record in done.items()}
+        start = time.perf_counter()
+
+        context = multiprocessing.get_context("spawn")
+        devices = context.Queue()
+        for device in self.devices:
+            devices.put(device)
+        # Bounds how far decoding may run ahead of inference
+        slots = threading.BoundedSemaphore(len(self.devices) + self.prefetch)
+        futures: List[Future] = []
+        with ThreadPoolExecutor(max_workers=self.prefetch, thread_name_prefix="decode") as decoder, ProcessPoolExecutor(
+            max_workers=len(self.devices),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(devices, self.options),
+        ) as pool:
+            for job in pending:
+                slots.acquire()
+                futures.append(decoder.submit(self._decode_and_submit, pool, job, slots, records))
+            for future in futures:
+                future.result()
+
+        summary = {
+            "files": len(jobs),
+            "done": sum(1 for record in records.values() if record["status"] == "done"),
+            "failed": sum(1 for record in records.values() if record["status"] == "failed"),
+            "wall_seconds": time.perf_counter() - start,
+            "jobs": [records[job["id"]] for job in jobs if job["id"] in records],
+        }
+        with open(os.path.join(self.out_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+    def _decode_and_submit(
+        self,
+        pool: ProcessPoolExecutor,
+        job: Dict[str, Any],
+        slots: threading.BoundedSemaphore,
+        records: Dict[str, Dict[str, Any]],
+    ) -> None:
+        start = time.perf_counter()
+        try:
+            audio = AudioProcessor(job["video"], cache=self.cache).get_buffer(job["interval"])
+            prefetch_seconds = time.perf_counter() - start
+            # Raises BrokenProcessPool if a worker has crashed; the job is retried on the next run
+            if self.cache is not None:
+                # The worker memory-maps the decoded samples from the warmed cache
+                future = pool.submit(_process_job, job)
+            else:
+                future = pool.submit(_process_job, job, audio)
+            del audio
+        except Exception as e:
+            slots.release()
+            self._record(records, job, {"status": "failed", "error": str(e)})
+            return
+
+        def on_done(done: Future) -> None:
+            slots.release()
+            try:
+                result = done.result()
+                result["timings"]["prefetch"] = prefetch_seconds
+                self._record(records, job, dict(result, status="done"))
+            except Exception as e:
+                self._record(records, job, {"status": "failed", "error": str(e)})
+
+        future.add_done_callback(on_done)
+
+    def _record(self, records: Dict[str, Dict[str, Any]], job: Dict[str, Any], result: Dict[str, Any]) -> None:
+        record = dict(result, id=job["id"], video=job["video"])
+        if record["status"] == "done":
+            logger.info(f"Done {job['id']} in {record['timings']['total']:.1f}s")
+        else:
+            logger.error(f"Failed {job['id']}: {record['error']}")
+        with self._summary_lock:
+            records[job["id"]] = record
+            with open(self.summary_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@click.command()
+@click.argument("inputs", nargs=-1, required=True)
+@click.option("--out-dir", default=os.path.join("out", "batch"), show_default=True, help="Output directory")
+@click.option("--speakers", default=0, type=int, show_default=True, help="Default number of speakers (0 = estimate)")
+@click.option("--min-speakers", type=int, help="Default lower bound when the number of speakers is estimated")
+@click.option("--max-speakers", type=int, help="Default upper bound when the number of speakers is estimated")
+@click.option("--language", default="ru", show_default=True, help="Default audio language")
+@click.option("--model", default="base", show_default=True, help="Whisper model name")
+@click.option("--refine-model", help="Whisper model re-decoding low-confidence spans of the --model draft")
+@click.option("--workers", type=int, help="Worker processes (default: one per GPU slot, or 1 on CPU)")
+@click.option("--gpu-slots", default=1, type=int, show_default=True, help="Concurrent jobs per GPU")
+@click.option(
+    "--prefetch", default=2, type=click.IntRange(min=1), show_default=True, help="Files decoded ahead of inference"
+)
+@click.option(
+    "--long-form",
+    is_flag=True,
+    help="Long recording: transcribe chunks in parallel and diarize in windows with bounded memory",
+)
+@click.option("--no-cache", is_flag=True, help="Do not read or write cached stage results")
+@click.option(
+    "--cpu-profile",
+    type=click.Choice(list(PROFILES)),
+    default="default",
+    envvar="CPU_PROFILE",
+    show_default=True,
+    help="Inference profile on CPU (int8 quantization, torch.compile)",
+)
+@click.option(
+    "--formats",
+    multiple=True,
+    type=click.Choice(list(WRITERS)),
+    default=["txt"],
+    show_default=True,
+    help="Transcript formats to write per file (repeat the option for several)",
+)
+def main(
+    inputs: List[str],
+    out_dir: str,
+    speakers: int,
+    min_speakers: Optional[int],
+    max_speakers: Optional[int],
+    language: str,
+    model: str,
+    refine_model: Optional[str],
+    workers: Optional[int],
+    gpu_slots: int,
+    prefetch: int,
+    long_form: bool,
+    no_cache: bool,
+    cpu_profile: str,
+    formats: List[str],
+) -> None:
+    """
+    Batch entry point: INPUTS are directories, glob patterns, video files or JSONL manifests.
+    Re-running with the same --out-dir skips files that are already done.
+    """
+    token = os.environ.get("HUGGINGFACE_TOKEN")
+    if not token:
+        raise RuntimeError("HUGGINGFACE_TOKEN environment variable not set")
+    jobs = collect_jobs(list(inputs), speakers, language, min_speakers, max_speakers)
+    runner = BatchRunner(
+        out_dir,
+        token,
+        model=model,
+        refine_model=refine_model,
+        workers=workers,
+        gpu_slots=gpu_slots,
+        prefetch=prefetch,
+        long_form=long_form,
+        cache=None if no_cache else result_cache,
+        formats=formats,
+        cpu_profile=cpu_profile,
+    )
+    summary = runner.run(jobs)
+    logger.info(f"Batch finished: {summary['done']} done, {summary['failed']} failed in {summary['wall_seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+import uuid
+from code.audio_export import AudioBuffer
+from typing import Dict, Optional
+
+from loguru import logger
+
+
+class _Entry:
+    __slots__ = ("buffer", "owner", "last_used")
+
+    def __init__(self, buffer: AudioBuffer, owner: str) -> None:
+        self.buffer = buffer
+        self.owner = owner
+        self.last_used = time.monotonic()
+
+
+class BufferStore:
+    """
+    In-process store for decoded audio, so the app transcribes from memory instead of reading WAV files.
+
+    Buffers belong to an owner (a UI session) and are addressed by an opaque id kept in the session
+    state. When the total size exceeds the cap, the least recently used buffers are dropped; a session
+    whose buffer was dropped has to extract the audio again.
+    """
+
+    def __init__(self, max_bytes: int = 2 * 2**30) -> None:
+        """
+        Args:
+            max_bytes (int): Size cap in bytes (0 means unlimited).
+        """
+        self.max_bytes = max_bytes
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def put(self, owner: str, buffer: AudioBuffer) -> str:
+        """
+        Add a buffer.
+        Args:
+            owner (str): Session owning the buffer.
+            buffer (AudioBuffer): Decoded audio.
+        Returns:
+            str: Buffer id.
+        """
+        buffer_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[buffer_id] = _Entry(buffer, owner)
+            self._evict(keep=buffer_id)
+        return buffer_id
+
+    def get(self, buffer_id: Optional[str]) -> Optional[AudioBuffer]:
+        """Return a buffer by id, or None if it is unknown or was evicted."""
+        with self._lock:
+            entry = self._entries.get(buffer_id) if buffer_id else None
+            if entry is None:
+                return None
+            entry.last_used = time.monotonic()
+            return entry.buffer
+
+    def discard(self, buffer_id: Optional[str]) -> None:
+        """Drop a buffer (e.g. when the session extracts another file)."""
+        with self._lock:
+            if buffer_id:
+                self._entries.pop(buffer_id, None)
+
+    def release_owner(self, owner: str) -> None:
+        """Drop all buffers of an owner (e.g. when a UI session ends)."""
+        with self._lock:
+            for buffer_id in [buffer_id for buffer_id, entry in self._entries.items() if entry.owner == owner]:
+                del self._entries[buffer_id]
+
+    def total_bytes(self) -> int:
+        """Return the total size of the stored samples in bytes."""
+        with self._lock:
+            return sum(entry.buffer.samples.nbytes for entry in self._entries.values())
+
+    def _evict(self, keep: str) -> None:
+        # Called with the lock held; the buffer just added (keep) is never evicted
+        if not self.max_bytes:
+            return
+        total = sum(entry.buffer.samples.nbytes for entry in self._entries.values())
+        for buffer_id, entry in sorted(self._entries.items(), key=lambda item: item[1].last_used):
+            if total <= self.max_bytes:
+                break
+            if buffer_id != keep:
+                total -= entry.buffer.samples.nbytes
+                logger.info(
+                    f"Evicting audio buffer of session {entry.owner} ({entry.buffer.samples.nbytes / 2**20:.0f} MB)"
+                )
+                del self._entries[buffer_id]
+
+
+# Shared buffer store of the app; BUFFER_MAX_MB sets the size cap.
+buffer_store = BufferStore(max_bytes=int(os.environ.get("BUFFER_MAX_MB", "2048")) * 2**20)
@@ -0,0 +1,291 @@
+import os
+import threading
+import time
+from code.model_registry import registry
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+# Approximate memory needed to load a model, in bytes (Whisper figures from the Whisper README)
+WHISPER_MEMORY = {
+    "tiny": 1 * 2**30,
+    "base": 1 * 2**30,
+    "small": 2 * 2**30,
+    "medium": 5 * 2**30,
+    "large": 10 * 2**30,
+    "turbo": 6 * 2**30,
+}
+PYANNOTE_MEMORY = int(1.5 * 2**30)
+
+
+def model_memory(kind: str, model_name: str = "") -> int:
+    """
+    Return the approximate memory a model needs when it is loaded.
+    Args:
+        kind (str): "whisper" or "pyannote".
+        model_name (str): Model name (e.g. "base", "large-v3", or "base+large-v3" for a tiered pair).
+    Returns:
+        int: Size in bytes.
+    """
+    if kind == "pyannote":
+        return PYANNOTE_MEMORY
+    if "+" in model_name:
+        return sum(model_memory(kind, name) for name in model_name.split("+"))
+    # "large-v3-turbo" is its own (smaller) model, not a large one
+    if "turbo" in model_name:
+        return WHISPER_MEMORY["turbo"]
+    family = model_name.split(".")[0].split("-")[0]
+    return WHISPER_MEMORY.get(family, WHISPER_MEMORY["large"])
+
+
+def visible_gpus() -> List[str]:
+    """Return the visible CUDA devices ("cuda:0", "cuda:1", ...), empty without CUDA or torch."""
+    try:
+        import torch
+    except ImportError:
+        return []
+    if not torch.cuda.is_available():
+        return []
+    return [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+
+
+def memory_info(device: str) -> Tuple[int, int]:
+    """
+    Return free and total memory of a device.
+    Args:
+        device (str): "cpu" or "cuda:<index>".
+    Returns:
+        Tuple[int, int]: Free and total bytes (available and physical RAM for the CPU).
+    """
+    if device.startswith("cuda"):
+        import torch
+
+        return torch.cuda.mem_get_info(torch.device(device))
+    page = os.sysconf("SC_PAGE_SIZE")
+    return os.sysconf("SC_AVPHYS_PAGES") * page, os.sysconf("SC_PHYS_PAGES") * page
+
+
+class DeviceLease:
+    """
+    Devices assigned to one job; release() (or leaving the with block) frees the slots.
+
+    Attributes:
+        whisper_device (str): Device for the Whisper model.
+        pyannote_device (str): Device for the pyannote pipeline.
+        waited (float): Seconds spent waiting for a free slot.
+    """
+
+    def __init__(self, scheduler: "DeviceScheduler", whisper: str, pyannote: str, reserved: Dict[str, int]) -> None:
+        self.whisper_device = whisper
+        self.pyannote_device = pyannote
+        self.waited = 0.0
+        self._scheduler = scheduler
+        self._reserved = reserved
+        self._released = False
+
+    def release(self) -> None:
+        """Free the slots and memory reservations (only the first call has an effect)."""
+        if not self._released:
+            self._released = True
+            self._scheduler._release({self.whisper_device, self.pyannote_device}, self._reserved)
+
+    def __enter__(self) -> "DeviceLease":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.release()
+
+
+class DeviceScheduler:
+    """
+    Places the models of concurrent jobs on the visible devices.
+
+    Every GPU runs up to gpu_slots jobs at a time. A job goes to the GPU with the most free memory
+    that fits both its models (GPUs already holding the models are preferred, since they need no new
+    memory); if no single GPU fits both, Whisper and pyannote are split across two GPUs. When every
+    GPU is busy or too full the job runs on the CPU (up to cpu_slots jobs), otherwise it waits.
+    Memory of models being loaded is reserved until the job ends, so simultaneous jobs do not
+    choose the same nearly full GPU.
+    """
+
+    def __init__(
+        self,
+        gpu_slots: int = 1,
+        cpu_slots: int = 1,
+        headroom_bytes: int = 512 * 2**20,
+        devices: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Args:
+            gpu_slots (int): Concurrent jobs per GPU.
+            cpu_slots (int): Concurrent jobs on the CPU (0 disables the CPU fallback when GPUs exist).
+            headroom_bytes (int): Free memory kept on every GPU for activations.
+            devices (Optional[List[str]]): GPUs to use (default: all visible, probed on first use).
+        """
+        self.gpu_slots = gpu_slots
+        self.cpu_slots = cpu_slots
+        self.headroom_bytes = headroom_bytes
+        self._gpus = devices
+        self._active: Dict[str, int] = {}
+        self._reserved: Dict[str, int] = {}
+        self._condition = threading.Condition()
+
+    def gpus(self) -> List[str]:
+        """Return the GPUs managed by the scheduler (probes torch on first call)."""
+        if self._gpus is None:
+            self._gpus = visible_gpus()
+            logger.info(f"Device scheduler: {', '.join(self._gpus) or 'no GPUs'}, CPU fallback x{self.cpu_slots}")
+        return self._gpus
+
+    def acquire(self, whisper_model: str = "base", diarize: bool = True) -> DeviceLease:
+        """
+        Reserve devices for one job, waiting until a slot is free.
+        Args:
+            whisper_model (str): Whisper model the job uses ("draft+refine" for tiered transcription).
+            diarize (bool): Whether the job also runs pyannote.
+        Returns:
+            DeviceLease: Assigned devices.
+        """
+        lease = self.try_acquire(whisper_model, diarize, timeout=None)
+        assert lease is not None, "waiting without a timeout always ends with a lease"
+        return lease
+
+    def try_acquire(
+        self, whisper_model: str = "base", diarize: bool = True, timeout: Optional[float] = 0.0
+    ) -> Optional[DeviceLease]:
+        """
+        Reserve devices for one job, waiting at most timeout seconds for a free slot.
+        Args:
+            whisper_model (str): Whisper model the job uses ("draft+refine" for tiered transcription).
+            diarize (bool): Whether the job also runs pyannote.
+            timeout (Optional[float]): Seconds to wait (0 does not wait, None waits indefinitely).
+        Returns:
+            Optional[DeviceLease]: Assigned devices, or None on timeout.
+        """
+        gpus = self.gpus()
+        start = time.perf_counter()
+        deadline = None if timeout is None else start + timeout
+        with self._condition:
+            while True:
+                placed = self._place(gpus, whisper_model, diarize)
+                if placed is not None:
+                    break
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            whisper, pyannote, reserved = placed
+            for device in {whisper, pyannote}:
+                self._active[device] = self._active.get(device, 0) + 1
+            for device, size in reserved.items():
+                self._reserved[device] = self._reserved.get(device, 0) + size
+        lease = DeviceLease(self, whisper, pyannote, reserved)
+        lease.waited = time.perf_counter() - start
+        logger.info(f"Placed job on {whisper} (whisper) and {pyannote} (pyannote) after {lease.waited:.1f}s")
+        return lease
+
+    def utilization(self) -> List[Dict[str, Any]]:
+        """
+        Return the state of every managed device.
+        Returns:
+            List[Dict[str, Any]]: Device, name, active jobs, slots and free/total memory in bytes.
+        """
+        rows = []
+        for device in self.gpus() + ["cpu"]:
+            try:
+                free, total = memory_info(device)
+            except Exception:
+                free, total = 0, 0
+            rows.append(
+                {
+                    "device": device,
+                    "name": _device_name(device),
+                    "active": self._active.get(device, 0),
+                    "slots": self.cpu_slots if device == "cpu" else self.gpu_slots,
+                    "free_bytes": free,
+                    "total_bytes": total,
+                }
+            )
+        return rows
+
+    def status_markdown(self) -> str:
+        """Return per-device jobs and memory as Markdown for the UI."""
+        lines = []
+        for row in self.utilization():
+            used = (row["total_bytes"] - row["free_bytes"]) / 2**30
+            memory = f"{used:.1f}/{row['total_bytes'] / 2**30:.1f} GB" if row["total_bytes"] else "n/a"
+            lines.append(f"**{row['device']}** ({row['name']}): {row['active']}/{row['slots']} jobs, memory {memory}")
+        return "  \n".join(lines)
+
+    def _place(self, gpus: List[str], whisper_model: str, diarize: bool) -> Optional[Tuple[str, str, Dict[str, int]]]:
+        # Called with the condition held
+        free_gpus = [gpu for gpu in gpus if self._active.get(gpu, 0) < self.gpu_slots]
+        available = {gpu: self._available(gpu) for gpu in free_gpus}
+        ranked = sorted(free_gpus, key=lambda gpu: available[gpu], reverse=True)
+
+        def need(kind: str, name: str, device: str) -> int:
+            return 0 if _loaded(kind, name, device) else model_memory(kind, name)
+
+        def need_both(device: str) -> int:
+            return need("whisper", whisper_model, device) + (need("pyannote", "", device) if diarize else 0)
+
+        # Both models on one GPU, preferring GPUs where they are loaded already, then the most free memory
+        fits = [gpu for gpu in ranked if need_both(gpu) <= available[gpu]]
+        if fits:
+            gpu = min(fits, key=need_both)
+            return gpu, gpu, {gpu: need_both(gpu)} if need_both(gpu) else {}
+        # Split across two GPUs
+        if diarize:
+            for whisper in ranked:
+                if need("whisper", whisper_model, whisper) > available[whisper]:
+                    continue
+                for pyannote in ranked:
+                    if pyannote != whisper and need("pyannote", "", pyannote) <= available[pyannote]:
+                        reserved = {whisper: need("whisper", whisper_model, whisper)}
+                        reserved[pyannote] = need("pyannote", "", pyannote)
+                        return whisper, pyannote, {device: size for device, size in reserved.items() if size}
+        # CPU fallback (the only option without GPUs)
+        cpu_slots = self.cpu_slots if gpus else max(1, self.cpu_slots)
+        if self._active.get("cpu", 0) < cpu_slots:
+            return "cpu", "cpu", {}
+        return None
+
+    def _available(self, gpu: str) -> int:
+        try:
+            free, _ = memory_info(gpu)
+        except Exception:
+            return 0
+        return free - self._reserved.get(gpu, 0) - self.headroom_bytes
+
+    def _release(self, devices: Set[str], reserved: Dict[str, int]) -> None:
+        with self._condition:
+            for device in devices:
+                self._active[device] = max(0, self._active.get(device, 0) - 1)
+            for device, size in reserved.items():
+                self._reserved[device] = max(0, self._reserved.get(device, 0) - size)
+            self._condition.notify_all()
+
+
+def _loaded(kind: str, model_name: str, device: str) -> bool:
+    # Any model of this kind counts for pyannote (there is one pipeline in practice)
+    if "+" in model_name:
+        return all(_loaded(kind, name, device) for name in model_name.split("+"))
+    return any(
+        key[0] == kind and key[2] == device and (kind == "pyannote" or key[1] == model_name) for key in registry.keys()
+    )
+
+
+def _device_name(device: str) -> str:
+    if device == "cpu":
+        return f"{os.cpu_count() or 1} cores"
+    import torch
+
+    return torch.cuda.get_device_name(torch.device(device))
+
+
+# Shared scheduler for the app and the CLI.
+# GPU_SLOTS sets the concurrent jobs per GPU, CPU_SLOTS the jobs allowed on the CPU.
+device_scheduler = DeviceScheduler(
+    gpu_slots=int(os.environ.get("GPU_SLOTS", "1")),
+    cpu_slots=int(os.environ.get("CPU_SLOTS", "1")),
+)
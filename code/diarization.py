@@ -1,27 +1,75 @@
 import os
-from typing import Any
+import threading
+from code.audio_export import AudioBuffer, wav_duration
+from code.inference_profiles import compile_module
+from code.jobs import check_cancelled
+from code.result_cache import ResultCache, file_digest
+from code.speaker_linking import (
+    SpeakerLinker,
+    overlap_mapping,
+    plan_windows,
+    window_cuts,
+)
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Union
 
+import numpy as np
 import torch
 from loguru import logger
 from pyannote.audio import Audio, Pipeline
+from pyannote.core import Annotation, Segment, SlidingWindowFeature
+
+
+def _bound(value: Optional[int]) -> Optional[int]:
+    # Speaker counts of 0 or less mean "estimate automatically"
+    return int(value) if value is not None and value > 0 else None
+
+
+def _cancel_hook(cancel: Optional[threading.Event]) -> Optional[Callable[..., None]]:
+    # pyannote calls the hook after every step and inference batch, which makes it a cancellation point
+    if cancel is None:
+        return None
+
+    def hook(*args: Any, **kwargs: Any) -> None:
+        check_cancelled(cancel)
+
+    return hook
 
 
 class DiarizationPipeline:
     """
     Class for speaker diarization using pyannote.audio.
     Loads model from models/pyannote or downloads if not present.
+
+    Diarization is split into the neural part (segmentation and speaker embeddings, see extract) and
+    clustering (see cluster). The neural features are kept per audio in memory and in the result
+    cache, so trying another speaker count or automatic estimation only re-clusters.
     """
 
-    def __init__(self, token: str, model_name: str = "pyannote/speaker-diarization-3.1", device: str = "cpu") -> None:
+    def __init__(
+        self,
+        token: str,
+        model_name: str = "pyannote/speaker-diarization-3.1",
+        device: str = "cpu",
+        compile: bool = False,
+        max_features: int = 4,
+    ) -> None:
         """
         Args:
             token (str): HuggingFace access token.
             model_name (str): Name of the pyannote model.
-            device (str): Device to run the model on ("cpu" or "cuda").
+            device (str): Device to run the model on ("cpu", "cuda" or "cuda:N").
+            compile (bool): Compile the segmentation model with torch.compile.
+            max_features (int): Number of recordings whose segmentation and embeddings are kept in memory.
         """
         self.token = token
         self.model_name = model_name
         self.device = device
+        self.max_features = max_features
+        self._features: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._features_lock = threading.Lock()
+        # The pipeline and its models are shared by the app's jobs; inference runs one job at a time
+        self._inference_lock = threading.Lock()
         self.model_dir = os.path.join("models", "pyannote")
         os.makedirs(self.model_dir, exist_ok=True)
 
@@ -33,19 +81,247 @@ class DiarizationPipeline:
             use_auth_token=token,
             cache_dir=self.model_dir,
         )
-        if self.device == "cuda":
-            self.pipeline.to(torch.device("cuda"))
+        if self.device.startswith("cuda"):
+            self.pipeline.to(torch.device(self.device))
+        if compile and hasattr(self.pipeline, "_segmentation"):
+            self.pipeline._segmentation.model = compile_module(self.pipeline._segmentation.model)
         self.audio = Audio()
 
-    def diarize(self, audio_path: str, num_speakers: int) -> Any:
+    def diarize(
+        self,
+        audio_path: Union[str, AudioBuffer],
+        num_speakers: Optional[int] = None,
+        min_speakers: Optional[int] = None,
+        max_speakers: Optional[int] = None,
+        cache: Optional[ResultCache] = None,
+        content: Optional[str] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Any:
         """
-        Perform diarization on the given audio file.
+        Perform diarization on the given audio file or decoded audio buffer.
         Args:
-            audio_path (str): Path to the audio file.
-            num_speakers (int): Number of speakers.
+            audio_path (Union[str, AudioBuffer]): Path to the audio file or decoded audio.
+            num_speakers (Optional[int]): Number of speakers (None or 0 to estimate it).
+            min_speakers (Optional[int]): Lower bound of the estimated number of speakers.
+            max_speakers (Optional[int]): Upper bound of the estimated number of speakers.
+            cache (Optional[ResultCache]): Result cache for the segmentation and embeddings.
+            content (Optional[str]): Digest of the audio; features are only reused when it is given.
+            cancel (Optional[threading.Event]): Job cancel event, checked after every inference batch.
         Returns:
             Any: Diarization result (pyannote.core.Annotation)
         """
-        waveform, sample_rate = self.audio(audio_path)
-        diarization = self.pipeline({"waveform": waveform, "sample_rate": sample_rate}, num_speakers=num_speakers)
-        return diarization
+        features = self.features(audio_path, cache=cache, content=content, cancel=cancel)
+        return self.cluster(features, num_speakers, min_speakers, max_speakers)
+
+    def features(
+        self,
+        audio_path: Union[str, AudioBuffer],
+        cache: Optional[ResultCache] = None,
+        content: Optional[str] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        """
+        Return the segmentation and embeddings of an audio, from memory, the result cache or extract.
+        Args:
+            audio_path (Union[str, AudioBuffer]): Path to the audio file or decoded audio.
+            cache (Optional[ResultCache]): Result cache ("embeddings" stage).
+            content (Optional[str]): Digest of the audio (computed for files; without it nothing is reused).
+            cancel (Optional[threading.Event]): Job cancel event, passed to extract.
+        Returns:
+            Dict[str, Any]: Features as returned by extract.
+        """
+        if content is None and isinstance(audio_path, str):
+            content = file_digest(audio_path)
+        if content is None:
+            return self.extract(audio_path, cancel)
+        with self._features_lock:
+            if content in self._features:
+                self._features.move_to_end(content)
+                logger.info(f"Reusing speaker embeddings ({content[:12]})")
+                return self._features[content]
+        if cache is not None:
+            params = {"model": self.model_name}
+            features = cache.get_or_compute("embeddings", content, params, lambda: self.extract(audio_path, cancel))
+        else:
+            features = self.extract(audio_path, cancel)
+        with self._features_lock:
+            self._features[content] = features
+            while len(self._features) > self.max_features:
+                self._features.popitem(last=False)
+        return features
+
+    def extract(self, audio_path: Union[str, AudioBuffer], cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Run the neural part of the pyannote 3.1 pipeline: segmentation, instantaneous speaker count and
+        speaker embeddings per chunk and local speaker.
+        Args:
+            audio_path (Union[str, AudioBuffer]): Path to the audio file or decoded audio.
+            cancel (Optional[threading.Event]): Job cancel event, checked after every inference batch.
+        Returns:
+            Dict[str, Any]: Keys 'segmentations', 'binarized', 'count' (SlidingWindowFeature) and
+                'embeddings' (np.ndarray of shape (chunks, local speakers, dimension), None when nobody speaks).
+        """
+        if isinstance(audio_path, AudioBuffer):
+            waveform, sample_rate = audio_path.as_tensor(), audio_path.sample_rate
+        else:
+            waveform, sample_rate = self.audio(audio_path)
+        pipeline = self.pipeline
+        file = {"waveform": waveform, "sample_rate": sample_rate, "uri": "audio"}
+        hook = pipeline.setup_hook(file, hook=_cancel_hook(cancel))
+        with self._inference_lock, torch.inference_mode():
+            segmentations = pipeline.get_segmentations(file, hook=hook)
+            if pipeline._segmentation.model.specifications.powerset:
+                binarized = segmentations
+            else:
+                from pyannote.audio.utils.signal import binarize
+
+                binarized = binarize(segmentations, onset=pipeline.segmentation.threshold, initial_state=False)
+            count = pipeline.speaker_count(binarized, pipeline._segmentation.model._receptive_field, warm_up=(0.0, 0.0))
+            embeddings = None
+            if np.nanmax(count.data) > 0:
+                embeddings = pipeline.get_embeddings(
+                    file, binarized, exclude_overlap=pipeline.embedding_exclude_overlap, hook=hook
+                )
+        return {"segmentations": segmentations, "binarized": binarized, "count": count, "embeddings": embeddings}
+
+    def cluster(
+        self,
+        features: Dict[str, Any],
+        num_speakers: Optional[int] = None,
+        min_speakers: Optional[int] = None,
+        max_speakers: Optional[int] = None,
+    ) -> Any:
+        """
+        Cluster extracted embeddings into speakers (no neural model runs here).
+        Mirrors the second half of pyannote's SpeakerDiarization.apply.
+        Args:
+            features (Dict[str, Any]): Features from extract (not modified).
+            num_speakers (Optional[int]): Number of speakers (None or 0 to estimate it).
+            min_speakers (Optional[int]): Lower bound of the estimated number of speakers.
+            max_speakers (Optional[int]): Upper bound of the estimated number of speakers.
+        Returns:
+            Any: Diarization result (pyannote.core.Annotation) with labels SPEAKER_00, SPEAKER_01, ...
+        """
+        pipeline = self.pipeline
+        num_speakers, min_speakers, max_speakers = pipeline.set_num_speakers(
+            num_speakers=_bound(num_speakers), min_speakers=_bound(min_speakers), max_speakers=_bound(max_speakers)
+        )
+        if features["embeddings"] is None:
+            return Annotation(uri="audio")
+        binarized = features["binarized"]
+        hard_clusters, _, _ = pipeline.clustering(
+            embeddings=features["embeddings"],
+            segmentations=binarized,
+            num_clusters=num_speakers,
+            min_clusters=min_speakers,
+            max_clusters=max_speakers,
+            frames=pipeline._segmentation.model._receptive_field,
+        )
+        found = int(np.max(hard_clusters)) + 1
+        logger.info(f"Clustered {found} speakers (requested {num_speakers or f'{min_speakers}-{max_speakers}'})")
+        # The segmentation may overcount simultaneous speakers; cap by the upper bound (on a copy)
+        count = features["count"]
+        count = SlidingWindowFeature(np.minimum(count.data, max_speakers).astype(np.int8), count.sliding_window)
+        hard_clusters[np.sum(binarized.data, axis=1) == 0] = -2
+        discrete = pipeline.reconstruct(features["segmentations"], hard_clusters, count)
+        diarization = pipeline.to_annotation(
+            discrete, min_duration_on=0.0, min_duration_off=pipeline.segmentation.min_duration_off
+        )
+        diarization.uri = "audio"
+        return diarization.rename_labels(
+            {label: expected for label, expected in zip(diarization.labels(), pipeline.classes())}
+        )
+
+    def diarize_windowed(
+        self,
+        audio_path: Union[str, AudioBuffer],
+        num_speakers: Optional[int],
+        window: float = 600.0,
+        overlap: float = 30.0,
+        threshold: float = 0.5,
+        min_speakers: Optional[int] = None,
+        max_speakers: Optional[int] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Any:
+        """
+        Diarize a long recording in overlapping windows with bounded memory.
+        Each window is diarized separately and returns one embedding per local speaker; local speakers
+        are linked to global speakers by incremental centroid clustering (falling back to the overlap
+        with the previous window when a speaker has too little speech for an embedding). Windows hand
+        over at the middle of their overlap. Only one window of audio is in memory when the input is a
+        WAV file or a memory-mapped buffer.
+        Args:
+            audio_path (Union[str, AudioBuffer]): Path to a mono WAV file or decoded audio.
+            num_speakers (Optional[int]): Number of speakers (upper bound per window and in total; None or 0
+                to estimate it).
+            window (float): Window length in seconds.
+            overlap (float): Overlap between consecutive windows in seconds.
+            threshold (float): Minimum cosine similarity for linking a speaker to a known one.
+            min_speakers (Optional[int]): Lower bound per window when the number of speakers is estimated.
+            max_speakers (Optional[int]): Upper bound when the number of speakers is estimated.
+            cancel (Optional[threading.Event]): Job cancel event, checked between windows and inference batches.
+        Returns:
+            Any: Diarization result (pyannote.core.Annotation) in global time.
+        """
+        source = audio_path
+
+        def load(start: Optional[float], end: Optional[float]) -> AudioBuffer:
+            if isinstance(source, AudioBuffer):
+                return source.slice(start, end)
+            return AudioBuffer.from_wav(source, start, end)
+
+        duration = source.duration if isinstance(source, AudioBuffer) else wav_duration(source)
+        windows = plan_windows(duration, window, overlap)
+        limit = _bound(num_speakers) or _bound(max_speakers)
+        if len(windows) == 1:
+            return self.diarize(
+                load(None, None), num_speakers, min_speakers=min_speakers, max_speakers=max_speakers, cancel=cancel
+            )
+        logger.info(f"Windowed diarization: {len(windows)} windows of {window:.0f}s")
+
+        linker = SpeakerLinker(threshold, max_speakers=limit)
+        result = Annotation()
+        previous: Optional[Annotation] = None
+        kwargs: Dict[str, Any] = {"max_speakers": limit} if limit else {}
+        lower = _bound(min_speakers)
+        if lower and not _bound(num_speakers):
+            kwargs["min_speakers"] = min(lower, limit) if limit else lower
+        if cancel is not None:
+            kwargs["hook"] = _cancel_hook(cancel)
+        for index, ((start, end), (keep_start, keep_end)) in enumerate(zip(windows, window_cuts(windows))):
+            check_cancelled(cancel)
+            chunk = load(start, end)
+            with self._inference_lock, torch.inference_mode():
+                local, embeddings = self.pipeline(
+                    {"waveform": chunk.as_tensor(), "sample_rate": chunk.sample_rate}, return_embeddings=True, **kwargs
+                )
+            labels = local.labels()
+            shifted = Annotation()
+            for segment, track, label in local.itertracks(yield_label=True):
+                shifted[Segment(segment.start + start, segment.end + start), track] = label
+
+            fallback: Dict[int, int] = {}
+            if previous is not None:
+                mapping = overlap_mapping(previous, shifted, start, windows[index - 1][1])
+                fallback = {i: mapping[label] for i, label in enumerate(labels) if label in mapping}
+            rows = np.full((len(labels), embeddings.shape[1]), np.nan)
+            rows[: min(len(labels), len(embeddings))] = embeddings[: len(labels)]
+            indices = linker.link(rows, [local.label_duration(label) for label in labels], fallback)
+            global_labels = dict(zip(labels, indices))
+
+            # Global-label copy of the part shared with the next window, for the overlap fallback
+            tail = Segment(windows[index + 1][0], end) if index + 1 < len(windows) else None
+            previous = Annotation()
+            for segment, _, label in shifted.itertracks(yield_label=True):
+                if global_labels[label] < 0:
+                    # Too little speech for an embedding and no overlap with a known speaker
+                    continue
+                if tail is not None and segment & tail:
+                    previous[segment & tail] = global_labels[label]
+                kept = segment & Segment(keep_start, keep_end)
+                if kept:
+                    result[kept] = global_labels[label]
+            del chunk, local, embeddings
+
+        result = result.support()
+        return result.rename_labels({label: f"SPEAKER_{label:02d}" for label in result.labels()})
@@ -1,10 +1,15 @@
 import os
 from code.audio_export import AudioProcessor
-from typing import List, Optional, Tuple
-
-import torch
+from code.buffer_store import buffer_store
+from code.jobs import Job, job_manager
+from code.result_cache import result_cache
+from code.scratch import scratch_store
+from code.startup import prewarmer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "..", "prompts")
+# Format of the audio preview sent to the browser (see code.audio_export.PREVIEW_FORMATS)
+PREVIEW_FORMAT = os.environ.get("PREVIEW_FORMAT", "mp3")
 
 
 def list_prompts() -> List[str]:
@@ -26,45 +31,81 @@ def add_prompt_to_text(prompt: str, text: str) -> str:
     return prompt + "\n" + text
 
 
-def extract_audio_from_video(video_path: str) -> Tuple[Optional[str], str]:
-    """Extract audio from video file and return audio path and status message."""
+def extract_audio_from_video(video_path: str, owner: str = "default") -> Tuple[Optional[str], Optional[str], str]:
+    """
+    Decode the audio of a video in one ffmpeg pass: the PCM goes to the buffer store of the owner and a
+    compressed preview to its scratch store. Returns the preview path, the buffer id and a status message.
+    """
     if not video_path:
-        return None, "❌ No video file uploaded."
+        return None, None, "❌ No video file uploaded."
     try:
-        processor = AudioProcessor(video_path)
-        audio_path = processor.get_audio()
-        return audio_path, f"✅ Audio extracted"
+        processor = AudioProcessor(video_path, cache=result_cache, owner=owner)
+        buffer, preview_path = processor.ingest(PREVIEW_FORMAT)
+        return preview_path, buffer_store.put(owner, buffer), f"✅ Audio extracted"
     except Exception as e:
-        return None, f"❌ Error: {e}"
+        return None, None, f"❌ Error: {e}"
 
 
-def cut_audio(audio_path: str, start: float, end: float) -> Tuple[Optional[str], str]:
-    """Cut audio by interval and return cut audio path and status message."""
-    if not audio_path:
-        return None, "❌ No audio file to cut."
+def cut_audio(buffer_id: str, start: float, end: float, owner: str = "default") -> Tuple[Optional[str], str]:
+    """Write an interval of the extracted audio to the owner's scratch store; return its path and a status message."""
+    buffer = buffer_store.get(buffer_id)
+    if buffer is None:
+        return None, "❌ No audio to cut, extract the audio first."
     try:
         if start is None or end is None:
-            return audio_path, "⚠️ Interval not set, using full audio."
-        processor = AudioProcessor("")
-        processor.audio_path = audio_path
-        cut_path = processor.cut_audio(float(start), float(end))
-        return cut_path, f"✅ Audio cut"
+            return None, "⚠️ Interval not set, using full audio."
+        cut = buffer.slice(float(start), float(end))
+        cut_path = scratch_store.new_path(owner, size_hint=len(cut.samples) * 2)
+        try:
+            cut.write_wav(cut_path)
+        except BaseException:
+            scratch_store.discard(cut_path)
+            raise
+        return scratch_store.commit(cut_path), f"✅ Audio cut"
     except Exception as e:
         return None, f"❌ Error: {e}"
 
 
+def format_partial_transcript(segments: List[Dict[str, Any]]) -> str:
+    """Format transcription segments without speakers, one line per segment with its start time."""
+    lines = []
+    for seg in segments:
+        minutes, seconds = divmod(int(seg["start"]), 60)
+        lines.append(f"[{minutes:02d}:{seconds:02d}] {seg['text'].strip()}")
+    return "\n".join(lines)
+
+
+def format_speaker_transcript(merged: Iterable[Dict[str, Any]]) -> str:
+    """Format merged segments (a list or a lazy iterator such as Transcript.iter_merged()) as speaker lines."""
+    return "\n".join(f"Speaker {seg['speaker']}: {seg['text']}" for seg in merged)
+
+
+def format_timings(
+    timings: Dict[str, float], audio_seconds: Optional[float] = None, speakers: Optional[int] = None
+) -> str:
+    """Format pipeline stage timings (and the real-time factor when the audio duration is given) as a status message."""
+    stages = {"transcribe": "transcription", "diarize": "diarization"}
+    details = ", ".join(f"{label} {timings[name]:.1f}s" for name, label in stages.items() if name in timings)
+    speed = f", x{audio_seconds / timings['total']:.1f} real time" if audio_seconds and timings["total"] > 0 else ""
+    found = f", {speakers} speakers" if speakers is not None else ""
+    return f"✅ Done in {timings['total']:.1f}s ({details}{speed}){found}"
+
+
+def format_job_status(job: Job, message: str = "") -> str:
+    """Format the queue position of a waiting job, or the message of a running one, with the ETA if known."""
+    eta = job_manager.eta(job)
+    eta_text = f", about {eta:.0f}s left" if eta is not None else ""
+    if job.state == "queued":
+        return f"⏳ Queued: position {job_manager.position(job)}{eta_text}"
+    return f"{message} ({eta_text[2:]})" if eta_text else message
+
+
 def get_device_name() -> str:
-    """Return device type and name (CPU or CUDA + GPU name)"""
-    if torch.cuda.is_available():
-        name = torch.cuda.get_device_name(0)
-        return f"CUDA ({name})"
-    else:
-        return "CPU"
-
-
-def get_device() -> str:
-    """Return device type (CPU or CUDA)"""
-    if torch.cuda.is_available():
-        return "cuda"
-    else:
-        return "cpu"
+    """Return device type and name (CPU or CUDA + GPU name), waiting for the background device probe"""
+    prewarmer.get_device()
+    return prewarmer.device_name
+
+
+def get_startup_status() -> str:
+    """Return device and model readiness, per-device jobs and memory and the job queue as Markdown"""
+    return "  \n".join(filter(None, [prewarmer.status_markdown(), job_manager.status_markdown()]))
@@ -0,0 +1,87 @@
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+
+# Inference settings per deployment profile. compute_type None means the device default
+# (float16 on CUDA, float32 on CPU); "int8" applies dynamic quantization of the Whisper linear layers
+# on CPU. compile wraps the Whisper encoder and the pyannote segmentation model with torch.compile.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {"compute_type": None, "compile": False},
+    "cpu-int8": {"compute_type": "int8", "compile": False},
+    "cpu-compiled": {"compute_type": "float32", "compile": True},
+    "cpu-int8-compiled": {"compute_type": "int8", "compile": True},
+}
+
+
+def get_profile(name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Return the settings of an inference profile.
+    Args:
+        name (Optional[str]): Profile name (default: CPU_PROFILE environment variable, or "default").
+    Returns:
+        Dict[str, Any]: Profile settings.
+    """
+    name = name or os.environ.get("CPU_PROFILE", "default")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown inference profile '{name}', expected one of {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def thread_counts(jobs: int = 1, cores: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Size torch thread pools for a number of concurrent inference jobs in one process.
+    Args:
+        jobs (int): Inference calls running at the same time (e.g. 2 when Whisper and pyannote overlap).
+        cores (Optional[int]): Available cores (default: CPU affinity of the process).
+    Returns:
+        Tuple[int, int]: Intra-op and inter-op thread counts.
+    """
+    if cores is None:
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    jobs = max(1, jobs)
+    return max(1, cores // jobs), max(1, min(jobs, cores))
+
+
+def configure_threads(jobs: int = 1, cores: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Set torch intra-op and inter-op threads for a number of concurrent jobs (TORCH_THREADS overrides
+    the intra-op count). Inter-op threads can only be set before the first parallel torch operation;
+    later calls keep the current value.
+    Args:
+        jobs (int): Inference calls running at the same time.
+        cores (Optional[int]): Available cores.
+    Returns:
+        Tuple[int, int]: Intra-op and inter-op thread counts in effect.
+    """
+    import torch
+
+    intra, inter = thread_counts(jobs, cores)
+    intra = int(os.environ.get("TORCH_THREADS", intra))
+    torch.set_num_threads(intra)
+    try:
+        torch.set_num_interop_threads(inter)
+    except RuntimeError:
+        inter = torch.get_num_interop_threads()
+    logger.info(f"Torch threads: {intra} intra-op, {inter} inter-op for {jobs} concurrent job(s)")
+    return intra, inter
+
+
+def compile_module(module: Any) -> Any:
+    """
+    Wrap a module with torch.compile, returning it unchanged when compilation is not available.
+    Args:
+        module (Any): torch.nn.Module to compile.
+    Returns:
+        Any: Compiled (or original) module.
+    """
+    import torch
+
+    if not hasattr(torch, "compile"):
+        logger.warning("torch.compile is not available in this torch version, running eagerly")
+        return module
+    try:
+        return torch.compile(module)
+    except Exception as e:
+        logger.warning(f"torch.compile failed, running eagerly: {e}")
+        return module
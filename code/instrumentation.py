@@ -0,0 +1,318 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import ModuleType
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from loguru import logger
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Per-job JSON goes to METRICS_DIR; PROFILE=cprofile|torch enables tracing; METRICS_PORT serves Prometheus text
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join("out", "metrics"))
+PROFILE = os.environ.get("PROFILE") or None
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+
+def current_rss() -> int:
+    """Return the current resident set size of the process in bytes (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def _cuda() -> Optional[ModuleType]:
+    # torch.cuda when torch is already loaded and sees a GPU, instrumentation must not import it
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return torch.cuda
+
+
+def _cuda_counters(cuda: Optional[ModuleType]) -> Tuple[int, int]:
+    # (allocated now, process-wide high-water mark), summed over the visible devices
+    if cuda is None:
+        return 0, 0
+    devices = range(cuda.device_count())
+    return sum(cuda.memory_allocated(d) for d in devices), sum(cuda.max_memory_allocated(d) for d in devices)
+
+
+class _MemorySampler:
+    """
+    Polls the process RSS and allocated CUDA memory in a background thread and keeps the maxima.
+
+    The CUDA peak counters are never reset (they are shared by every job in the process). The exact
+    high-water mark is used when it rose while sampling; otherwise the sampled maximum is reported,
+    which can miss allocations shorter than the polling interval.
+    """
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.peak = current_rss()
+        self._cuda = _cuda()
+        self.cuda_peak, self._cuda_high_start = _cuda_counters(self._cuda)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+
+    def __enter__(self) -> "_MemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        _, high = _cuda_counters(self._cuda)
+        if high > self._cuda_high_start:
+            # The process-wide peak was reached during this stage
+            self.cuda_peak = max(self.cuda_peak, high)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        self.peak = max(self.peak, current_rss())
+        if self._cuda is not None:
+            self.cuda_peak = max(self.cuda_peak, _cuda_counters(self._cuda)[0])
+
+
+class JobMetrics:
+    """
+    Per-job record of pipeline stages: wall time, CPU time, peak RSS and real-time factor (audio
+    seconds per processing second) and peak allocated CUDA memory; the job's CUDA peak is the
+    maximum over its stages.
+
+    CPU time and CUDA memory are process-wide, so stages and jobs that run concurrently (the
+    transcription and diarization stages, the app's jobs) each include the others' usage. The CUDA
+    peak is sampled (see _MemorySampler) and can miss allocations shorter than the polling interval.
+    With profile="cprofile" every stage writes a cProfile dump; with profile="torch" the whole job
+    is traced with the torch profiler (see trace()).
+    """
+
+    def __init__(
+        self,
+        job_id: Optional[str] = None,
+        audio_seconds: Optional[float] = None,
+        profile: Optional[str] = PROFILE,
+        profile_dir: str = os.path.join("out", "profiles"),
+    ) -> None:
+        """
+        Args:
+            job_id (Optional[str]): Job identifier (random if not given).
+            audio_seconds (Optional[float]): Duration of the processed audio.
+            profile (Optional[str]): None, "cprofile" or "torch" (default: PROFILE environment variable).
+            profile_dir (str): Directory for profiler output.
+        """
+        self.job_id = job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+        self.audio_seconds = audio_seconds
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.stages: List[Dict[str, Any]] = []
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, audio_seconds: Optional[float] = None, profile: bool = True) -> Iterator[None]:
+        """
+        Measure a pipeline stage.
+        Args:
+            name (str): Stage name.
+            audio_seconds (Optional[float]): Audio duration handled by the stage (for the real-time factor).
+            profile (bool): Allow cProfile for this stage (disable for stages spanning generator yields).
+        """
+        audio_seconds = audio_seconds if audio_seconds is not None else self.audio_seconds
+        profiler = cProfile.Profile() if profile and self.profile == "cprofile" else None
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        error: Optional[str] = None
+        with _MemorySampler() as memory:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield
+            except BaseException as e:
+                error = repr(e)
+                raise
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                wall = time.perf_counter() - wall_start
+                record: Dict[str, Any] = {
+                    "stage": name,
+                    "wall_seconds": wall,
+                    "cpu_seconds": time.process_time() - cpu_start,
+                }
+        record["peak_rss_bytes"] = memory.peak
+        if memory.cuda_peak:
+            record["peak_cuda_bytes"] = memory.cuda_peak
+        if audio_seconds:
+            record["audio_seconds"] = audio_seconds
+            record["rtf"] = audio_seconds / wall if wall > 0 else None
+        if error:
+            record["error"] = error
+        if profiler is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.profile_dir, f"{self.job_id}_{name}.prof"))
+        with self._lock:
+            self.stages.append(record)
+
+    @contextmanager
+    def trace(self) -> Iterator[None]:
+        """Trace the enclosed block with the torch profiler when profile="torch" (Chrome trace JSON)."""
+        if self.profile != "torch":
+            yield
+            return
+        import torch
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+            yield
+        os.makedirs(self.profile_dir, exist_ok=True)
+        prof.export_chrome_trace(os.path.join(self.profile_dir, f"{self.job_id}_trace.json"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the job metrics as a JSON-serializable dict."""
+        wall = time.perf_counter() - self._start
+        result: Dict[str, Any] = {
+            "job_id": self.job_id,
+            "started": self.started,
+            "wall_seconds": wall,
+            "stages": list(self.stages),
+        }
+        cuda_peaks = [stage["peak_cuda_bytes"] for stage in result["stages"] if "peak_cuda_bytes" in stage]
+        if cuda_peaks:
+            result["peak_cuda_bytes"] = max(cuda_peaks)
+        if self.audio_seconds:
+            result["audio_seconds"] = self.audio_seconds
+            result["rtf"] = self.audio_seconds / wall if wall > 0 else None
+        return result
+
+    def finish(self, output_dir: Optional[str] = METRICS_DIR) -> Dict[str, Any]:
+        """
+        Complete the job: write <job_id>.json to output_dir and add the stages to the shared registry.
+        Args:
+            output_dir (Optional[str]): Directory for per-job JSON (None to skip writing).
+        Returns:
+            Dict[str, Any]: Job metrics.
+        """
+        data = self.to_dict()
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            with open(os.path.join(output_dir, f"{self.job_id}.json"), "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+        metrics_registry.record(data)
+        logger.info(
+            f"Job {self.job_id}: "
+            + ", ".join(
+                f"{s['stage']} {s['wall_seconds']:.2f}s" + (f" (x{s['rtf']:.1f} real time)" if s.get("rtf") else "")
+                for s in data["stages"]
+            )
+        )
+        return data
+
+
+class MetricsRegistry:
+    """Process-wide aggregate of finished jobs, rendered in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.stage_count: Dict[str, int] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_audio_seconds: Dict[str, float] = {}
+        self.stage_peak_rss: Dict[str, int] = {}
+        self.stage_last_rtf: Dict[str, float] = {}
+
+    def record(self, job: Dict[str, Any]) -> None:
+        """
+        Add a finished job.
+        Args:
+            job (Dict[str, Any]): Output of JobMetrics.to_dict().
+        """
+        with self._lock:
+            self.jobs += 1
+            for stage in job["stages"]:
+                name = stage["stage"]
+                self.stage_count[name] = self.stage_count.get(name, 0) + 1
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + stage["wall_seconds"]
+                self.stage_audio_seconds[name] = self.stage_audio_seconds.get(name, 0.0) + stage.get(
+                    "audio_seconds", 0.0
+                )
+                self.stage_peak_rss[name] = max(self.stage_peak_rss.get(name, 0), stage["peak_rss_bytes"])
+                if stage.get("rtf"):
+                    self.stage_last_rtf[name] = stage["rtf"]
+
+    def render_prometheus(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# TYPE interview_parser_jobs_total counter",
+                f"interview_parser_jobs_total {self.jobs}",
+            ]
+            series: List[Tuple[str, str, Mapping[str, float]]] = [
+                ("stage_runs_total", "counter", self.stage_count),
+                ("stage_seconds_total", "counter", self.stage_seconds),
+                ("stage_audio_seconds_total", "counter", self.stage_audio_seconds),
+                ("stage_peak_rss_bytes", "gauge", self.stage_peak_rss),
+                ("stage_last_rtf", "gauge", self.stage_last_rtf),
+            ]
+            for name, kind, values in series:
+                lines.append(f"# TYPE interview_parser_{name} {kind}")
+                for stage, value in sorted(values.items()):
+                    lines.append(f'interview_parser_{name}{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serve the Prometheus metrics at http://host:port/metrics from a daemon thread.
+    Args:
+        port (int): Port to listen on.
+        host (str): Interface to bind.
+    Returns:
+        ThreadingHTTPServer: Running server.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics_registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+    return server
+
+
+def stage_or_null(
+    metrics: Optional[JobMetrics], name: str, audio_seconds: Optional[float] = None, profile: bool = True
+) -> Any:
+    """Return metrics.stage(...) or a no-op context when metrics are disabled."""
+    return metrics.stage(name, audio_seconds, profile) if metrics is not None else nullcontext()
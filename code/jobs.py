@@ -0,0 +1,289 @@
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled."""
+
+
+class QueueFull(RuntimeError):
+    """Raised when a job is submitted while the queue is at its limit."""
+
+
+def check_cancelled(cancel: Optional[threading.Event]) -> None:
+    """
+    Cancellation point for long-running loops: raise if the job's cancel event is set.
+    Args:
+        cancel (Optional[threading.Event]): Cancel event of the job (None if the work cannot be cancelled).
+    """
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled("Job cancelled")
+
+
+def parse_limits(value: str) -> Dict[str, int]:
+    """
+    Parse per-model concurrency limits, e.g. "large-v3=1,medium=2".
+    Args:
+        value (str): Comma-separated model=limit pairs.
+    Returns:
+        Dict[str, int]: Limit per Whisper model name.
+    """
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, limit = item.split("=", 1)
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class Job:
+    """
+    One transcription request in the JobManager.
+
+    Attributes:
+        id (str): Job id.
+        model (str): Whisper model ("draft+refine" for tiered transcription).
+        audio_seconds (float): Length of the audio to process.
+        owner (str): UI session that submitted the job.
+        state (str): "queued", "running", "done", "failed" or "cancelled".
+        cancel_event (threading.Event): Set when the job is cancelled; checked by the pipeline loops.
+    """
+
+    def __init__(self, model: str, audio_seconds: float, owner: str) -> None:
+        self.id = uuid.uuid4().hex[:8]
+        self.model = model
+        self.audio_seconds = audio_seconds
+        self.owner = owner
+        self.state = "queued"
+        self.cancel_event = threading.Event()
+        self.submitted = time.perf_counter()
+        self.started: Optional[float] = None
+
+    @property
+    def models(self) -> List[str]:
+        return self.model.split("+")
+
+    def cancel(self) -> None:
+        """Request cancellation; a queued job leaves the queue, a running one stops at its next check."""
+        self.cancel_event.set()
+
+    def check(self) -> None:
+        """Raise JobCancelled if the job has been cancelled."""
+        check_cancelled(self.cancel_event)
+
+
+class JobManager:
+    """
+    Admission control for transcription jobs in the app.
+
+    Every Whisper model runs at most limits[model] jobs at once (a tiered job holds a slot of both of
+    its models); further jobs wait in a FIFO queue, which is bounded by max_queued. Queue positions
+    and ETAs come from a moving average of the measured real-time factor (processing seconds per
+    audio second) of every job model, keyed like Job.model ("draft+refine" is measured on its own).
+    Device placement is left to the device scheduler.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        default_limit: int = 1,
+        max_queued: int = 16,
+        smoothing: float = 0.3,
+    ) -> None:
+        """
+        Args:
+            limits (Optional[Dict[str, int]]): Concurrent jobs per Whisper model.
+            default_limit (int): Concurrent jobs for models without a limit.
+            max_queued (int): Waiting jobs accepted before submit raises QueueFull (0 means unlimited).
+            smoothing (float): Weight of the latest job in the real-time factor average.
+        """
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.max_queued = max_queued
+        self.smoothing = smoothing
+        self.rtf: Dict[str, float] = {}
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, int] = {}
+        self._condition = threading.Condition()
+
+    def limit(self, model: str) -> int:
+        """Return the number of concurrent jobs allowed for a Whisper model."""
+        return self.limits.get(model, self.default_limit)
+
+    def submit(self, model: str, audio_seconds: float, owner: str = "") -> Job:
+        """
+        Queue a job.
+        Args:
+            model (str): Whisper model ("draft+refine" for tiered transcription).
+            audio_seconds (float): Length of the audio to process.
+            owner (str): UI session submitting the job.
+        Returns:
+            Job: Queued job; call wait() to be admitted and finish() when it ends.
+        """
+        with self._condition:
+            queued = sum(1 for job in self._jobs.values() if job.state == "queued")
+            if self.max_queued and queued >= self.max_queued:
+                raise QueueFull(f"{queued} jobs are waiting already, try again later")
+            job = Job(model, audio_seconds, owner)
+            self._jobs[job.id] = job
+        logger.info(f"Queued job {job.id} ({model}, {audio_seconds:.0f}s of audio)")
+        return job
+
+    def wait(self, job: Job, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the job may run.
+        Args:
+            job (Job): Queued job.
+            timeout (Optional[float]): Seconds to wait (None waits until admitted).
+        Returns:
+            bool: True once the job is running, False on timeout.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._condition:
+            while not self._admit(job):
+                job.check()
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Wake up periodically to notice cancellation, which does not notify the condition
+                self._condition.wait(1.0 if remaining is None else min(remaining, 1.0))
+        return True
+
+    def finish(self, job: Job, state: str = "done") -> None:
+        """
+        Remove a job and free its slots; a completed job updates the real-time factor of its model.
+        Args:
+            job (Job): Job from submit.
+            state (str): Final state ("done", "failed" or "cancelled").
+        """
+        with self._condition:
+            if self._jobs.pop(job.id, None) is None:
+                return
+            if job.state == "running":
+                for model in job.models:
+                    self._active[model] = max(0, self._active.get(model, 0) - 1)
+                if state == "done" and job.started is not None and job.audio_seconds > 0:
+                    rtf = (time.perf_counter() - job.started) / job.audio_seconds
+                    previous = self.rtf.get(job.model)
+                    self.rtf[job.model] = rtf if previous is None else previous + self.smoothing * (rtf - previous)
+            job.state = state
+            self._condition.notify_all()
+        logger.info(f"Job {job.id} {state}")
+
+    def cancel(self, job_id: str) -> None:
+        """Cancel a job by id (no effect for unknown jobs)."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def cancel_owner(self, owner: str) -> int:
+        """
+        Cancel all jobs of a UI session (e.g. when the client disconnects).
+        Args:
+            owner (str): Session id.
+        Returns:
+            int: Number of jobs cancelled.
+        """
+        with self._condition:
+            jobs = [job for job in self._jobs.values() if job.owner == owner]
+        for job in jobs:
+            job.cancel()
+        if jobs:
+            logger.info(f"Cancelled {len(jobs)} job(s) of session {owner}")
+        return len(jobs)
+
+    def position(self, job: Job) -> int:
+        """Return the 1-based position among the queued jobs competing for the same models (0 when running)."""
+        with self._condition:
+            if job.state != "queued":
+                return 0
+            return 1 + len(self._ahead(job, queued_only=True))
+
+    def eta(self, job: Job) -> Optional[float]:
+        """
+        Estimate the seconds until the job has finished.
+        Queued jobs wait for the remaining work of the jobs ahead of them on the same models, shared
+        among the model's slots.
+        Args:
+            job (Job): Queued or running job.
+        Returns:
+            Optional[float]: Seconds, or None before a job of every involved model has finished.
+        """
+        with self._condition:
+            own = self._remaining(job)
+            if own is None:
+                return None
+            if job.state != "queued":
+                return own
+            ahead = 0.0
+            for other in self._ahead(job, queued_only=False):
+                seconds = self._remaining(other)
+                if seconds is None:
+                    return None
+                ahead += seconds
+            return own + ahead / min(self.limit(model) for model in job.models)
+
+    def status_markdown(self) -> str:
+        """Return the running and queued jobs per model and the measured speed per job model as Markdown."""
+        with self._condition:
+            jobs = list(self._jobs.values())
+            rtfs = dict(self.rtf)
+        models = sorted({model for job in jobs for model in job.models})
+        lines = []
+        for model in models:
+            running = sum(1 for job in jobs if job.state == "running" and model in job.models)
+            queued = sum(1 for job in jobs if job.state == "queued" and model in job.models)
+            lines.append(f"**{model}:** {running}/{self.limit(model)} running, {queued} queued")
+        # Speeds are measured per job model, so a tiered "draft+refine" job has its own entry
+        speeds = ", ".join(f"{model} x{1 / rtf:.1f}" for model, rtf in sorted(rtfs.items()) if rtf > 0)
+        if speeds:
+            lines.append(f"**Real time:** {speeds}")
+        return "  \n".join(lines)
+
+    def _admit(self, job: Job) -> bool:
+        # Called with the condition held. Strict FIFO per model: earlier queued jobs go first
+        if job.state == "running":
+            return True
+        if self._ahead(job, queued_only=True):
+            return False
+        if any(self._active.get(model, 0) >= self.limit(model) for model in job.models):
+            return False
+        for model in job.models:
+            self._active[model] = self._active.get(model, 0) + 1
+        job.state = "running"
+        job.started = time.perf_counter()
+        logger.info(f"Started job {job.id} after {job.started - job.submitted:.1f}s in the queue")
+        return True
+
+    def _ahead(self, job: Job, queued_only: bool) -> List[Job]:
+        # Jobs submitted before job that share a model with it (dicts keep the submission order)
+        ahead = []
+        for other in self._jobs.values():
+            if other is job:
+                break
+            if (other.state == "queued" or not queued_only) and set(other.models) & set(job.models):
+                ahead.append(other)
+        return ahead
+
+    def _remaining(self, job: Job) -> Optional[float]:
+        rtf = self.rtf.get(job.model)
+        if rtf is None:
+            return None
+        elapsed = time.perf_counter() - job.started if job.started is not None else 0.0
+        return max(0.0, rtf * job.audio_seconds - elapsed)
+
+
+# Shared job manager of the app.
+# JOB_LIMITS sets concurrent jobs per model ("large-v3=1,medium=2"), JOB_LIMIT_DEFAULT the others,
+# JOB_MAX_QUEUED the waiting jobs accepted before new ones are rejected.
+job_manager = JobManager(
+    limits=parse_limits(os.environ.get("JOB_LIMITS", "")),
+    default_limit=int(os.environ.get("JOB_LIMIT_DEFAULT", "2")),
+    max_queued=int(os.environ.get("JOB_MAX_QUEUED", "16")),
+)
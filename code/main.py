@@ -1,50 +1,137 @@
 import os
+from code.audio_export import AudioProcessor
+from code.devices import device_scheduler
+from code.inference_profiles import PROFILES, configure_threads
+from code.instrumentation import PROFILE, JobMetrics
+from code.model_registry import get_diarizer, get_tiered_transcriber, get_transcriber
+from code.output_utils import TranscriptSaver
+from code.pipeline import PipelineRunner
+from code.result_cache import result_cache
+from code.transcript_model import Transcript
+from code.writers import WRITERS, job_output_dir
+from typing import Optional, Tuple
 
 import click
-import torch
-from audio_export import AudioProcessor
-from diarization import DiarizationPipeline
 from loguru import logger
-from output_utils import TranscriptSaver
-from transcribe import WhisperTranscriber
 
 
 @click.command()
 @click.option("--video", required=True, type=click.Path(exists=True), help="Path to video file")
 @click.option("--interval", nargs=2, type=float, required=False, help="Time interval in seconds (start end)")
-@click.option("--speakers", required=True, type=int, help="Number of speakers")
-def main(video: str, interval: tuple = None, speakers: int = 1) -> None:
+@click.option("--speakers", default=0, type=int, show_default=True, help="Number of speakers (0 = estimate)")
+@click.option("--min-speakers", type=int, help="Lower bound when the number of speakers is estimated")
+@click.option("--max-speakers", type=int, help="Upper bound when the number of speakers is estimated")
+@click.option("--model", default="base", show_default=True, help="Whisper model name")
+@click.option(
+    "--refine-model",
+    help="Tiered transcription: re-decode the low-confidence spans of the --model draft with this Whisper model",
+)
+@click.option(
+    "--long-form",
+    is_flag=True,
+    help="Long recording: transcribe chunks in parallel and diarize in windows with bounded memory",
+)
+@click.option("--no-cache", is_flag=True, help="Do not read or write cached stage results")
+@click.option(
+    "--profile", type=click.Choice(["cprofile", "torch"]), default=PROFILE, help="Write profiler traces for this run"
+)
+@click.option(
+    "--cpu-profile",
+    type=click.Choice(list(PROFILES)),
+    default="default",
+    envvar="CPU_PROFILE",
+    show_default=True,
+    help="Inference profile on CPU (int8 quantization, torch.compile)",
+)
+@click.option(
+    "--formats",
+    multiple=True,
+    type=click.Choice(list(WRITERS)),
+    default=["txt"],
+    show_default=True,
+    help="Transcript formats to write (repeat the option for several)",
+)
+@click.option("--out-dir", default="out", show_default=True, help="Parent directory of the per-run output directory")
+def main(
+    video: str,
+    interval: Optional[Tuple[float, float]] = None,
+    speakers: int = 0,
+    min_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None,
+    model: str = "base",
+    refine_model: Optional[str] = None,
+    long_form: bool = False,
+    no_cache: bool = False,
+    profile: Optional[str] = None,
+    cpu_profile: str = "default",
+    formats: tuple = ("txt",),
+    out_dir: str = "out",
+) -> None:
     """
     Main entry point for the CLI tool.
     Args:
         video (str): Path to video file.
         interval (tuple, optional): Time interval (start, end) in seconds.
-        speakers (int): Number of speakers.
+        speakers (int): Number of speakers (0 to estimate it).
+        min_speakers (int, optional): Lower bound of the estimated number of speakers.
+        max_speakers (int, optional): Upper bound of the estimated number of speakers.
+        model (str): Whisper model name.
+        refine_model (str, optional): Whisper model for the uncertain spans of the draft.
+        long_form (bool): Use chunked parallel transcription and windowed diarization for long recordings.
+        no_cache (bool): Disable the result cache.
+        profile (str, optional): Profiler to run ("cprofile" or "torch").
+        cpu_profile (str): Inference profile (see code.inference_profiles.PROFILES).
+        formats (tuple): Transcript formats (see code.writers.WRITERS).
+        out_dir (str): Parent directory; every run writes to its own sub-directory.
     """
     token = os.environ.get("HUGGINGFACE_TOKEN")
     if not token:
         raise RuntimeError("HUGGINGFACE_TOKEN environment variable not set")
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    logger.info(f"Using device: {device}")
+    # Whisper and pyannote go to the GPU(s) with the most free memory, or to the CPU
+    lease = device_scheduler.acquire(f"{model}+{refine_model}" if refine_model else model, diarize=True)
+    try:
+        logger.info(f"Using devices: {lease.whisper_device} (Whisper), {lease.pyannote_device} (pyannote)")
+        if lease.whisper_device == "cpu":
+            # Whisper and pyannote run concurrently and share the cores
+            configure_threads(jobs=2)
 
-    logger.info("Extracting audio from video...")
-    processor = AudioProcessor(video)
-    audio_path = processor.get_audio(interval)
+        metrics = JobMetrics(profile=profile)
+        logger.info("Extracting audio from video...")
+        cache = None if no_cache else result_cache
+        processor = AudioProcessor(video, cache=cache)
+        with metrics.stage("decode"):
+            audio = processor.get_buffer(interval)
+        metrics.audio_seconds = audio.duration
 
-    logger.info("Transcribing audio...")
-    transcriber = WhisperTranscriber(device=device)
-    transcribed = transcriber.transcribe(audio_path)
-
-    logger.info("Running diarization...")
-    diarizer = DiarizationPipeline(token, device=device)
-    diarized = diarizer.diarize(audio_path, speakers)
+        logger.info("Transcribing audio and running diarization...")
+        if refine_model:
+            transcriber = get_tiered_transcriber(model, refine_model, device=lease.whisper_device, profile=cpu_profile)
+        else:
+            transcriber = get_transcriber(model, device=lease.whisper_device, profile=cpu_profile)
+        runner = PipelineRunner(
+            transcriber,
+            get_diarizer(token, device=lease.pyannote_device, profile=cpu_profile),
+            long_form=long_form,
+            cache=cache,
+            metrics=metrics,
+        )
+        with metrics.trace():
+            result = runner.run(audio, num_speakers=speakers, min_speakers=min_speakers, max_speakers=max_speakers)
+    finally:
+        lease.release()
+    logger.info(f"Speakers found: {len(result['diarization'].labels())}")
 
     logger.info("Saving transcript...")
-    saver = TranscriptSaver("out")
-    saver.save_transcript(diarized, transcribed["segments"])
+    run_dir = job_output_dir(out_dir, os.path.splitext(os.path.basename(video))[0])
+    saver = TranscriptSaver(run_dir, formats=formats)
+    with metrics.stage("save"):
+        transcript = Transcript.from_segments(result["transcription"]["segments"]).with_speakers(result["diarization"])
+        saver.save(transcript)
+        saver.save_binary(transcript)
+    metrics.finish()
 
-    logger.info("Done!")
+    logger.info(f"Done! Transcript saved to {run_dir}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,258 @@
+import gc
+import os
+import threading
+from code.inference_profiles import get_profile
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from loguru import logger
+
+ModelKey = Tuple[Hashable, ...]
+
+
+def estimate_nbytes(obj: Any, max_depth: int = 4) -> int:
+    """
+    Estimate the memory footprint of a loaded model wrapper.
+
+    Walks the object attributes looking for torch modules and sums the size of their
+    parameters and buffers. Shared modules are counted once.
+
+    Args:
+        obj (Any): Model wrapper (e.g. WhisperTranscriber or DiarizationPipeline).
+        max_depth (int): Maximum attribute nesting depth to inspect.
+    Returns:
+        int: Estimated size in bytes (0 if torch is not available).
+    """
+    try:
+        import torch
+    except ImportError:
+        return 0
+
+    seen: set = set()
+    total = 0
+
+    def visit(value: Any, depth: int) -> None:
+        nonlocal total
+        if id(value) in seen or depth > max_depth:
+            return
+        seen.add(id(value))
+        if isinstance(value, torch.nn.Module):
+            for tensor in list(value.parameters()) + list(value.buffers()):
+                if id(tensor) not in seen:
+                    seen.add(id(tensor))
+                    total += tensor.numel() * tensor.element_size()
+            return
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                visit(item, depth + 1)
+        elif isinstance(value, dict):
+            for item in value.values():
+                visit(item, depth + 1)
+        elif hasattr(value, "__dict__") and not isinstance(value, type):
+            for item in vars(value).values():
+                visit(item, depth + 1)
+
+    visit(obj, 0)
+    return total
+
+
+class ModelRegistry:
+    """
+    Process-wide, thread-safe cache of loaded models with LRU eviction.
+
+    Models are keyed by a tuple such as (kind, model_name, device, compute_type).
+    When a memory budget is set, the least recently used models are evicted
+    until the total estimated footprint fits into the budget.
+    """
+
+    def __init__(self, budget_bytes: int = 0, size_fn: Callable[[Any], int] = estimate_nbytes) -> None:
+        """
+        Args:
+            budget_bytes (int): Memory/VRAM budget in bytes for all loaded models (0 means unlimited).
+            size_fn (Callable[[Any], int]): Function estimating the footprint of a loaded model.
+        """
+        self.budget_bytes = budget_bytes
+        self.size_fn = size_fn
+        self._models: "OrderedDict[ModelKey, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+
+    def get(self, key: ModelKey, loader: Callable[[], Any]) -> Any:
+        """
+        Return the model stored under key, loading it with loader on a miss.
+        Concurrent requests for the same key wait for a single load.
+        Args:
+            key (ModelKey): Registry key.
+            loader (Callable[[], Any]): Function that loads the model.
+        Returns:
+            Any: Loaded model.
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key][0]
+            logger.info(f"Loading model {key}...")
+            model = loader()
+            size = self.size_fn(model)
+            with self._lock:
+                self._models[key] = (model, size)
+                self._load_locks.pop(key, None)
+                self._evict_over_budget(keep=key)
+            return model
+
+    def evict(self, key: ModelKey) -> bool:
+        """
+        Remove a model from the registry.
+        Args:
+            key (ModelKey): Registry key.
+        Returns:
+            bool: True if the model was loaded and has been evicted.
+        """
+        with self._lock:
+            found = self._models.pop(key, None) is not None
+        if found:
+            self._release_memory()
+        return found
+
+    def clear(self) -> None:
+        """Remove all models from the registry."""
+        with self._lock:
+            self._models.clear()
+        self._release_memory()
+
+    def keys(self) -> List[ModelKey]:
+        """Return loaded keys from least to most recently used."""
+        with self._lock:
+            return list(self._models.keys())
+
+    def total_bytes(self) -> int:
+        """Return the estimated footprint of all loaded models."""
+        with self._lock:
+            return sum(size for _, size in self._models.values())
+
+    def _evict_over_budget(self, keep: ModelKey) -> None:
+        # Caller must hold self._lock
+        if not self.budget_bytes:
+            return
+        evicted = False
+        total = sum(size for _, size in self._models.values())
+        for key in list(self._models.keys()):
+            if total <= self.budget_bytes:
+                break
+            if key == keep:
+                continue
+            _, size = self._models.pop(key)
+            total -= size
+            evicted = True
+            logger.info(f"Evicted model {key} ({size / 2**20:.0f} MB) to fit the model budget")
+        if evicted:
+            self._release_memory()
+
+    @staticmethod
+    def _release_memory() -> None:
+        gc.collect()
+        try:
+            import torch
+        except ImportError:
+            return
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+# Shared registry for the Gradio app, the CLI and batch runners.
+# MODEL_BUDGET_MB limits the total size of loaded models (0 or unset means unlimited).
+registry = ModelRegistry(budget_bytes=int(os.environ.get("MODEL_BUDGET_MB", "0")) * 2**20)
+
+
+def default_compute_type(device: str, profile: Optional[str] = None) -> str:
+    """
+    Return the default compute type for a device: "float16" on CUDA; on CPU the compute type of the
+    inference profile (default: CPU_PROFILE), "float32" by default.
+    """
+    if device.startswith("cuda"):
+        return "float16"
+    return get_profile(profile)["compute_type"] or "float32"
+
+
+def get_transcriber(
+    model_name: str = "base",
+    device: str = "cpu",
+    compute_type: Optional[str] = None,
+    compile: Optional[bool] = None,
+    profile: Optional[str] = None,
+) -> Any:
+    """
+    Return a shared WhisperTranscriber, loading it on first use.
+    Args:
+        model_name (str): Whisper model name.
+        device (str): Device to run the model on.
+        compute_type (Optional[str]): Compute type (defaults to the device default).
+        compile (Optional[bool]): Compile the encoder with torch.compile (defaults to the profile).
+        profile (Optional[str]): Inference profile for the defaults (default: CPU_PROFILE environment variable).
+    Returns:
+        Any: WhisperTranscriber instance.
+    """
+    from code.transcribe import WhisperTranscriber
+
+    compute_type = compute_type or default_compute_type(device, profile)
+    compile = get_profile(profile)["compile"] if compile is None else compile
+    key = ("whisper", model_name, device, compute_type, compile)
+    return registry.get(
+        key,
+        lambda: WhisperTranscriber(model_name=model_name, device=device, compute_type=compute_type, compile=compile),
+    )
+
+
+def get_tiered_transcriber(
+    draft_model: str, refine_model: str, device: str = "cpu", profile: Optional[str] = None, **thresholds: float
+) -> Any:
+    """
+    Return a TieredTranscriber drafting with one shared Whisper model and refining with another.
+    Args:
+        draft_model (str): Fast Whisper model for the draft (e.g. "base").
+        refine_model (str): Accurate Whisper model for uncertain spans (e.g. "large-v3").
+        device (str): Device to run both models on.
+        profile (Optional[str]): Inference profile of both models (default: CPU_PROFILE environment variable).
+        **thresholds (float): Confidence thresholds (see code.tiered.is_uncertain).
+    Returns:
+        Any: TieredTranscriber instance.
+    """
+    from code.tiered import TieredTranscriber
+
+    return TieredTranscriber(
+        get_transcriber(draft_model, device=device, profile=profile),
+        get_transcriber(refine_model, device=device, profile=profile),
+        **thresholds,
+    )
+
+
+def get_diarizer(
+    token: str,
+    model_name: str = "pyannote/speaker-diarization-3.1",
+    device: str = "cpu",
+    compile: Optional[bool] = None,
+    profile: Optional[str] = None,
+) -> Any:
+    """
+    Return a shared DiarizationPipeline, loading it on first use.
+    Args:
+        token (str): HuggingFace access token (only used when the model is loaded).
+        model_name (str): Name of the pyannote model.
+        device (str): Device to run the model on.
+        compile (Optional[bool]): Compile the segmentation model with torch.compile (defaults to the profile).
+        profile (Optional[str]): Inference profile for the defaults (default: CPU_PROFILE environment variable).
+    Returns:
+        Any: DiarizationPipeline instance.
+    """
+    from code.diarization import DiarizationPipeline
+
+    compile = get_profile(profile)["compile"] if compile is None else compile
+    key = ("pyannote", model_name, device, compile)
+    return registry.get(key, lambda: DiarizationPipeline(token, model_name=model_name, device=device, compile=compile))
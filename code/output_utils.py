@@ -1,76 +1,209 @@
 import os
-from typing import Any, Dict, List
+from code.transcript_model import Transcript, speaker_turns
+from code.writers import MultiWriter, create_writers
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+
+def assign_speakers(
+    intervals: Sequence[Tuple[float, float]],
+    speaker_turns: Sequence[Tuple[float, float, Any]],
+    default: Any = "Unknown",
+) -> List[Any]:
+    """
+    Assign to each interval the speaker whose turns overlap it the most in total.
+    The overlap of an interval with one speaker's turns is the difference of the speaker's cumulative
+    turn coverage at the interval's end and start (see _TurnCoverage). Lookups are binary searches
+    whatever the nesting of the turns, e.g. one long monologue turn holding many backchannels:
+    O((n + m) log m) per speaker.
+    Args:
+        intervals (Sequence[Tuple[float, float]]): (start, end) pairs to label.
+        speaker_turns (Sequence[Tuple[float, float, Any]]): (start, end, speaker) diarization turns.
+        default (Any): Label for intervals that overlap no turn.
+    Returns:
+        List[Any]: Speaker label per interval.
+    """
+    if not intervals:
+        return []
+    by_speaker: Dict[Any, List[Tuple[float, float]]] = {}
+    for start, end, speaker in speaker_turns:
+        by_speaker.setdefault(speaker, []).append((start, end))
+    if not by_speaker:
+        return [default] * len(intervals)
+    bounds = np.asarray(intervals, dtype=np.float64).reshape(-1, 2)
+    starts, ends = bounds[:, 0], bounds[:, 1]
+    instant = starts == ends
+    labels = list(by_speaker)
+    scores = np.empty((len(labels), len(bounds)))
+    for row, label in enumerate(labels):
+        coverage = _TurnCoverage(by_speaker[label])
+        # Zero-length intervals are assigned to a turn containing them
+        scores[row] = np.where(instant, coverage.containing(starts), coverage.at(ends) - coverage.at(starts))
+    best = np.argmax(scores, axis=0)
+    found = scores[best, np.arange(len(bounds))] > _OVERLAP_EPSILON
+    return [labels[index] if ok else default for index, ok in zip(best.tolist(), found.tolist())]
+
+
+# Prefix sums of turn times lose precision on long recordings; smaller overlaps count as none
+_OVERLAP_EPSILON = 1e-6
+
+
+class _TurnCoverage:
+    """
+    Cumulative coverage of a set of (possibly overlapping) turns: at(t) is the summed length of the
+    turns' parts before t. Turns that ended by t count fully and open ones count t - start, which
+    prefix sums over the turns sorted by start and by end give in O(log m).
+    """
+
+    def __init__(self, turns: Sequence[Tuple[float, float]]) -> None:
+        bounds = np.asarray(turns, dtype=np.float64).reshape(-1, 2)
+        by_start = np.argsort(bounds[:, 0], kind="stable")
+        by_end = np.argsort(bounds[:, 1], kind="stable")
+        self.starts = bounds[by_start, 0]
+        self.ends = bounds[by_end, 1]
+        self.start_sums = np.concatenate([[0.0], np.cumsum(self.starts)])
+        self.ended_starts = np.concatenate([[0.0], np.cumsum(bounds[by_end, 0])])
+        self.ended_lengths = np.concatenate([[0.0], np.cumsum(bounds[by_end, 1] - bounds[by_end, 0])])
+
+    def at(self, times: np.ndarray) -> np.ndarray:
+        started = np.searchsorted(self.starts, times, side="right")
+        ended = np.searchsorted(self.ends, times, side="right")
+        open_starts = self.start_sums[started] - self.ended_starts[ended]
+        return self.ended_lengths[ended] + (started - ended) * times - open_starts
+
+    def containing(self, times: np.ndarray) -> np.ndarray:
+        """Number of turns with start <= t <= end."""
+        return (
+            np.searchsorted(self.starts, times, side="right") - np.searchsorted(self.ends, times, side="left")
+        ).astype(np.float64)
 
 
 class TranscriptSaver:
     """
     Class for saving diarized transcript with speaker merging.
+    Merged speaker blocks are streamed to one file per format (see code.writers); files are written
+    as "<name>.partial" and renamed when complete.
     """
 
-    def __init__(self, output_dir: str) -> None:
+    def __init__(self, output_dir: str, filename: str = "transcript.txt", formats: Sequence[str] = ("txt",)) -> None:
         """
         Initialize the TranscriptSaver.
         Args:
-            output_dir (str): Directory to save the transcript file.
+            output_dir (str): Directory to save the transcript files.
+            filename (str): Name of the text transcript; other formats replace its extension.
+            formats (Sequence[str]): Output formats (keys of code.writers.WRITERS).
         """
         self.output_dir: str = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
-        self.output_path: str = os.path.join(self.output_dir, "transcript.txt")
+        self.output_path: str = os.path.join(self.output_dir, filename)
+        self.stem: str = os.path.splitext(filename)[0]
+        self.writers = create_writers(self.output_dir, self.stem, formats)
+        self.output_paths: List[str] = [writer.path for writer in self.writers]
 
-    def merge_segments(self, diarized_text: Any, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def iter_merge_segments(self, diarized_text: Any, segments: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
         """
-        Merge consecutive segments of the same speaker.
+        Lazily merge consecutive segments of the same speaker.
         Args:
             diarized_text (Any): Diarization result (pyannote.core.Annotation).
             segments (List[Dict[str, Any]]): List of transcription segments.
-        Returns:
-            List[Dict[str, Any]]: List of merged segments with speaker labels.
+        Yields:
+            Dict[str, Any]: Merged segments with speaker labels.
         """
-        # Collect speaker intervals
-        speaker_turns: List[Any] = []
-        for turn in diarized_text.itertracks(yield_label=True):
-            segment, _, speaker = turn
-            speaker_turns.append((segment.start, segment.end, speaker))
-        # Assign speaker to each text segment and merge consecutive segments of the same speaker
-        merged: List[Dict[str, Any]] = []
+        # Assign to each text segment the speaker with the largest overlap
+        speakers = assign_speakers([(seg["start"], seg["end"]) for seg in segments], speaker_turns(diarized_text))
+        # Merge consecutive segments of the same speaker
         last_speaker: Any = None
         last_start: Any = None
         last_end: Any = None
         last_text: List[str] = []
-        for seg in segments:
+        for seg, speaker in zip(segments, speakers):
             seg_start = seg["start"]
             seg_end = seg["end"]
             seg_text = seg["text"].strip()
-            speaker = "Unknown"
-            for s_start, s_end, s_label in speaker_turns:
-                # If the segment is fully within the speaker interval
-                if seg_start >= s_start and seg_end <= s_end:
-                    speaker = s_label
-                    break
             if speaker == last_speaker:
                 last_end = seg_end
                 last_text.append(seg_text)
             else:
                 if last_speaker is not None:
-                    merged.append(
-                        {"start": last_start, "end": last_end, "speaker": last_speaker, "text": " ".join(last_text)}
-                    )
+                    yield {"start": last_start, "end": last_end, "speaker": last_speaker, "text": " ".join(last_text)}
                 last_speaker = speaker
                 last_start = seg_start
                 last_end = seg_end
                 last_text = [seg_text]
         if last_speaker is not None:
-            merged.append({"start": last_start, "end": last_end, "speaker": last_speaker, "text": " ".join(last_text)})
-        return merged
+            yield {"start": last_start, "end": last_end, "speaker": last_speaker, "text": " ".join(last_text)}
+
+    def merge_segments(self, diarized_text: Any, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Merge consecutive segments of the same speaker.
+        Args:
+            diarized_text (Any): Diarization result (pyannote.core.Annotation).
+            segments (List[Dict[str, Any]]): List of transcription segments.
+        Returns:
+            List[Dict[str, Any]]: List of merged segments with speaker labels.
+        """
+        return list(self.iter_merge_segments(diarized_text, segments))
 
-    def save_transcript(self, diarized_text: Any, segments: List[Dict[str, Any]]) -> None:
+    def merge_words(self, diarized_text: Any, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Save the merged transcript to a file.
+        Attribute every word to a speaker and split the text where the speaker changes.
+        Uses the word timestamps Whisper returns with word_timestamps=True; segments without words
+        are treated as a single word.
         Args:
             diarized_text (Any): Diarization result (pyannote.core.Annotation).
             segments (List[Dict[str, Any]]): List of transcription segments.
+        Returns:
+            List[Dict[str, Any]]: List of merged segments with speaker labels.
+        """
+        return list(Transcript.from_segments(segments).with_speakers(diarized_text).iter_merged())
+
+    def save_transcript(self, diarized_text: Any, segments: List[Dict[str, Any]], by_words: bool = True) -> List[str]:
+        """
+        Save the merged transcript in every configured format.
+        Args:
+            diarized_text (Any): Diarization result (pyannote.core.Annotation).
+            segments (List[Dict[str, Any]]): List of transcription segments.
+            by_words (bool): Attribute speakers per word instead of per segment.
+        Returns:
+            List[str]: Paths to the written files.
+        """
+        if by_words:
+            return self.save(Transcript.from_segments(segments).with_speakers(diarized_text))
+        return self.write(self.iter_merge_segments(diarized_text, segments))
+
+    def save(self, transcript: Transcript) -> List[str]:
+        """
+        Save a diarized columnar transcript, rendering the speaker blocks one at a time.
+        Args:
+            transcript (Transcript): Transcript with speakers assigned.
+        Returns:
+            List[str]: Paths to the written files.
+        """
+        return self.write(transcript.iter_merged())
+
+    def write(self, merged_segments: Iterable[Dict[str, Any]]) -> List[str]:
+        """
+        Stream merged segments to all formats; on error no incomplete file is left behind.
+        Args:
+            merged_segments (Iterable[Dict[str, Any]]): Merged segments (a list or a lazy iterator).
+        Returns:
+            List[str]: Paths to the written files.
+        """
+        with MultiWriter(self.writers) as writer:
+            writer.write_all(merged_segments)
+        return self.output_paths
+
+    def save_binary(self, transcript: Transcript, filename: str = "transcript.npz") -> str:
+        """
+        Save a columnar transcript in binary form next to the text file (see Transcript.load).
+        Args:
+            transcript (Transcript): Transcript to save.
+            filename (str): Name of the binary file.
+        Returns:
+            str: Path to the binary file.
         """
-        merged_segments = self.merge_segments(diarized_text, segments)
-        with open(self.output_path, "w", encoding="utf-8") as f:
-            for seg in merged_segments:
-                f.write(f"[{seg['start']:.2f} - {seg['end']:.2f}] Speaker {seg['speaker']}: {seg['text']}\n")
+        path = os.path.join(self.output_dir, filename)
+        transcript.save(path + ".partial")
+        os.replace(path + ".partial", path)
+        return path
@@ -0,0 +1,237 @@
+import threading
+import time
+from code.audio_export import AudioBuffer
+from code.instrumentation import JobMetrics, stage_or_null
+from code.result_cache import ResultCache, array_digest
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+
+class PipelineRunner:
+    """
+    Runs transcription and diarization concurrently and joins them only at the merge step.
+
+    Both stages run in a thread pool (PyTorch releases the GIL inside its kernels). On CUDA each
+    stage gets its own stream so their kernels can overlap on a shared GPU. With a cache, each stage
+    result is stored separately, so e.g. a new speaker count reuses the cached transcription and the
+    cached speaker embeddings, and only re-clusters.
+    """
+
+    def __init__(
+        self,
+        transcriber: Any,
+        diarizer: Optional[Any] = None,
+        long_form: bool = False,
+        cache: Optional[ResultCache] = None,
+        metrics: Optional[JobMetrics] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> None:
+        """
+        Args:
+            transcriber (Any): WhisperTranscriber instance.
+            diarizer (Optional[Any]): DiarizationPipeline instance (None to skip diarization).
+            long_form (bool): Split the audio at pauses and transcribe the chunks in parallel, and diarize
+                in overlapping windows.
+            cache (Optional[ResultCache]): Cache for transcription and diarization results.
+            metrics (Optional[JobMetrics]): Job metrics receiving a record per stage.
+            cancel (Optional[threading.Event]): Job cancel event; both stages stop at their next check
+                and raise JobCancelled.
+        """
+        self.transcriber = transcriber
+        self.diarizer = diarizer
+        self.long_form = long_form
+        self.cache = cache
+        self.metrics = metrics
+        self.cancel = cancel
+
+    def run(
+        self,
+        audio: AudioBuffer,
+        language: str = "ru",
+        num_speakers: Optional[int] = 2,
+        min_speakers: Optional[int] = None,
+        max_speakers: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Transcribe and diarize the audio in parallel.
+        Args:
+            audio (AudioBuffer): Decoded audio shared by both stages.
+            language (str): Audio language.
+            num_speakers (Optional[int]): Number of speakers (None or 0 to estimate it).
+            min_speakers (Optional[int]): Lower bound of the estimated number of speakers.
+            max_speakers (Optional[int]): Upper bound of the estimated number of speakers.
+        Returns:
+            Dict[str, Any]: Keys 'transcription', 'diarization' (None without a diarizer) and
+                'timings' (seconds per stage and in total).
+        """
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        content = array_digest(audio.samples) if self.cache is not None else ""
+        transcribe = self._cached(
+            "transcription",
+            content,
+            self._transcription_params(language, self.long_form),
+            self._transcribe,
+        )
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="pipeline") as pool:
+            transcription_future = pool.submit(
+                self._run_stage, "transcribe", timings, self.transcriber, transcribe, audio, language
+            )
+            diarization_future = self._submit_diarization(
+                pool, timings, content, audio, _speaker_bounds(num_speakers, min_speakers, max_speakers)
+            )
+            transcription = transcription_future.result()
+            diarization = diarization_future.result() if diarization_future is not None else None
+        timings["total"] = time.perf_counter() - start
+        logger.info("Pipeline timings: " + ", ".join(f"{name} {value:.2f}s" for name, value in timings.items()))
+        return {"transcription": transcription, "diarization": diarization, "timings": timings}
+
+    def stream(
+        self,
+        audio: AudioBuffer,
+        language: str = "ru",
+        num_speakers: Optional[int] = 2,
+        min_speakers: Optional[int] = None,
+        max_speakers: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Transcribe chunk by chunk while diarization runs in the background, yielding partial results.
+        Args:
+            audio (AudioBuffer): Decoded audio shared by both stages.
+            language (str): Audio language.
+            num_speakers (Optional[int]): Number of speakers (None or 0 to estimate it).
+            min_speakers (Optional[int]): Lower bound of the estimated number of speakers.
+            max_speakers (Optional[int]): Upper bound of the estimated number of speakers.
+        Yields:
+            Dict[str, Any]: Keys 'segments' (decoded so far), 'diarization' (None until it has finished),
+                'done' and, in the final update, 'transcription' and 'timings'.
+        """
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        content = array_digest(audio.samples) if self.cache is not None else ""
+        # Chunked decoding gives the same result as long-form mode, so both share cache entries
+        params = self._transcription_params(language, long_form=True)
+        key = self.cache.key("transcription", content, params) if self.cache is not None else ""
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline") as pool:
+            diarization_future = self._submit_diarization(
+                pool, timings, content, audio, _speaker_bounds(num_speakers, min_speakers, max_speakers)
+            )
+
+            def current_diarization() -> Any:
+                if diarization_future is not None and diarization_future.done():
+                    return diarization_future.result()
+                return None
+
+            transcription = self.cache.load("transcription", key) if self.cache is not None else None
+            if transcription is None:
+                segments: List[Dict[str, Any]] = []
+                # The stage spans generator yields, so it is timed but never profiled
+                with stage_or_null(self.metrics, "transcribe", audio.duration, profile=False):
+                    for seg in self.transcriber.stream(audio, language, cancel=self.cancel):
+                        segments.append(seg)
+                        yield {"segments": segments, "diarization": current_diarization(), "done": False}
+                transcription = {"text": "".join(seg["text"] for seg in segments), "segments": segments}
+                if self.cache is not None:
+                    self.cache.store("transcription", key, transcription)
+            timings["transcribe"] = time.perf_counter() - start
+            diarization = diarization_future.result() if diarization_future is not None else None
+        timings["total"] = time.perf_counter() - start
+        yield {
+            "segments": transcription["segments"],
+            "diarization": diarization,
+            "done": True,
+            "transcription": transcription,
+            "timings": timings,
+        }
+
+    def _transcribe(self, audio: AudioBuffer, language: str) -> Dict[str, Any]:
+        if self.long_form:
+            return self.transcriber.transcribe_long(audio, language, cancel=self.cancel)
+        return self.transcriber.transcribe(audio, language, cancel=self.cancel)
+
+    def _transcription_params(self, language: str, long_form: bool) -> Dict[str, Any]:
+        params = {
+            "model": self.transcriber.model_name,
+            "compute_type": self.transcriber.compute_type,
+            "language": language,
+            "long_form": long_form,
+        }
+        # Tiered transcription: the refined spans depend on the confidence thresholds
+        thresholds = getattr(self.transcriber, "thresholds", None)
+        if thresholds:
+            params["thresholds"] = thresholds
+        return params
+
+    def _submit_diarization(
+        self,
+        pool: ThreadPoolExecutor,
+        timings: Dict[str, float],
+        content: str,
+        audio: AudioBuffer,
+        bounds: Dict[str, Optional[int]],
+    ) -> Optional[Future]:
+        if self.diarizer is None:
+            return None
+        diarizer = self.diarizer
+        if self.long_form:
+            # Long recordings are diarized in overlapping windows to bound memory
+            params = dict(bounds, model=diarizer.model_name, windowed=True)
+            diarize = self._cached(
+                "diarization",
+                content,
+                params,
+                lambda audio: diarizer.diarize_windowed(
+                    audio,
+                    bounds["num_speakers"],
+                    min_speakers=bounds["min_speakers"],
+                    max_speakers=bounds["max_speakers"],
+                    cancel=self.cancel,
+                ),
+            )
+        else:
+            # Segmentation and embeddings are cached per audio, only the clustering depends on the bounds
+            def diarize(audio: AudioBuffer) -> Any:
+                return diarizer.diarize(audio, **bounds, cache=self.cache, content=content or None, cancel=self.cancel)
+
+        return pool.submit(self._run_stage, "diarize", timings, diarizer, diarize, audio)
+
+    def _cached(self, stage: str, content: str, params: Dict[str, Any], fn: Callable[..., Any]) -> Callable[..., Any]:
+        if self.cache is None:
+            return fn
+        cache = self.cache
+        return lambda *args: cache.get_or_compute(stage, content, params, lambda: fn(*args))
+
+    def _run_stage(
+        self, name: str, timings: Dict[str, float], engine: Any, fn: Callable[..., Any], audio: AudioBuffer, *args: Any
+    ) -> Any:
+        start = time.perf_counter()
+        stream: Any = None
+        stream_context: Any = nullcontext()
+        if engine.device.startswith("cuda"):
+            import torch
+
+            stream = torch.cuda.Stream(device=engine.device)
+            stream_context = torch.cuda.stream(stream)
+        with stage_or_null(self.metrics, name, audio.duration):
+            with stream_context:
+                result = fn(audio, *args)
+            if stream is not None:
+                stream.synchronize()
+        timings[name] = time.perf_counter() - start
+        return result
+
+
+def _speaker_bounds(
+    num_speakers: Optional[int], min_speakers: Optional[int], max_speakers: Optional[int]
+) -> Dict[str, Optional[int]]:
+    # A fixed count of 0 or less means "estimate"; then the bounds apply
+    if num_speakers is not None and num_speakers > 0:
+        return {"num_speakers": int(num_speakers), "min_speakers": None, "max_speakers": None}
+    return {
+        "num_speakers": None,
+        "min_speakers": int(min_speakers) if min_speakers and min_speakers > 0 else None,
+        "max_speakers": int(max_speakers) if max_speakers and max_speakers > 0 else None,
+    }
@@ -0,0 +1,297 @@
+import copy
+import threading
+import time
+from code.audio_export import AudioBuffer
+from code.jobs import check_cancelled
+from code.speaker_linking import overlap_mapping
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# Edges shorter than this (seconds) are not worth a model run
+MIN_EDGE = 0.1
+
+
+def shift_segments(segments: List[Dict[str, Any]], offset: float) -> List[Dict[str, Any]]:
+    """
+    Copy Whisper segments with all timestamps (including words) moved by offset.
+    Args:
+        segments (List[Dict[str, Any]]): Whisper segments.
+        offset (float): Shift in seconds.
+    Returns:
+        List[Dict[str, Any]]: Shifted copies.
+    """
+    shifted = []
+    for seg in segments:
+        seg = copy.deepcopy(seg)
+        seg["start"] += offset
+        seg["end"] += offset
+        for word in seg.get("words") or []:
+            word["start"] += offset
+            word["end"] += offset
+        shifted.append(seg)
+    return shifted
+
+
+def slice_segments(segments: List[Dict[str, Any]], start: float, end: float) -> List[Dict[str, Any]]:
+    """
+    Keep the parts of segments inside [start, end) and re-base them to start.
+    Words are kept when their midpoint is inside the span (segments without words by the segment
+    midpoint), so a word on the boundary ends up in exactly one of two adjacent spans.
+    Args:
+        segments (List[Dict[str, Any]]): Whisper segments with word timestamps.
+        start (float): Span start in seconds.
+        end (float): Span end in seconds.
+    Returns:
+        List[Dict[str, Any]]: Segments in span time.
+    """
+    result = []
+    for seg in segments:
+        if seg["end"] <= start or seg["start"] >= end:
+            continue
+        words = seg.get("words")
+        if words:
+            inside = [word for word in words if start <= (word["start"] + word["end"]) / 2 < end]
+            if not inside:
+                continue
+            seg = dict(seg, words=inside, text="".join(word["word"] for word in inside))
+            if len(inside) < len(words):
+                seg["start"], seg["end"] = inside[0]["start"], inside[-1]["end"]
+        elif not start <= (seg["start"] + seg["end"]) / 2 < end:
+            continue
+        result.append(seg)
+    result = shift_segments(result, -start)
+    # Boundary words are kept whole; clamp them to the span
+    for seg in result:
+        for item in [seg] + (seg.get("words") or []):
+            item["start"], item["end"] = max(0.0, item["start"]), min(end - start, item["end"])
+    return result
+
+
+def shift_annotation(annotation: Any, offset: float) -> Any:
+    """
+    Move all turns of a diarization result by offset.
+    Args:
+        annotation (Any): Diarization result (pyannote.core.Annotation).
+        offset (float): Shift in seconds.
+    Returns:
+        Any: Shifted annotation.
+    """
+    from pyannote.core import Annotation, Segment
+
+    shifted = Annotation(uri=annotation.uri)
+    for segment, track, label in annotation.itertracks(yield_label=True):
+        shifted[Segment(segment.start + offset, segment.end + offset), track] = label
+    return shifted
+
+
+def slice_annotation(annotation: Any, start: float, end: float) -> Any:
+    """
+    Crop a diarization result to [start, end] and re-base it to start.
+    Args:
+        annotation (Any): Diarization result (pyannote.core.Annotation).
+        start (float): Span start in seconds.
+        end (float): Span end in seconds.
+    Returns:
+        Any: Annotation in span time.
+    """
+    from pyannote.core import Segment
+
+    return shift_annotation(annotation.crop(Segment(start, end), mode="intersection"), -start)
+
+
+class TranscriptCoverage:
+    """
+    Transcript and diarization of a span of a source recording, kept in source time so that
+    re-cut intervals can be served by slicing and only the uncovered edges need a model run.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        start: float,
+        end: float,
+        params: Dict[str, Any],
+        segments: List[Dict[str, Any]],
+        diarization: Optional[Any] = None,
+    ) -> None:
+        """
+        Args:
+            source (str): Source identifier (path to the source WAV file or buffer store id).
+            start (float): Covered span start in seconds.
+            end (float): Covered span end in seconds.
+            params (Dict[str, Any]): Settings the results depend on (model, language, speakers, ...).
+            segments (List[Dict[str, Any]]): Whisper segments in source time.
+            diarization (Optional[Any]): Diarization in source time (None for text-only transcripts).
+        """
+        self.source = source
+        self.start = start
+        self.end = end
+        self.params = params
+        self.segments = segments
+        self.diarization = diarization
+
+    def matches(self, source: str, params: Dict[str, Any]) -> bool:
+        """Return True if the coverage was produced from the same source with the same settings."""
+        return self.source == source and self.params == params
+
+    def edges(self, start: float, end: float) -> Optional[List[Tuple[float, float]]]:
+        """
+        Return the parts of [start, end] that are not covered yet.
+        Args:
+            start (float): Requested start in seconds.
+            end (float): Requested end in seconds.
+        Returns:
+            Optional[List[Tuple[float, float]]]: Uncovered (start, end) edges, or None when the request
+                does not touch the covered span (nothing to reuse).
+        """
+        if end < self.start or start > self.end:
+            return None
+        edges = []
+        if self.start - start > MIN_EDGE:
+            edges.append((start, self.start))
+        if end - self.end > MIN_EDGE:
+            edges.append((self.end, end))
+        return edges
+
+    def slice(self, start: float, end: float) -> Tuple[List[Dict[str, Any]], Optional[Any]]:
+        """
+        Segments and diarization of [start, end] re-based to start.
+        Args:
+            start (float): Span start in seconds.
+            end (float): Span end in seconds.
+        Returns:
+            Tuple[List[Dict[str, Any]], Optional[Any]]: Segments (re-numbered) and diarization.
+        """
+        segments = slice_segments(self.segments, start, end)
+        for i, seg in enumerate(segments):
+            seg["id"] = i
+        diarization = slice_annotation(self.diarization, start, end) if self.diarization is not None else None
+        return segments, diarization
+
+    def extend(self, start: float, end: float, segments: List[Dict[str, Any]], diarization: Optional[Any]) -> None:
+        """
+        Add the results of an adjacent edge (all in source time).
+        Args:
+            start (float): Edge start in seconds.
+            end (float): Edge end in seconds.
+            segments (List[Dict[str, Any]]): Edge segments.
+            diarization (Optional[Any]): Edge diarization with labels already linked to this coverage.
+        """
+        # Shift back so the edge keeps its source timestamps
+        edge = shift_segments(slice_segments(segments, start, end), start)
+        self.segments = sorted(self.segments + edge, key=lambda seg: seg["start"])
+        if self.diarization is not None and diarization is not None:
+            from pyannote.core import Segment
+
+            for segment, _, label in diarization.crop(Segment(start, end), mode="intersection").itertracks(
+                yield_label=True
+            ):
+                self.diarization[segment] = label
+            self.diarization = self.diarization.support()
+        self.start, self.end = min(self.start, start), max(self.end, end)
+
+
+def transcribe_interval(
+    coverage: TranscriptCoverage,
+    start: float,
+    end: float,
+    transcriber: Any,
+    diarizer: Optional[Any] = None,
+    language: str = "ru",
+    num_speakers: Optional[int] = 2,
+    min_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None,
+    context: float = 30.0,
+    source_audio: Optional[AudioBuffer] = None,
+    cancel: Optional[threading.Event] = None,
+    long_form: bool = False,
+) -> Dict[str, Any]:
+    """
+    Produce the transcript of [start, end] of the coverage source, running the models only on the edges
+    that are not covered yet and extending the coverage with them.
+    Every edge is diarized together with up to `context` seconds of the covered neighbourhood; edge
+    speakers are mapped to the existing labels by their overlap inside that context. An edge may hold
+    only some of the speakers, so a fixed number of speakers bounds its estimate from above.
+    Args:
+        coverage (TranscriptCoverage): Existing results (extended in place).
+        start (float): Interval start in source seconds.
+        end (float): Interval end in source seconds.
+        transcriber (Any): WhisperTranscriber instance.
+        diarizer (Optional[Any]): DiarizationPipeline instance (None for text only).
+        language (str): Audio language.
+        num_speakers (Optional[int]): Number of speakers (None or 0 to estimate it per edge).
+        min_speakers (Optional[int]): Lower bound of the estimated number of speakers.
+        max_speakers (Optional[int]): Upper bound of the estimated number of speakers.
+        context (float): Covered audio (seconds) diarized together with each edge.
+        source_audio (Optional[AudioBuffer]): Decoded source audio (default: memory-mapped from the source WAV).
+        cancel (Optional[threading.Event]): Job cancel event, checked between edges and passed to the models.
+        long_form (bool): Use chunked transcription and windowed diarization, as PipelineRunner does.
+    Returns:
+        Dict[str, Any]: Same keys as PipelineRunner.run ('transcription', 'diarization', 'timings'),
+            in interval time.
+    """
+    begin = time.perf_counter()
+    if source_audio is None:
+        source_audio = AudioBuffer.from_wav(coverage.source)
+    timings: Dict[str, float] = {"transcribe": 0.0, "diarize": 0.0}
+    if num_speakers and num_speakers > 0:
+        bounds: Dict[str, Optional[int]] = {"min_speakers": None, "max_speakers": num_speakers}
+    else:
+        bounds = {"min_speakers": min_speakers, "max_speakers": max_speakers}
+    for edge_start, edge_end in coverage.edges(start, end) or []:
+        logger.info(f"Re-cut: transcribing uncovered edge {edge_start:.1f}-{edge_end:.1f}s")
+        stage_start = time.perf_counter()
+        check_cancelled(cancel)
+        edge_audio = source_audio.slice(edge_start, edge_end)
+        if long_form:
+            result = transcriber.transcribe_long(edge_audio, language, cancel=cancel)
+        else:
+            result = transcriber.transcribe(edge_audio, language, cancel=cancel)
+        segments = shift_segments(result["segments"], edge_start)
+        timings["transcribe"] += time.perf_counter() - stage_start
+
+        diarization = None
+        if diarizer is not None and coverage.diarization is not None:
+            stage_start = time.perf_counter()
+            # Extend the edge into the covered span so its speakers can be matched to known ones
+            if edge_end <= coverage.start:
+                window_start, window_end = edge_start, min(coverage.end, edge_end + context)
+                shared = (edge_end, window_end)
+            else:
+                window_start, window_end = max(coverage.start, edge_start - context), edge_end
+                shared = (window_start, edge_start)
+            audio = source_audio.slice(window_start, window_end)
+            if long_form:
+                edge_diarization = diarizer.diarize_windowed(audio, None, **bounds, cancel=cancel)
+            else:
+                edge_diarization = diarizer.diarize(audio, None, **bounds, cancel=cancel)
+            diarization = shift_annotation(edge_diarization, window_start)
+            mapping = overlap_mapping(coverage.diarization, diarization, *shared)
+            mapping.update(_new_labels(coverage.diarization, diarization, mapping))
+            diarization = diarization.rename_labels(mapping)
+            timings["diarize"] += time.perf_counter() - stage_start
+        coverage.extend(edge_start, edge_end, segments, diarization)
+
+    segments, diarization = coverage.slice(start, end)
+    timings["total"] = time.perf_counter() - begin
+    return {
+        "transcription": {"text": "".join(seg["text"] for seg in segments), "segments": segments},
+        "diarization": diarization,
+        "timings": timings,
+    }
+
+
+def _new_labels(known: Any, edge: Any, mapping: Dict[Any, Any]) -> Dict[Any, Any]:
+    # Edge speakers that do not overlap a known one get fresh labels
+    taken = set(known.labels()) | set(mapping.values())
+    labels: Dict[Any, Any] = {}
+    index = 0
+    for label in edge.labels():
+        if label in mapping:
+            continue
+        while f"SPEAKER_{index:02d}" in taken:
+            index += 1
+        labels[label] = f"SPEAKER_{index:02d}"
+        taken.add(labels[label])
+    return labels
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+# Serialization format per pipeline stage; other stages are pickled
+STAGE_FORMATS: Dict[str, str] = {
+    "audio": "npy",
+    "transcription": "json",
+    "diarization": "pickle",
+    "embeddings": "pickle",
+}
+
+# Eviction goes down to this fraction of the size limit, so the cache directory is walked again only
+# after that share of the limit has been written
+EVICT_TO = 0.9
+
+_file_digests: Dict[Tuple[str, int, int], str] = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_digest(path: str, block_size: int = 2**20) -> str:
+    """
+    Compute the SHA-256 of a file's contents.
+    Results are memoized per (path, size, mtime) so an unchanged file is hashed once per process.
+    Args:
+        path (str): Path to the file.
+        block_size (int): Read block size in bytes.
+    Returns:
+        str: Hex digest.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _file_digests_lock:
+        if memo_key in _file_digests:
+            return _file_digests[memo_key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    with _file_digests_lock:
+        _file_digests[memo_key] = digest.hexdigest()
+    return digest.hexdigest()
+
+
+def array_digest(samples: np.ndarray) -> str:
+    """
+    Compute the SHA-256 of an array's contents (e.g. decoded audio samples).
+    Args:
+        samples (np.ndarray): Array to hash.
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha256(str(samples.dtype).encode())
+    digest.update(np.ascontiguousarray(samples).data.cast("B"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache for pipeline stage results.
+
+    Entries are keyed by a hash of the input content (video file or decoded audio) and the stage
+    parameters, so changing e.g. the speaker count only invalidates the diarization stage.
+    The total size is bounded; least recently used entries are evicted first. The size is tracked as a
+    running total of the stored entries and re-synced with the directory (including entries written by
+    other processes) whenever it crosses the limit. The directory is created on the first store.
+    """
+
+    def __init__(self, root: str = "cache", max_bytes: int = 2 * 2**30) -> None:
+        """
+        Args:
+            root (str): Cache directory.
+            max_bytes (int): Maximum total size of cached entries in bytes (0 means unlimited).
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Total size in bytes, unknown until the first eviction check walks the directory
+        self._size: Optional[int] = None
+
+    @staticmethod
+    def key(stage: str, content: str, params: Dict[str, Any]) -> str:
+        """
+        Build the cache key for a stage result.
+        Args:
+            stage (str): Stage name ("audio", "transcription", "diarization", ...).
+            content (str): Digest of the input content.
+            params (Dict[str, Any]): Stage parameters (must be JSON serializable).
+        Returns:
+            str: Hex key.
+        """
+        payload = json.dumps({"stage": stage, "content": content, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def load(self, stage: str, key: str) -> Optional[Any]:
+        """
+        Load a cached result.
+        Args:
+            stage (str): Stage name.
+            key (str): Cache key.
+        Returns:
+            Optional[Any]: Cached value, or None on a miss.
+        """
+        path = self._path(stage, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            fmt = STAGE_FORMATS.get(stage, "pickle")
+            if fmt == "npy":
+                value: Any = np.load(path, mmap_mode="r")
+            elif fmt == "json":
+                with open(path, "r", encoding="utf-8") as f:
+                    value = json.load(f)
+            else:
+                with open(path, "rb") as f:
+                    value = pickle.load(f)
+            # Mark as recently used for LRU eviction
+            os.utime(path)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        return value
+
+    def store(self, stage: str, key: str, value: Any) -> None:
+        """
+        Store a result atomically and evict old entries when over the size limit.
+        Args:
+            stage (str): Stage name.
+            key (str): Cache key.
+            value (Any): Value to store.
+        """
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fmt = STAGE_FORMATS.get(stage, "pickle")
+        if fmt == "npy":
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.asarray(value))
+        elif fmt == "json":
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+        else:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        replaced = _file_size(path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += _file_size(path) - replaced
+        self._evict()
+
+    def get_or_compute(self, stage: str, content: str, params: Dict[str, Any], compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached result for a stage or compute and store it.
+        Args:
+            stage (str): Stage name.
+            content (str): Digest of the input content.
+            params (Dict[str, Any]): Stage parameters.
+            compute (Callable[[], Any]): Function computing the result on a miss.
+        Returns:
+            Any: Stage result.
+        """
+        key = self.key(stage, content, params)
+        value = self.load(stage, key)
+        if value is not None:
+            logger.info(f"Cache hit for {stage} ({key[:12]})")
+            return value
+        value = compute()
+        self.store(stage, key, value)
+        return value
+
+    def _path(self, stage: str, key: str) -> str:
+        extension = {"npy": ".npy", "json": ".json"}.get(STAGE_FORMATS.get(stage, "pickle"), ".pkl")
+        return os.path.join(self.root, stage, key + extension)
+
+    def _evict(self) -> None:
+        if not self.max_bytes:
+            return
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+            entries = []
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                for _, size, path in sorted(entries):
+                    if total <= self.max_bytes * EVICT_TO:
+                        break
+                    self._remove(path)
+                    total -= size
+            self._size = total
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+# Shared cache for the Gradio app and the CLI.
+# CACHE_DIR sets the location, CACHE_MAX_MB the size limit (0 means unlimited).
+result_cache = ResultCache(
+    root=os.environ.get("CACHE_DIR", "cache"), max_bytes=int(os.environ.get("CACHE_MAX_MB", "2048")) * 2**20
+)
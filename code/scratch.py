@@ -0,0 +1,217 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+# RAM-backed filesystem for small intermediates (Linux)
+SHM_ROOT = "/dev/shm"
+
+
+class _Entry:
+    __slots__ = ("path", "owner", "size", "refs", "last_used")
+
+    def __init__(self, path: str, owner: str) -> None:
+        self.path = path
+        self.owner = owner
+        self.size = 0
+        self.refs = 0
+        self.last_used = time.monotonic()
+
+
+class ScratchStore:
+    """
+    Bounded store for intermediate files (extracted and cut audio).
+
+    Files belong to an owner (a UI session or a job) and are deleted when the owner is released.
+    Files in use (e.g. the audio the UI is currently playing) are pinned with acquire()/release();
+    when the total size exceeds the cap, unpinned files are evicted least recently used first.
+    Small files can be placed on a RAM-backed filesystem. Every process works in its own
+    sub-directory, which is removed at exit; directories left by dead processes are removed at start.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        max_bytes: int = 4 * 2**30,
+        memory_max_file_bytes: int = 64 * 2**20,
+        memory_root: Optional[str] = SHM_ROOT,
+    ) -> None:
+        """
+        Args:
+            root (Optional[str]): Scratch directory (default: "interview_parser" in the system temp directory).
+            max_bytes (int): Size cap in bytes, enforced by evicting unpinned files (0 means unlimited).
+            memory_max_file_bytes (int): Files expected to be at most this size go to memory_root (0 disables).
+            memory_root (Optional[str]): RAM-backed directory (used only if it exists).
+        """
+        self.max_bytes = max_bytes
+        self.memory_max_file_bytes = memory_max_file_bytes
+        self._roots = [root or os.path.join(tempfile.gettempdir(), "interview_parser")]
+        if memory_root and memory_max_file_bytes and os.path.isdir(memory_root):
+            self._roots.append(os.path.join(memory_root, "interview_parser"))
+        self._dirs: List[str] = []
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def new_path(self, owner: str, suffix: str = ".wav", size_hint: Optional[int] = None) -> str:
+        """
+        Reserve a path for a new intermediate file.
+        Args:
+            owner (str): Session or job id owning the file.
+            suffix (str): File suffix.
+            size_hint (Optional[int]): Expected size in bytes; small files go to RAM when available.
+        Returns:
+            str: Path to write to; call commit() once the file is written.
+        """
+        in_memory = size_hint is not None and size_hint <= self.memory_max_file_bytes and len(self._roots) > 1
+        directory = self._directory(1 if in_memory else 0)
+        path = os.path.join(directory, f"{uuid.uuid4().hex}{suffix}")
+        with self._lock:
+            self._entries[path] = _Entry(path, owner)
+        return path
+
+    def commit(self, path: str) -> str:
+        """
+        Record the size of a written file and evict old files if over the cap.
+        Args:
+            path (str): Path from new_path().
+        Returns:
+            str: The same path.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                entry.size = os.path.getsize(path)
+                entry.last_used = time.monotonic()
+            self._evict(keep=path)
+        return path
+
+    def discard(self, path: str) -> None:
+        """Delete a file right away (e.g. after a failed write)."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._delete(entry)
+
+    def acquire(self, path: Optional[str]) -> None:
+        """Pin a file so it is not evicted (no-op for paths not managed by the store)."""
+        with self._lock:
+            entry = self._entries.get(path) if path else None
+            if entry is not None:
+                entry.refs += 1
+                entry.last_used = time.monotonic()
+
+    def release(self, path: Optional[str]) -> None:
+        """Unpin a file acquired before; it stays until evicted or its owner is released."""
+        with self._lock:
+            entry = self._entries.get(path) if path else None
+            if entry is not None:
+                entry.refs = max(0, entry.refs - 1)
+                entry.last_used = time.monotonic()
+            self._evict()
+
+    def swap(self, old: Optional[str], new: Optional[str]) -> None:
+        """Pin new and unpin old, e.g. when the UI replaces the audio it shows."""
+        if old != new:
+            self.acquire(new)
+            self.release(old)
+
+    def release_owner(self, owner: str) -> None:
+        """
+        Delete all files of an owner (e.g. when a UI session ends), pinned or not.
+        Args:
+            owner (str): Session or job id.
+        """
+        with self._lock:
+            for entry in [entry for entry in self._entries.values() if entry.owner == owner]:
+                self._delete(entry)
+
+    @property
+    def roots(self) -> List[str]:
+        """Directories the files are written under (a web server must be allowed to serve them)."""
+        return list(self._roots)
+
+    def total_bytes(self) -> int:
+        """Return the total size of the managed files in bytes."""
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def cleanup(self) -> None:
+        """Delete all files and directories of this process."""
+        with self._lock:
+            self._entries.clear()
+            for directory in self._dirs:
+                shutil.rmtree(directory, ignore_errors=True)
+            self._dirs.clear()
+
+    def prepare(self) -> None:
+        """Create this process's directories and remove those of dead processes (done on first use otherwise)."""
+        with self._lock:
+            if self._dirs:
+                return
+            for root in self._roots:
+                os.makedirs(root, exist_ok=True)
+                remove_stale(root)
+                directory = os.path.join(root, str(os.getpid()))
+                os.makedirs(directory, exist_ok=True)
+                self._dirs.append(directory)
+            atexit.register(self.cleanup)
+
+    def _directory(self, index: int) -> str:
+        self.prepare()
+        return self._dirs[index]
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        # Called with the lock held; the file just written (keep) is never evicted
+        if not self.max_bytes:
+            return
+        total = sum(entry.size for entry in self._entries.values())
+        for entry in sorted(self._entries.values(), key=lambda entry: entry.last_used):
+            if total <= self.max_bytes:
+                break
+            if entry.refs == 0 and entry.size and entry.path != keep:
+                total -= entry.size
+                logger.info(f"Evicting scratch file {entry.path} ({entry.size / 2**20:.0f} MB)")
+                self._delete(entry)
+
+    def _delete(self, entry: _Entry) -> None:
+        self._entries.pop(entry.path, None)
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_stale(root: str) -> None:
+    """
+    Remove per-process scratch directories of processes that are no longer running.
+    Args:
+        root (str): Scratch root directory.
+    """
+    for name in os.listdir(root):
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        try:
+            os.kill(int(name), 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            # Running process of another user
+            continue
+        logger.info(f"Removing stale scratch directory {os.path.join(root, name)}")
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+# Shared scratch store.
+# SCRATCH_DIR sets the location, SCRATCH_MAX_MB the size cap and SCRATCH_RAM_MB the largest file kept in RAM.
+scratch_store = ScratchStore(
+    root=os.environ.get("SCRATCH_DIR") or None,
+    max_bytes=int(os.environ.get("SCRATCH_MAX_MB", "4096")) * 2**20,
+    memory_max_file_bytes=int(os.environ.get("SCRATCH_RAM_MB", "64")) * 2**20,
+)
@@ -0,0 +1,154 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def plan_windows(duration: float, window: float = 600.0, overlap: float = 30.0) -> List[Tuple[float, float]]:
+    """
+    Split a recording into overlapping windows of equal length (the last one may be shorter).
+    Args:
+        duration (float): Recording length in seconds.
+        window (float): Window length in seconds.
+        overlap (float): Overlap between consecutive windows in seconds.
+    Returns:
+        List[Tuple[float, float]]: (start, end) windows in seconds.
+    """
+    if duration <= window:
+        return [(0.0, duration)]
+    step = window - overlap
+    windows = []
+    start = 0.0
+    while True:
+        end = min(start + window, duration)
+        windows.append((start, end))
+        if end >= duration:
+            return windows
+        start += step
+
+
+def window_cuts(windows: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """
+    Span of the output owned by each window: consecutive windows hand over at the middle of their overlap.
+    Args:
+        windows (List[Tuple[float, float]]): Windows from plan_windows.
+    Returns:
+        List[Tuple[float, float]]: (start, end) span per window in seconds.
+    """
+    cuts = [windows[0][0]]
+    for (_, previous_end), (start, _) in zip(windows, windows[1:]):
+        cuts.append((start + previous_end) / 2)
+    cuts.append(windows[-1][1])
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+class SpeakerLinker:
+    """
+    Incremental clustering that links window-local speakers to global speakers.
+
+    Every global speaker keeps a running centroid of its normalized embeddings. The local speakers of a
+    window are matched one-to-one to the most similar centroids; a speaker whose best cosine similarity is
+    below the threshold starts a new global speaker, unless max_speakers are already known. Memory is
+    O(speakers x embedding dimension) regardless of the recording length.
+    """
+
+    def __init__(self, threshold: float = 0.5, max_speakers: Optional[int] = None) -> None:
+        """
+        Args:
+            threshold (float): Minimum cosine similarity for linking to an existing speaker.
+            max_speakers (Optional[int]): Upper bound on the number of global speakers.
+        """
+        self.threshold = threshold
+        self.max_speakers = max_speakers
+        self.sums: List[np.ndarray] = []
+        self.counts: List[float] = []
+
+    @property
+    def centroids(self) -> np.ndarray:
+        """Normalized centroids, shape (speakers, dimension)."""
+        return _normalize(np.stack([total / count for total, count in zip(self.sums, self.counts)]))
+
+    def link(
+        self, embeddings: np.ndarray, weights: Optional[List[float]] = None, fallback: Optional[Dict[int, int]] = None
+    ) -> List[int]:
+        """
+        Assign global speaker indices to the local speakers of one window and update the centroids.
+        Args:
+            embeddings (np.ndarray): Local speaker embeddings, shape (local speakers, dimension); rows with
+                NaN (too little speech for an embedding) are linked through the fallback.
+            weights (Optional[List[float]]): Speech duration per local speaker, weighting the centroid update.
+            fallback (Optional[Dict[int, int]]): Global index per local speaker for rows without an embedding
+                (e.g. from the overlap with the previous window).
+        Returns:
+            List[int]: Global speaker index per local speaker.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        weights = weights or [1.0] * len(embeddings)
+        fallback = fallback or {}
+        valid = [i for i in range(len(embeddings)) if np.all(np.isfinite(embeddings[i]))]
+        assignment: Dict[int, int] = {}
+
+        if valid and self.sums:
+            similarity = _normalize(embeddings[valid]) @ self.centroids.T
+            # Greedy one-to-one matching, most similar pairs first
+            pairs = sorted(
+                ((similarity[row, col], valid[row], col) for row in range(len(valid)) for col in range(len(self.sums))),
+                reverse=True,
+            )
+            taken: set = set()
+            for score, local, global_index in pairs:
+                if local in assignment or global_index in taken or score < self.threshold:
+                    continue
+                assignment[local] = global_index
+                taken.add(global_index)
+
+        for local in valid:
+            if local in assignment:
+                continue
+            if self.max_speakers is None or len(self.sums) < self.max_speakers:
+                self.sums.append(np.zeros(embeddings.shape[1]))
+                self.counts.append(0.0)
+                assignment[local] = len(self.sums) - 1
+            else:
+                # All speakers are known: take the closest one even below the threshold
+                assignment[local] = int(np.argmax(self.centroids @ _normalize(embeddings[local])))
+
+        for local in valid:
+            global_index = assignment[local]
+            self.sums[global_index] += weights[local] * _normalize(embeddings[local])
+            self.counts[global_index] += weights[local]
+
+        for local in range(len(embeddings)):
+            if local not in assignment:
+                assignment[local] = fallback.get(local, -1)
+        return [assignment[local] for local in range(len(embeddings))]
+
+
+def overlap_mapping(previous: Any, current: Any, start: float, end: float) -> Dict[Any, Any]:
+    """
+    Map labels of the current window to labels of the previous one by their overlap inside [start, end].
+    Args:
+        previous (Any): Previous window annotation (pyannote.core.Annotation, global time).
+        current (Any): Current window annotation (pyannote.core.Annotation, global time).
+        start (float): Start of the shared region in seconds.
+        end (float): End of the shared region in seconds.
+    Returns:
+        Dict[Any, Any]: Previous label with the largest overlap for each current label that overlaps any.
+    """
+    from pyannote.core import Segment
+
+    region = Segment(start, end)
+    totals: Dict[Tuple[Any, Any], float] = {}
+    for seg_a, _, label_a in current.crop(region).itertracks(yield_label=True):
+        for seg_b, _, label_b in previous.crop(region).itertracks(yield_label=True):
+            shared = seg_a & seg_b
+            if shared:
+                totals[(label_a, label_b)] = totals.get((label_a, label_b), 0.0) + shared.duration
+    mapping: Dict[Any, Any] = {}
+    for (label_a, label_b), total in sorted(totals.items(), key=lambda item: -item[1]):
+        mapping.setdefault(label_a, label_b)
+    return mapping
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
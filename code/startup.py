@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from code.devices import device_scheduler
+from code.model_registry import get_diarizer, get_transcriber
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+
+def parse_prewarm(value: str) -> List[str]:
+    """
+    Parse a comma-separated list of models to prewarm, e.g. "whisper:base,pyannote".
+    Args:
+        value (str): Model list.
+    Returns:
+        List[str]: Entries of the form "kind:name".
+    """
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class Prewarmer:
+    """
+    Background startup work for the app: imports torch, probes the device and loads the configured
+    models into the shared registry, so the UI renders immediately and the first request is warm.
+    """
+
+    def __init__(self, models: Optional[List[str]] = None, token: Optional[str] = None) -> None:
+        """
+        Args:
+            models (Optional[List[str]]): Models to load, "whisper:<name>" or "pyannote[:<name>]"
+                (default: PREWARM_MODELS environment variable, or "whisper:base").
+            token (Optional[str]): HuggingFace token for pyannote (default: HUGGINGFACE_TOKEN variable).
+        """
+        self.models = models if models is not None else parse_prewarm(os.environ.get("PREWARM_MODELS", "whisper:base"))
+        self.token = token if token is not None else os.environ.get("HUGGINGFACE_TOKEN")
+        self.device = "cpu"
+        self.device_name = "CPU"
+        self.status: Dict[str, str] = {"device": "probing..."}
+        self.status.update({model: "waiting" for model in self.models})
+        self._device_ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the background thread (only once)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prewarm", daemon=True)
+                self._thread.start()
+
+    def get_device(self) -> str:
+        """Return the device type, waiting for the probe if it has not finished yet."""
+        self.start()
+        self._device_ready.wait()
+        return self.device
+
+    def is_ready(self) -> bool:
+        """Return True when the device probe and all prewarm loads have finished."""
+        return all(not state.endswith("...") and state != "waiting" for state in self.status.values())
+
+    def status_markdown(self) -> str:
+        """Return the readiness state as Markdown for the UI."""
+        lines = [f"**Device:** {self.device_name if self._device_ready.is_set() else 'probing...'}"]
+        for model in self.models:
+            lines.append(f"**{model}:** {self.status[model]}")
+        if self._device_ready.is_set():
+            lines.append(device_scheduler.status_markdown())
+        return "  \n".join(lines)
+
+    def _run(self) -> None:
+        start = time.perf_counter()
+        try:
+            import torch
+
+            gpus = device_scheduler.gpus()
+            if gpus:
+                self.device = "cuda"
+                self.device_name = f"CUDA ({len(gpus)} x {torch.cuda.get_device_name(0)})"
+            else:
+                from code.inference_profiles import configure_threads
+
+                # Whisper and pyannote of a request run concurrently and share the cores
+                configure_threads(jobs=2)
+            self.status["device"] = "ready"
+        except Exception as e:
+            self.status["device"] = f"error: {e}"
+        finally:
+            self._device_ready.set()
+        logger.info(f"Device probe finished in {time.perf_counter() - start:.1f}s: {self.device_name}")
+
+        for model in self.models:
+            kind, _, name = model.partition(":")
+            self.status[model] = "loading..."
+            start = time.perf_counter()
+            try:
+                # Load where the scheduler would place a job with this model, so the first job finds it
+                if kind == "whisper":
+                    with device_scheduler.acquire(name or "base", diarize=False) as lease:
+                        get_transcriber(name or "base", device=lease.whisper_device)
+                elif kind == "pyannote":
+                    if not self.token:
+                        self.status[model] = "skipped (HUGGINGFACE_TOKEN not set)"
+                        continue
+                    with device_scheduler.acquire(diarize=True) as lease:
+                        if name:
+                            get_diarizer(self.token, model_name=name, device=lease.pyannote_device)
+                        else:
+                            get_diarizer(self.token, device=lease.pyannote_device)
+                else:
+                    self.status[model] = f"unknown model kind '{kind}'"
+                    continue
+                self.status[model] = f"ready ({time.perf_counter() - start:.1f}s)"
+            except Exception as e:
+                logger.warning(f"Prewarming {model} failed: {e}")
+                self.status[model] = f"error: {e}"
+
+
+# Shared prewarmer; started by app.py right before launching the UI
+prewarmer = Prewarmer()
@@ -0,0 +1,205 @@
+import threading
+import time
+from code.audio_export import AudioBuffer
+from code.jobs import check_cancelled
+from code.transcribe import stitch_results
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+# A draft segment is re-decoded when Whisper is unsure of it: low average token log-probability,
+# repetitive text (high gzip compression ratio, typical of hallucination loops) or a likely
+# non-speech window that still produced text. As in Whisper's own no-speech rule, a high no-speech
+# probability only counts together with a low log-probability, so confident text is kept; the bound
+# is looser there (-0.4) since text in a likely silent window is suspicious already. Whisper's own
+# fallback thresholds are -1.0 and 2.4; the log-probability threshold is stricter here because the
+# refiner is much cheaper than a miss.
+LOGPROB_THRESHOLD = -0.7
+COMPRESSION_RATIO_THRESHOLD = 2.4
+NO_SPEECH_THRESHOLD = 0.5
+NO_SPEECH_LOGPROB_THRESHOLD = -0.4
+
+
+def is_uncertain(
+    segment: Dict[str, Any],
+    logprob_threshold: float = LOGPROB_THRESHOLD,
+    compression_ratio_threshold: float = COMPRESSION_RATIO_THRESHOLD,
+    no_speech_threshold: float = NO_SPEECH_THRESHOLD,
+    no_speech_logprob_threshold: float = NO_SPEECH_LOGPROB_THRESHOLD,
+) -> bool:
+    """
+    Decide from Whisper's per-segment statistics whether a draft segment should be refined.
+    Args:
+        segment (Dict[str, Any]): Whisper segment with 'avg_logprob', 'compression_ratio' and 'no_speech_prob'.
+        logprob_threshold (float): Segments with a lower average log-probability are uncertain.
+        compression_ratio_threshold (float): Segments with a higher compression ratio are uncertain.
+        no_speech_threshold (float): Segments with a higher no-speech probability are uncertain when their
+            average log-probability is below no_speech_logprob_threshold.
+        no_speech_logprob_threshold (float): Log-probability bound for likely non-speech segments.
+    Returns:
+        bool: True if the segment should be re-decoded.
+    """
+    logprob = segment.get("avg_logprob", 0.0)
+    return (
+        logprob < logprob_threshold
+        or segment.get("compression_ratio", 0.0) > compression_ratio_threshold
+        or (segment.get("no_speech_prob", 0.0) > no_speech_threshold and logprob < no_speech_logprob_threshold)
+    )
+
+
+def uncertain_spans(
+    segments: List[Dict[str, Any]], duration: float, padding: float = 0.3, max_gap: float = 1.0, **thresholds: float
+) -> List[Tuple[int, int, float, float]]:
+    """
+    Group uncertain draft segments into spans to re-decode.
+    Neighbouring uncertain segments less than max_gap apart form one span. Spans are padded into the
+    pauses around them but never into a confident segment, so the refined text replaces exactly the
+    segments of the span.
+    Args:
+        segments (List[Dict[str, Any]]): Draft segments in time order.
+        duration (float): Audio duration in seconds.
+        padding (float): Seconds of context added on both sides where there is a pause.
+        max_gap (float): Uncertain segments closer than this are refined together.
+        **thresholds (float): Thresholds passed to is_uncertain.
+    Returns:
+        List[Tuple[int, int, float, float]]: (first segment, last segment + 1, start, end) per span.
+    """
+    groups: List[List[int]] = []
+    for i, seg in enumerate(segments):
+        if not is_uncertain(seg, **thresholds):
+            continue
+        if groups and groups[-1][1] == i and seg["start"] - segments[i - 1]["end"] < max_gap:
+            groups[-1][1] = i + 1
+        else:
+            groups.append([i, i + 1])
+    spans = []
+    for first, last in groups:
+        previous_end = segments[first - 1]["end"] if first > 0 else 0.0
+        next_start = segments[last]["start"] if last < len(segments) else duration
+        start = max(previous_end, segments[first]["start"] - padding, 0.0)
+        end = min(next_start, segments[last - 1]["end"] + padding, duration)
+        spans.append((first, last, start, end))
+    return spans
+
+
+class TieredTranscriber:
+    """
+    Two-tier transcription: a small draft model decodes everything, then the segments it is unsure
+    of are re-decoded with a large model and spliced back in place.
+
+    Exposes the WhisperTranscriber interface (transcribe, transcribe_long, stream), so it can be used
+    by PipelineRunner directly. Results carry a 'refined' entry with the refined spans and seconds.
+    """
+
+    def __init__(self, draft: Any, refiner: Any, **thresholds: float) -> None:
+        """
+        Args:
+            draft (Any): WhisperTranscriber with the fast model.
+            refiner (Any): WhisperTranscriber with the accurate model.
+            **thresholds (float): Overrides of the is_uncertain thresholds.
+        """
+        self.draft = draft
+        self.refiner = refiner
+        # All thresholds, defaults included: they are part of the transcription cache key
+        self.thresholds = {
+            "logprob_threshold": LOGPROB_THRESHOLD,
+            "compression_ratio_threshold": COMPRESSION_RATIO_THRESHOLD,
+            "no_speech_threshold": NO_SPEECH_THRESHOLD,
+            "no_speech_logprob_threshold": NO_SPEECH_LOGPROB_THRESHOLD,
+            **thresholds,
+        }
+        self.model_name = f"{draft.model_name}+{refiner.model_name}"
+        self.device = draft.device
+        self.compute_type = draft.compute_type
+
+    def transcribe(
+        self, audio: AudioBuffer, language: str = "ru", cancel: Optional[threading.Event] = None
+    ) -> Dict[str, Any]:
+        """
+        Draft the whole audio, then refine uncertain spans.
+        Args:
+            audio (AudioBuffer): Decoded 16 kHz audio.
+            language (str): Audio language.
+            cancel (Optional[threading.Event]): Job cancel event, checked between spans.
+        Returns:
+            Dict[str, Any]: Transcription result with keys 'text', 'segments' and 'refined'.
+        """
+        return self.refine(audio, self.draft.transcribe(audio, language, cancel=cancel), language, cancel)
+
+    def transcribe_long(
+        self, audio: AudioBuffer, language: str = "ru", cancel: Optional[threading.Event] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        """Draft with WhisperTranscriber.transcribe_long (same keyword arguments), then refine uncertain spans."""
+        draft = self.draft.transcribe_long(audio, language, cancel=cancel, **kwargs)
+        return self.refine(audio, draft, language, cancel)
+
+    def stream(
+        self,
+        audio: AudioBuffer,
+        language: str = "ru",
+        regions: Optional[List[Tuple[float, float]]] = None,
+        max_chunk: float = 30.0,
+        cancel: Optional[threading.Event] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Draft chunk by chunk and yield every chunk's segments once its uncertain spans are refined.
+        Args:
+            audio (AudioBuffer): Decoded 16 kHz audio.
+            language (str): Audio language.
+            regions (Optional[List[Tuple[float, float]]]): Speech regions in seconds.
+            max_chunk (float): Maximum chunk length in seconds.
+            cancel (Optional[threading.Event]): Job cancel event, checked between chunks and spans.
+        Yields:
+            Dict[str, Any]: Segments in global time, in order.
+        """
+        count = 0
+        for start, end in self.draft._plan_chunks(audio, regions, max_chunk):
+            chunk = audio.slice(start, end)
+            draft = self.draft.transcribe(chunk, language, cancel=cancel)
+            result = stitch_results([(start, self.refine(chunk, draft, language, cancel))])
+            for seg in result["segments"]:
+                seg["id"] = count
+                count += 1
+                yield seg
+
+    def refine(
+        self,
+        audio: AudioBuffer,
+        draft: Dict[str, Any],
+        language: str = "ru",
+        cancel: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        """
+        Re-decode the uncertain spans of a draft with the refiner and splice them in.
+        Args:
+            audio (AudioBuffer): Audio the draft was decoded from.
+            draft (Dict[str, Any]): Draft transcription (segments in the time of audio).
+            language (str): Audio language.
+            cancel (Optional[threading.Event]): Job cancel event, checked between spans and passed to the refine model.
+        Returns:
+            Dict[str, Any]: Transcription with keys 'text', 'segments' and 'refined'.
+        """
+        start_time = time.perf_counter()
+        segments = draft["segments"]
+        spans = uncertain_spans(segments, audio.duration, **self.thresholds)
+        pieces: List[Dict[str, Any]] = []
+        position = 0
+        for first, last, start, end in spans:
+            pieces.extend(segments[position:first])
+            check_cancelled(cancel)
+            refined = self.refiner.transcribe(audio.slice(start, end), language, cancel=cancel)
+            pieces.extend(stitch_results([(start, refined)])["segments"])
+            position = last
+        pieces.extend(segments[position:])
+        merged = [dict(seg, id=i) for i, seg in enumerate(pieces)]
+        refined_seconds = sum(end - start for _, _, start, end in spans)
+        if spans:
+            logger.info(
+                f"Refined {len(spans)} uncertain span(s), {refined_seconds:.1f}s of {audio.duration:.1f}s "
+                f"with {self.refiner.model_name} in {time.perf_counter() - start_time:.1f}s"
+            )
+        return {
+            "text": "".join(seg["text"] for seg in merged),
+            "segments": merged,
+            "refined": {"spans": [[start, end] for _, _, start, end in spans], "seconds": refined_seconds},
+        }
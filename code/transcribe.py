@@ -1,9 +1,29 @@
+import atexit
+import multiprocessing
 import os
-from typing import Any, Dict
+import threading
+from code.audio_export import AudioBuffer
+from code.inference_profiles import compile_module
+from code.jobs import check_cancelled
+from code.vad import plan_chunks, speech_regions
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
+import torch
 import whisper
 from loguru import logger
 
+# Transcriber owned by a long-form worker process
+_worker_transcriber: Optional["WhisperTranscriber"] = None
+# Long-form worker pools, kept for the life of the process so each worker loads its model once
+_worker_pools: Dict[Tuple[str, str, bool, int], ProcessPoolExecutor] = {}
+_worker_pools_lock = threading.Lock()
+
+# Whisper decodes 30 s windows; timestamp tokens are 20 ms apart
+WINDOW_SECONDS = 30.0
+TIME_PRECISION = 0.02
+
 
 class WhisperTranscriber:
     """
@@ -12,14 +32,20 @@ class WhisperTranscriber:
     If the model is not found, it will be downloaded automatically.
     """
 
-    def __init__(self, model_name: str = "base", device: str = "cpu") -> None:
+    def __init__(
+        self, model_name: str = "base", device: str = "cpu", compute_type: Optional[str] = None, compile: bool = False
+    ) -> None:
         """
         Args:
             model_name (str): Whisper model name (e.g., "base", "small", "medium", "large").
             device (str): Device to run the model on ("cpu" or "cuda").
+            compute_type (Optional[str]): "float16", "float32" or "int8" (CPU only: dynamically quantized
+                linear layers) (default: float16 on CUDA, float32 on CPU).
+            compile (bool): Compile the audio encoder with torch.compile.
         """
         self.model_name = model_name
         self.device = device
+        self.compute_type = compute_type or ("float16" if device.startswith("cuda") else "float32")
         self.download_dir = os.path.join("models", "whisper")
         model_path = os.path.join(self.download_dir, model_name + ".pt")
 
@@ -28,18 +54,314 @@ class WhisperTranscriber:
             logger.info(f"Whisper model '{model_name}' not found in '{self.download_dir}', starting download...")
             os.makedirs(self.download_dir, exist_ok=True)
         self.model = whisper.load_model(model_name, download_root=self.download_dir, device=self.device)
+        if self.compute_type == "int8":
+            if self.device.startswith("cuda"):
+                raise ValueError("int8 compute type is only supported on CPU")
+            self.model = quantize_int8(self.model)
+        if compile:
+            self.model.encoder = compile_module(self.model.encoder)
+        self.compile = compile
+        # Whisper keeps decoding state on the model (kv-cache hooks), so one decode at a time per instance
+        self._lock = threading.Lock()
 
-    def transcribe(self, audio_path: str, language: str = "ru") -> Dict[str, Any]:
+    def transcribe(
+        self, audio_path: Union[str, AudioBuffer], language: str = "ru", cancel: Optional[threading.Event] = None
+    ) -> Dict[str, Any]:
         """
-        Transcribe an audio file.
+        Transcribe an audio file or an already decoded audio buffer.
         Args:
-            audio_path (str): Path to the audio file.
+            audio_path (Union[str, AudioBuffer]): Path to the audio file or decoded 16 kHz audio.
             language (str): Audio language (default: 'ru').
+            cancel (Optional[threading.Event]): Job cancel event, checked before decoding (Whisper decodes
+                the whole audio in one call; use stream or transcribe_long for finer cancellation).
         Returns:
             Dict[str, Any]: Transcription result with keys 'text' and 'segments'.
         """
-        audio = whisper.load_audio(audio_path)
-        result = self.model.transcribe(
-            audio, language=language, word_timestamps=True, verbose=False, fp16=(self.device == "cuda")
+        if isinstance(audio_path, AudioBuffer):
+            audio = audio_path.samples
+        else:
+            audio = whisper.load_audio(audio_path)
+        check_cancelled(cancel)
+        return self._decode(audio, language)
+
+    def transcribe_long(
+        self,
+        audio: AudioBuffer,
+        language: str = "ru",
+        regions: Optional[List[Tuple[float, float]]] = None,
+        workers: Optional[int] = None,
+        max_chunk: float = 30.0,
+        cancel: Optional[threading.Event] = None,
+        batch_size: int = 8,
+    ) -> Dict[str, Any]:
+        """
+        Transcribe a long recording by splitting it at pauses and decoding the chunks in parallel.
+        On CUDA the chunks are decoded in batches through the encoder and decoder of the loaded model
+        (see _decode_batch); on CPU they are spread over a persistent pool of worker processes, each
+        with its own model copy.
+        Args:
+            audio (AudioBuffer): Decoded 16 kHz audio.
+            language (str): Audio language (default: 'ru').
+            regions (Optional[List[Tuple[float, float]]]): Speech regions in seconds (e.g. from diarization);
+                detected with an energy VAD when not given.
+            workers (Optional[int]): Number of worker processes on CPU.
+            max_chunk (float): Maximum chunk length in seconds.
+            cancel (Optional[threading.Event]): Job cancel event, checked between chunks.
+            batch_size (int): Chunks decoded together on CUDA.
+        Returns:
+            Dict[str, Any]: Transcription result with keys 'text' and 'segments' in global time.
+        """
+        gpu = not self.device.startswith("cpu")
+        if gpu:
+            # A batched chunk must fit into one 30 s Whisper window including its padding
+            max_chunk = min(max_chunk, WINDOW_SECONDS - 0.5)
+        chunks = self._plan_chunks(audio, regions, max_chunk)
+        offsets = [start for start, _ in chunks]
+        pieces = [audio.slice(start, end).samples for start, end in chunks]
+        logger.info(f"Long-form transcription: {len(chunks)} chunks")
+
+        def decode(piece: np.ndarray) -> Dict[str, Any]:
+            check_cancelled(cancel)
+            return self._decode(piece, language)
+
+        workers = 1 if gpu else workers or max(1, (os.cpu_count() or 1) // 4)
+        if gpu and len(pieces) > 1:
+            batched: List[Optional[Dict[str, Any]]] = []
+            for first in range(0, len(pieces), batch_size):
+                check_cancelled(cancel)
+                batched.extend(self._decode_batch(pieces[first : first + batch_size], language))
+            # Chunks the greedy batch pass is unsure of get Whisper's temperature fallback one by one
+            results = [result if result is not None else decode(piece) for piece, result in zip(pieces, batched)]
+        elif workers == 1 or len(pieces) == 1:
+            results = [decode(piece) for piece in pieces]
+        else:
+            pool = self._worker_pool(workers)
+            futures = [pool.submit(_decode_in_worker, piece, language) for piece in pieces]
+            results = []
+            for future in futures:
+                if cancel is not None and cancel.is_set():
+                    # Drop the chunks not started yet; the running ones finish in the background
+                    for pending in futures:
+                        pending.cancel()
+                    check_cancelled(cancel)
+                results.append(future.result())
+        return stitch_results(list(zip(offsets, results)))
+
+    def stream(
+        self,
+        audio: AudioBuffer,
+        language: str = "ru",
+        regions: Optional[List[Tuple[float, float]]] = None,
+        max_chunk: float = 30.0,
+        cancel: Optional[threading.Event] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Transcribe chunk by chunk (split at pauses) and yield segments as soon as each chunk is decoded.
+        Args:
+            audio (AudioBuffer): Decoded 16 kHz audio.
+            language (str): Audio language (default: 'ru').
+            regions (Optional[List[Tuple[float, float]]]): Speech regions in seconds; detected with an
+                energy VAD when not given.
+            max_chunk (float): Maximum chunk length in seconds.
+            cancel (Optional[threading.Event]): Job cancel event, checked between chunks.
+        Yields:
+            Dict[str, Any]: Whisper segments in global time, in order.
+        """
+        count = 0
+        for start, end in self._plan_chunks(audio, regions, max_chunk):
+            check_cancelled(cancel)
+            result = stitch_results([(start, self._decode(audio.slice(start, end).samples, language))])
+            for seg in result["segments"]:
+                seg["id"] = count
+                count += 1
+                yield seg
+
+    def _plan_chunks(
+        self, audio: AudioBuffer, regions: Optional[List[Tuple[float, float]]], max_chunk: float
+    ) -> List[Tuple[float, float]]:
+        if regions is None:
+            regions = speech_regions(audio.samples, audio.sample_rate, energy=audio.envelope) or [(0.0, audio.duration)]
+        return plan_chunks(regions, audio.duration, max_chunk=max_chunk)
+
+    def _worker_pool(self, workers: int) -> ProcessPoolExecutor:
+        # One pool per model configuration, created on first use and reused by all following jobs
+        key = (self.model_name, self.compute_type, self.compile, workers)
+        with _worker_pools_lock:
+            if key not in _worker_pools:
+                threads = max(1, (os.cpu_count() or 1) // workers)
+                logger.info(f"Starting {workers} long-form worker processes for Whisper {self.model_name}")
+                _worker_pools[key] = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.compute_type, self.compile, threads),
+                )
+            return _worker_pools[key]
+
+    def _decode_batch(self, pieces: List[np.ndarray], language: str) -> List[Optional[Dict[str, Any]]]:
+        """
+        Decode chunks of at most 30 s in one batch: a single encoder pass and batched greedy decoding.
+        Segments and word timestamps are derived as in whisper.transcribe. A chunk whose decoding
+        would trigger Whisper's temperature fallback (repetitive or low-probability text) returns None
+        so it can be decoded on its own; a silent chunk returns an empty result.
+        """
+        from whisper.audio import HOP_LENGTH, N_FRAMES, SAMPLE_RATE
+        from whisper.timing import add_word_timestamps
+        from whisper.tokenizer import get_tokenizer
+
+        fp16 = self.compute_type == "float16"
+        tokenizer = get_tokenizer(
+            self.model.is_multilingual, num_languages=self.model.num_languages, language=language, task="transcribe"
         )
+        with self._lock, torch.inference_mode():
+            mel = torch.stack(
+                [
+                    whisper.log_mel_spectrogram(
+                        whisper.pad_or_trim(torch.from_numpy(piece)), self.model.dims.n_mels, device=self.model.device
+                    )
+                    for piece in pieces
+                ]
+            )
+            options = whisper.DecodingOptions(task="transcribe", language=language, temperature=0.0, fp16=fp16)
+            decoded = whisper.decode(self.model, mel, options)
+            results: List[Optional[Dict[str, Any]]] = []
+            for piece, chunk_mel, result in zip(pieces, mel, decoded):
+                if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0:
+                    results.append({"text": "", "segments": []})
+                    continue
+                if result.compression_ratio > 2.4 or result.avg_logprob < -1.0:
+                    results.append(None)
+                    continue
+                segments = _token_segments(result, tokenizer, len(piece) / SAMPLE_RATE)
+                add_word_timestamps(
+                    segments=segments,
+                    model=self.model,
+                    tokenizer=tokenizer,
+                    mel=chunk_mel,
+                    num_frames=min(N_FRAMES, len(piece) // HOP_LENGTH),
+                    prepend_punctuations="\"'“¿([{-",
+                    append_punctuations="\"'.。,，!！?？:：”)]}、",
+                    last_speech_timestamp=0.0,
+                )
+                results.append({"text": "".join(seg["text"] for seg in segments), "segments": segments})
+        return results
+
+    def _decode(self, audio: np.ndarray, language: str) -> Dict[str, Any]:
+        with self._lock, torch.inference_mode():
+            result = self.model.transcribe(
+                audio, language=language, word_timestamps=True, verbose=False, fp16=(self.compute_type == "float16")
+            )
         return {"text": result["text"], "segments": result["segments"]}
+
+
+def _token_segments(result: Any, tokenizer: Any, duration: float) -> List[Dict[str, Any]]:
+    """
+    Split the tokens of one decoded 30 s window into segments at timestamp token pairs, as
+    whisper.transcribe does; text after the last pair runs to the end of the window.
+    Args:
+        result (Any): whisper.DecodingResult of the window.
+        tokenizer (Any): Whisper tokenizer used for decoding.
+        duration (float): Audio length of the window in seconds.
+    Returns:
+        List[Dict[str, Any]]: Segments with keys 'id', 'seek', 'start', 'end', 'text', 'tokens' and the
+            decoding statistics, in window time.
+    """
+    tokens = list(result.tokens)
+    begin = tokenizer.timestamp_begin
+    is_timestamp = [token >= begin for token in tokens]
+    slices = [i + 1 for i in range(len(tokens) - 1) if is_timestamp[i] and is_timestamp[i + 1]]
+    spans: List[Tuple[float, float, List[int]]] = []
+    if slices:
+        last = 0
+        for current in slices:
+            sliced = tokens[last:current]
+            spans.append(((sliced[0] - begin) * TIME_PRECISION, (sliced[-1] - begin) * TIME_PRECISION, sliced))
+            last = current
+        if last < len(tokens):
+            rest = tokens[last:]
+            end = (rest[-1] - begin) * TIME_PRECISION if is_timestamp[-1] else duration
+            start = (rest[0] - begin) * TIME_PRECISION if rest[0] >= begin else spans[-1][1]
+            spans.append((start, end, rest))
+    elif tokens:
+        stamps = [token for token in tokens if token >= begin]
+        end = (stamps[-1] - begin) * TIME_PRECISION if stamps and stamps[-1] != begin else duration
+        spans.append((0.0, end, tokens))
+
+    segments: List[Dict[str, Any]] = []
+    for start, end, sliced in spans:
+        text = tokenizer.decode([token for token in sliced if token < begin])
+        if not text.strip():
+            continue
+        segments.append(
+            {
+                "id": len(segments),
+                "seek": 0,
+                "start": start,
+                "end": max(start, min(end, duration)),
+                "text": text,
+                "tokens": sliced,
+                "temperature": result.temperature,
+                "avg_logprob": result.avg_logprob,
+                "compression_ratio": result.compression_ratio,
+                "no_speech_prob": result.no_speech_prob,
+            }
+        )
+    return segments
+
+
+def stitch_results(pieces: List[Tuple[float, Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Join chunk transcriptions into one result, shifting timestamps to global time.
+    Args:
+        pieces (List[Tuple[float, Dict[str, Any]]]): (offset in seconds, chunk transcription) pairs in time order.
+    Returns:
+        Dict[str, Any]: Transcription result with keys 'text' and 'segments'.
+    """
+    segments: List[Dict[str, Any]] = []
+    texts: List[str] = []
+    for offset, result in pieces:
+        texts.append(result["text"])
+        for seg in result["segments"]:
+            seg = dict(seg, id=len(segments), start=seg["start"] + offset, end=seg["end"] + offset)
+            # Whisper seek positions are in mel frames (100 per second)
+            seg["seek"] = seg.get("seek", 0) + round(offset * 100)
+            if "words" in seg:
+                seg["words"] = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in seg["words"]]
+            segments.append(seg)
+    return {"text": "".join(texts), "segments": segments}
+
+
+def quantize_int8(model: Any) -> Any:
+    """
+    Quantize the linear layers of a Whisper model to int8 with dynamic (per-batch) activation scales.
+    Args:
+        model (Any): Whisper model on CPU.
+    Returns:
+        Any: Quantized model.
+    """
+    # Whisper's Linear only adds a dtype cast to nn.Linear; quantize_dynamic matches exact types
+    for module in model.modules():
+        if isinstance(module, whisper.model.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _init_worker(model_name: str, compute_type: str, compile: bool, threads: int) -> None:
+    global _worker_transcriber
+    torch.set_num_threads(threads)
+    _worker_transcriber = WhisperTranscriber(
+        model_name=model_name, device="cpu", compute_type=compute_type, compile=compile
+    )
+
+
+def _decode_in_worker(audio: np.ndarray, language: str) -> Dict[str, Any]:
+    assert _worker_transcriber is not None
+    return _worker_transcriber._decode(audio, language)
+
+
+@atexit.register
+def _shutdown_worker_pools() -> None:
+    with _worker_pools_lock:
+        for pool in _worker_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _worker_pools.clear()
@@ -0,0 +1,320 @@
+import builtins
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+UNKNOWN_SPEAKER = "Unknown"
+
+
+def assign_turns(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    turn_starts: np.ndarray,
+    turn_ends: np.ndarray,
+    max_gap: float = 1.0,
+) -> np.ndarray:
+    """
+    Vectorized assignment of many short intervals (e.g. words) to diarization turns.
+    For every interval the candidates are the last turn starting before its end, the turn before it
+    and the turn reaching furthest to the right among all earlier turns; the candidate with the
+    largest overlap wins. Intervals falling into a pause take the nearest turn within max_gap.
+    Args:
+        starts (np.ndarray): Interval start times.
+        ends (np.ndarray): Interval end times.
+        turn_starts (np.ndarray): Turn start times, sorted ascending.
+        turn_ends (np.ndarray): Turn end times (same order as turn_starts).
+        max_gap (float): Maximum distance in seconds to a turn for intervals that overlap none.
+    Returns:
+        np.ndarray: Index of the assigned turn per interval, -1 if none.
+    """
+    num_turns = len(turn_starts)
+    if num_turns == 0 or len(starts) == 0:
+        return np.full(len(starts), -1, dtype=np.int64)
+    positions = np.arange(num_turns)
+    # cover[i]: index of the turn with the latest end among turns[0..i]
+    cover = np.maximum.accumulate(np.where(turn_ends == np.maximum.accumulate(turn_ends), positions, 0))
+    last = np.searchsorted(turn_starts, ends, side="right") - 1
+    clipped = np.maximum(last, 0)
+    candidates = np.stack([clipped, np.maximum(clipped - 1, 0), cover[clipped]], axis=1)
+    overlap = np.minimum(ends[:, None], turn_ends[candidates]) - np.maximum(starts[:, None], turn_starts[candidates])
+    overlap[last < 0] = -np.inf
+    best = np.argmax(overlap, axis=1)
+    rows = np.arange(len(starts))
+    assigned = np.where(overlap[rows, best] >= 0, candidates[rows, best], -1)
+
+    # Intervals in pauses between turns: nearest of the previous turn and the next one
+    missing = assigned < 0
+    if missing.any():
+        previous = candidates[rows, 2]
+        following = np.minimum(last + 1, num_turns - 1)
+        gap_before = np.where(last >= 0, starts - turn_ends[previous], np.inf)
+        gap_after = np.where(last + 1 < num_turns, turn_starts[following] - ends, np.inf)
+        nearest = np.where(gap_before <= gap_after, previous, following)
+        close = np.minimum(gap_before, gap_after) <= max_gap
+        assigned = np.where(missing & close, nearest, assigned)
+    return assigned
+
+
+def speaker_turns(diarized_text: Any) -> List[Tuple[float, float, Any]]:
+    """
+    Collect (start, end, speaker) turns from a diarization result.
+    Args:
+        diarized_text (Any): Diarization result (pyannote.core.Annotation).
+    Returns:
+        List[Tuple[float, float, Any]]: Speaker turns.
+    """
+    turns: List[Tuple[float, float, Any]] = []
+    for segment, _, speaker in diarized_text.itertracks(yield_label=True):
+        turns.append((segment.start, segment.end, speaker))
+    return turns
+
+
+class Transcript:
+    """
+    Columnar transcript: one row per word in NumPy arrays plus a shared text buffer.
+
+    Words are stored as start/end times, the segment they came from, a speaker id and character
+    offsets into one string holding all word texts, so a long recording is a handful of arrays
+    instead of hundreds of thousands of dicts. Slices share the arrays and the text buffer.
+    Segments without word timestamps are stored as a single word.
+
+    Attributes:
+        text (str): Concatenated word texts (with Whisper's leading spaces).
+        offsets (np.ndarray): Start offset of every word in text, plus the end of the last word (n + 1).
+        starts (np.ndarray): Word start times in seconds.
+        ends (np.ndarray): Word end times in seconds.
+        segment_ids (np.ndarray): Index of the source segment per word.
+        speaker_ids (np.ndarray): Index into speakers per word, -1 when unknown.
+        speakers (List[Any]): Speaker labels.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        offsets: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        segment_ids: np.ndarray,
+        speaker_ids: Optional[np.ndarray] = None,
+        speakers: Optional[List[Any]] = None,
+    ) -> None:
+        self.text = text
+        self.offsets = offsets
+        self.starts = starts
+        self.ends = ends
+        self.segment_ids = segment_ids
+        self.speaker_ids = speaker_ids if speaker_ids is not None else np.full(len(starts), -1, dtype=np.int32)
+        self.speakers = speakers or []
+
+    @classmethod
+    def from_segments(cls, segments: List[Dict[str, Any]]) -> "Transcript":
+        """
+        Build a transcript from Whisper segments.
+        Args:
+            segments (List[Dict[str, Any]]): Whisper segments (with or without word timestamps).
+        Returns:
+            Transcript: Columnar transcript without speakers.
+        """
+        words: List[str] = []
+        starts: List[float] = []
+        ends: List[float] = []
+        segment_ids: List[int] = []
+        for index, seg in enumerate(segments):
+            fallback = {"word": " " + seg["text"].strip(), "start": seg["start"], "end": seg["end"]}
+            for word in seg.get("words") or [fallback]:
+                words.append(word["word"])
+                starts.append(word["start"])
+                ends.append(word["end"])
+                segment_ids.append(index)
+        offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in words], out=offsets[1:])
+        return cls(
+            "".join(words),
+            offsets,
+            np.asarray(starts, dtype=np.float64),
+            np.asarray(ends, dtype=np.float64),
+            np.asarray(segment_ids, dtype=np.int32),
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def word(self, index: int) -> str:
+        """Return the text of one word."""
+        return self.text[self.offsets[index] : self.offsets[index + 1]]
+
+    def span_text(self, first: int, last: int) -> str:
+        """Return the text of words [first, last) as one stripped string."""
+        if first >= last:
+            return ""
+        return self.text[self.offsets[first] : self.offsets[last]].strip()
+
+    def slice(self, start: float, end: float) -> "Transcript":
+        """
+        Words whose start time lies in [start, end), without copying (words must be sorted by start).
+        Args:
+            start (float): Range start in seconds.
+            end (float): Range end in seconds.
+        Returns:
+            Transcript: View of the words in the range (times are not re-based).
+        """
+        first, last = np.searchsorted(self.starts, [start, end], side="left")
+        return self._take(slice(first, last))
+
+    def filter(self, mask: np.ndarray) -> "Transcript":
+        """
+        Select words with a boolean mask (e.g. transcript.speaker_ids == 0).
+        Args:
+            mask (np.ndarray): Boolean mask over words.
+        Returns:
+            Transcript: Selected words with their own text buffer.
+        """
+        indices = np.flatnonzero(mask)
+        bounds = zip(self.offsets[indices].tolist(), self.offsets[indices + 1].tolist())
+        words = [self.text[first:last] for first, last in bounds]
+        offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in words], out=offsets[1:])
+        return Transcript(
+            "".join(words),
+            offsets,
+            self.starts[indices],
+            self.ends[indices],
+            self.segment_ids[indices],
+            self.speaker_ids[indices],
+            self.speakers,
+        )
+
+    def with_speakers(self, diarization: Any) -> "Transcript":
+        """
+        Attribute every word to a diarization turn (vectorized, see assign_turns).
+        Args:
+            diarization (Any): Diarization result (pyannote.core.Annotation).
+        Returns:
+            Transcript: Transcript sharing the word arrays, with speaker ids set.
+        """
+        turns = sorted(speaker_turns(diarization), key=lambda turn: (turn[0], turn[1]))
+        labels = [turn[2] for turn in turns]
+        assigned = assign_turns(
+            self.starts,
+            self.ends,
+            np.asarray([turn[0] for turn in turns], dtype=np.float64),
+            np.asarray([turn[1] for turn in turns], dtype=np.float64),
+        )
+        speakers = list(dict.fromkeys(labels))
+        label_ids = {label: i for i, label in enumerate(speakers)}
+        # Unassigned words (turn index -1) pick the trailing -1 entry
+        turn_speaker = np.asarray([label_ids[label] for label in labels] + [-1], dtype=np.int32)
+        return Transcript(
+            self.text, self.offsets, self.starts, self.ends, self.segment_ids, turn_speaker[assigned], speakers
+        )
+
+    def speaker_bounds(self) -> np.ndarray:
+        """Word indices where the speaker changes, including 0 and len(self)."""
+        changes = np.flatnonzero(self.speaker_ids[1:] != self.speaker_ids[:-1]) + 1
+        return np.concatenate([[0], changes, [len(self)]]).astype(np.int64)
+
+    def speaker_name(self, speaker_id: int) -> Any:
+        """Return the label of a speaker id (UNKNOWN_SPEAKER for -1)."""
+        return self.speakers[speaker_id] if speaker_id >= 0 else UNKNOWN_SPEAKER
+
+    def iter_merged(self) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yield consecutive words of the same speaker as one block.
+        Yields:
+            Dict[str, Any]: Keys 'start', 'end', 'speaker' and 'text'.
+        """
+        if len(self) == 0:
+            return
+        bounds = self.speaker_bounds()
+        for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            yield {
+                "start": float(self.starts[first]),
+                "end": float(self.ends[last - 1]),
+                "speaker": self.speaker_name(int(self.speaker_ids[first])),
+                "text": self.span_text(first, last),
+            }
+
+    def iter_segments(self) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yield the words grouped by source segment.
+        Yields:
+            Dict[str, Any]: Keys 'start', 'end' and 'text'.
+        """
+        if len(self) == 0:
+            return
+        changes = np.flatnonzero(self.segment_ids[1:] != self.segment_ids[:-1]) + 1
+        bounds = np.concatenate([[0], changes, [len(self)]]).tolist()
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            yield {
+                "start": float(self.starts[first]),
+                "end": float(self.ends[last - 1]),
+                "text": self.span_text(first, last),
+            }
+
+    def save(self, path: str) -> str:
+        """
+        Write the transcript to an uncompressed .npz file.
+        Args:
+            path (str): Output path.
+        Returns:
+            str: Output path.
+        """
+        compact = self._compact()
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                text=np.frombuffer(compact.text.encode("utf-8"), dtype=np.uint8),
+                offsets=compact.offsets,
+                starts=compact.starts,
+                ends=compact.ends,
+                segment_ids=compact.segment_ids,
+                speaker_ids=compact.speaker_ids,
+                speakers=np.asarray([str(speaker) for speaker in compact.speakers], dtype=np.str_),
+            )
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "Transcript":
+        """
+        Read a transcript written by save().
+        Args:
+            path (str): Path to the .npz file.
+        Returns:
+            Transcript: Loaded transcript.
+        """
+        with np.load(path) as data:
+            return cls(
+                data["text"].tobytes().decode("utf-8"),
+                data["offsets"],
+                data["starts"],
+                data["ends"],
+                data["segment_ids"],
+                data["speaker_ids"],
+                data["speakers"].tolist(),
+            )
+
+    def _take(self, index: builtins.slice) -> "Transcript":
+        return Transcript(
+            self.text,
+            self.offsets[index.start : index.stop + 1],
+            self.starts[index],
+            self.ends[index],
+            self.segment_ids[index],
+            self.speaker_ids[index],
+            self.speakers,
+        )
+
+    def _compact(self) -> "Transcript":
+        # Slices share the parent's buffer; cut it down to the slice's own text before saving
+        first, last = int(self.offsets[0]), int(self.offsets[-1])
+        if first == 0 and last == len(self.text):
+            return self
+        return Transcript(
+            self.text[first:last],
+            self.offsets - first,
+            self.starts,
+            self.ends,
+            self.segment_ids,
+            self.speaker_ids,
+            self.speakers,
+        )
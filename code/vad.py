@@ -0,0 +1,114 @@
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+FRAME_SECONDS = 0.03
+
+
+def frame_energy(samples: np.ndarray, sample_rate: int, frame_seconds: float = FRAME_SECONDS) -> np.ndarray:
+    """
+    Compute the RMS energy of consecutive frames in dB.
+    Args:
+        samples (np.ndarray): Mono float samples.
+        sample_rate (int): Sample rate in Hz.
+        frame_seconds (float): Frame length in seconds.
+    Returns:
+        np.ndarray: Energy per frame in dB (full scale).
+    """
+    frame = max(1, int(sample_rate * frame_seconds))
+    num_frames = len(samples) // frame
+    if num_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = np.asarray(samples[: num_frames * frame], dtype=np.float32).reshape(num_frames, frame)
+    rms = np.sqrt(np.mean(np.square(frames), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_regions(
+    samples: np.ndarray,
+    sample_rate: int,
+    threshold_db: float = 12.0,
+    min_silence: float = 0.5,
+    min_speech: float = 0.2,
+    frame_seconds: float = FRAME_SECONDS,
+    energy: Optional[np.ndarray] = None,
+) -> List[Tuple[float, float]]:
+    """
+    Detect speech regions with a simple energy VAD.
+    A frame is speech when it is threshold_db louder than the noise floor (5th percentile of frame energy).
+    The threshold never exceeds the midpoint between the floor and the loud (95th percentile) level,
+    so recordings with almost no pauses are still detected as speech.
+    Args:
+        samples (np.ndarray): Mono float samples.
+        sample_rate (int): Sample rate in Hz.
+        threshold_db (float): Margin above the noise floor in dB.
+        min_silence (float): Pauses shorter than this (seconds) do not split regions.
+        min_speech (float): Regions shorter than this (seconds) are dropped.
+        frame_seconds (float): Frame length in seconds.
+        energy (Optional[np.ndarray]): Frame energy computed before (e.g. at ingest) with the same frame length.
+    Returns:
+        List[Tuple[float, float]]: (start, end) speech regions in seconds.
+    """
+    if energy is None:
+        energy = frame_energy(samples, sample_rate, frame_seconds)
+    if len(energy) == 0:
+        return []
+    floor, loud = np.percentile(energy, [5, 95])
+    active = energy > min(floor + threshold_db, (floor + loud) / 2)
+    # Rising and falling edges of the active mask
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], active.astype(np.int8), [0]])))
+    regions: List[Tuple[float, float]] = []
+    for first, last in zip(edges[::2], edges[1::2]):
+        start, end = float(first * frame_seconds), float(last * frame_seconds)
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return [(start, end) for start, end in regions if end - start >= min_speech]
+
+
+def regions_from_annotation(annotation: Any) -> List[Tuple[float, float]]:
+    """
+    Get speech regions from a diarization result.
+    Args:
+        annotation (Any): Diarization result (pyannote.core.Annotation).
+    Returns:
+        List[Tuple[float, float]]: (start, end) speech regions in seconds.
+    """
+    return [(segment.start, segment.end) for segment in annotation.get_timeline().support()]
+
+
+def plan_chunks(
+    regions: List[Tuple[float, float]], duration: float, max_chunk: float = 30.0, padding: float = 0.2
+) -> List[Tuple[float, float]]:
+    """
+    Group speech regions into chunks of at most max_chunk seconds, cutting only in pauses.
+    Regions longer than max_chunk are split at fixed positions.
+    Args:
+        regions (List[Tuple[float, float]]): Sorted speech regions in seconds.
+        duration (float): Total audio duration in seconds.
+        max_chunk (float): Maximum chunk length in seconds.
+        padding (float): Silence kept around every chunk in seconds (never more than half the pause,
+            so neighbouring chunks do not overlap).
+    Returns:
+        List[Tuple[float, float]]: (start, end) chunks in seconds.
+    """
+    pieces: List[Tuple[float, float]] = []
+    for start, end in regions:
+        while end - start > max_chunk:
+            pieces.append((start, start + max_chunk))
+            start += max_chunk
+        pieces.append((start, end))
+
+    chunks: List[Tuple[float, float]] = []
+    for start, end in pieces:
+        if chunks and end - chunks[-1][0] <= max_chunk:
+            chunks[-1] = (chunks[-1][0], end)
+        else:
+            chunks.append((start, end))
+    padded: List[Tuple[float, float]] = []
+    for i, (start, end) in enumerate(chunks):
+        before = (start - chunks[i - 1][1]) / 2 if i > 0 else start
+        after = (chunks[i + 1][0] - end) / 2 if i + 1 < len(chunks) else duration - end
+        padded.append((start - min(padding, max(before, 0.0)), end + min(padding, max(after, 0.0))))
+    return padded
@@ -0,0 +1,271 @@
+import json
+import os
+import struct
+import time
+import uuid
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+# Record header of the binary format: start, end, speaker length, text length (little endian)
+RECORD = struct.Struct("<ddHI")
+BINARY_MAGIC = b"IPTR\x01"
+
+
+def format_timestamp(seconds: float, separator: str = ",") -> str:
+    """
+    Format seconds as an SRT/VTT timestamp (HH:MM:SS,mmm).
+    Args:
+        seconds (float): Time in seconds.
+        separator (str): Separator before the milliseconds ("," for SRT, "." for VTT).
+    Returns:
+        str: Formatted timestamp.
+    """
+    millis = int(round(max(0.0, seconds) * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+class TranscriptWriter:
+    """
+    Base class for writers streaming merged speaker blocks to a file.
+
+    Blocks are written to "<path>.partial" one by one without being collected in memory; close()
+    moves the file to the final path atomically, abort() removes it, so readers never see a
+    half-written transcript.
+    """
+
+    extension = ""
+    binary = False
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Final output path.
+        """
+        self.path = path
+        self.partial_path = path + ".partial"
+        self.count = 0
+        self._file: Optional[IO[Any]] = None
+
+    @property
+    def file(self) -> IO[Any]:
+        """Open partial file (raises if open() has not been called)."""
+        if self._file is None:
+            raise RuntimeError(f"{type(self).__name__} for {self.path} is not open")
+        return self._file
+
+    def open(self) -> "TranscriptWriter":
+        """Create the partial file and write the header."""
+        self.count = 0
+        if self.binary:
+            self._file = open(self.partial_path, "wb")
+        else:
+            self._file = open(self.partial_path, "w", encoding="utf-8")
+        self.write_header()
+        return self
+
+    def write(self, block: Dict[str, Any]) -> None:
+        """
+        Append one merged block (keys 'start', 'end', 'speaker', 'text').
+        Args:
+            block (Dict[str, Any]): Merged block.
+        """
+        self.count += 1
+        self.write_block(block)
+
+    def close(self) -> str:
+        """
+        Finish the file and move it to its final path.
+        Returns:
+            str: Final output path.
+        """
+        self.file.close()
+        self._file = None
+        os.replace(self.partial_path, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        """Close and remove the partial file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.partial_path)
+        except FileNotFoundError:
+            pass
+
+    def write_header(self) -> None:
+        pass
+
+    def write_block(self, block: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class TextWriter(TranscriptWriter):
+    """Plain text: "[start - end] Speaker X: text" per block."""
+
+    extension = ".txt"
+
+    def write_block(self, block: Dict[str, Any]) -> None:
+        self.file.write(f"[{block['start']:.2f} - {block['end']:.2f}] Speaker {block['speaker']}: {block['text']}\n")
+
+
+class JsonlWriter(TranscriptWriter):
+    """One JSON object per block."""
+
+    extension = ".jsonl"
+
+    def write_block(self, block: Dict[str, Any]) -> None:
+        record = {"start": block["start"], "end": block["end"], "speaker": str(block["speaker"]), "text": block["text"]}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class SrtWriter(TranscriptWriter):
+    """SubRip subtitles with the speaker as a prefix."""
+
+    extension = ".srt"
+
+    def write_block(self, block: Dict[str, Any]) -> None:
+        start, end = format_timestamp(block["start"]), format_timestamp(block["end"])
+        self.file.write(f"{self.count}\n{start} --> {end}\n{block['speaker']}: {block['text']}\n\n")
+
+
+class VttWriter(TranscriptWriter):
+    """WebVTT subtitles with voice tags for the speakers."""
+
+    extension = ".vtt"
+
+    def write_header(self) -> None:
+        self.file.write("WEBVTT\n\n")
+
+    def write_block(self, block: Dict[str, Any]) -> None:
+        start, end = format_timestamp(block["start"], "."), format_timestamp(block["end"], ".")
+        self.file.write(f"{start} --> {end}\n<v {block['speaker']}>{block['text']}\n\n")
+
+
+class BinaryWriter(TranscriptWriter):
+    """Compact length-prefixed records (see read_binary)."""
+
+    extension = ".bin"
+    binary = True
+
+    def write_header(self) -> None:
+        self.file.write(BINARY_MAGIC)
+
+    def write_block(self, block: Dict[str, Any]) -> None:
+        speaker = str(block["speaker"]).encode("utf-8")
+        text = block["text"].encode("utf-8")
+        self.file.write(RECORD.pack(block["start"], block["end"], len(speaker), len(text)) + speaker + text)
+
+
+WRITERS = {
+    "txt": TextWriter,
+    "jsonl": JsonlWriter,
+    "srt": SrtWriter,
+    "vtt": VttWriter,
+    "bin": BinaryWriter,
+}
+
+
+class MultiWriter:
+    """
+    Fan merged blocks out to several writers; a context manager that commits all files on success
+    and removes the partial files on error.
+    """
+
+    def __init__(self, writers: Sequence[TranscriptWriter]) -> None:
+        self.writers = list(writers)
+
+    def __enter__(self) -> "MultiWriter":
+        opened: List[TranscriptWriter] = []
+        try:
+            for writer in self.writers:
+                opened.append(writer.open())
+        except BaseException:
+            for writer in opened:
+                writer.abort()
+            raise
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if exc_type is not None:
+            for writer in self.writers:
+                writer.abort()
+            return
+        for writer in self.writers:
+            writer.close()
+
+    def write(self, block: Dict[str, Any]) -> None:
+        for writer in self.writers:
+            writer.write(block)
+
+    def write_all(self, blocks: Iterable[Dict[str, Any]]) -> int:
+        """
+        Write blocks from an iterator without materializing them.
+        Args:
+            blocks (Iterable[Dict[str, Any]]): Merged blocks.
+        Returns:
+            int: Number of blocks written.
+        """
+        count = 0
+        for block in blocks:
+            self.write(block)
+            count += 1
+        return count
+
+    @property
+    def paths(self) -> List[str]:
+        return [writer.path for writer in self.writers]
+
+
+def create_writers(output_dir: str, stem: str, formats: Sequence[str]) -> List[TranscriptWriter]:
+    """
+    Create one writer per format, named <stem><extension> in the output directory.
+    Args:
+        output_dir (str): Output directory.
+        stem (str): File name without extension.
+        formats (Sequence[str]): Format names (keys of WRITERS).
+    Returns:
+        List[TranscriptWriter]: Writers (not opened yet).
+    """
+    unknown = [name for name in formats if name not in WRITERS]
+    if unknown:
+        raise ValueError(f"Unknown transcript format(s) {', '.join(unknown)}, expected {', '.join(WRITERS)}")
+    return [WRITERS[name](os.path.join(output_dir, stem + WRITERS[name].extension)) for name in dict.fromkeys(formats)]
+
+
+def job_output_dir(root: str, name: Optional[str] = None) -> str:
+    """
+    Create a fresh output directory for one job, so concurrent runs never overwrite each other.
+    Args:
+        root (str): Parent directory.
+        name (Optional[str]): Prefix (e.g. the input file name).
+    Returns:
+        str: Path to the new directory "<root>/<name>-<YYYYmmdd-HHMMSS>-<id>".
+    """
+    prefix = f"{name}-" if name else ""
+    path = os.path.join(root, f"{prefix}{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(path)
+    return path
+
+
+def read_binary(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read the blocks of a file written by BinaryWriter.
+    Args:
+        path (str): Path to the .bin file.
+    Yields:
+        Dict[str, Any]: Blocks with keys 'start', 'end', 'speaker' and 'text'.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary transcript")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            start, end, speaker_size, text_size = RECORD.unpack(header)
+            speaker = f.read(speaker_size).decode("utf-8")
+            text = f.read(text_size).decode("utf-8")
+            yield {"start": start, "end": end, "speaker": speaker, "text": text}
@@ -13,7 +13,7 @@ END="all"
 SPEAKERS=1
 
 if [ "$START" = "all" ] || [ "$END" = "all" ]; then
-  python3 code/main.py --video "$VIDEO" --speakers "$SPEAKERS"
+  python3 -m code.main --video "$VIDEO" --speakers "$SPEAKERS"
 else
-  python3 code/main.py --video "$VIDEO" --interval "$START" "$END" --speakers "$SPEAKERS"
+  python3 -m code.main --video "$VIDEO" --interval "$START" "$END" --speakers "$SPEAKERS"
 fi